@@ -1,9 +1,14 @@
-from fastapi import Depends, HTTPException, status
+import hmac
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Dict
+from typing import Dict, Optional
 from app.services.token_manager import token_manager
+from app.services.token_cache import token_cache
+from app.services.revocation import revocation_list
+from app.config import settings
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials=Depends(security)
@@ -13,12 +18,41 @@ def get_current_user(
     """
 
     token = credentials.credentials
-    paylod = token_manager.verify_token(token, "access")
-    if not paylod:
+
+    #tokens are reused many times, skip the signature check when already verified
+    paylod = token_cache.get(token)
+    if paylod is None:
+        paylod = token_manager.verify_token(token, "access")
+        if paylod:
+            token_cache.put(token, paylod)
+
+    if not paylod or revocation_list.is_revoked(paylod):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="nvalid or expired token",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    return paylod
\ No newline at end of file
+    return paylod
+
+def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials]=Depends(optional_security)
+)->Optional[Dict]:
+    """
+    authenticated user when a valid bearer token is sent, None otherwise
+    """
+    if credentials is None:
+        return None
+    try:
+        return get_current_user(credentials)
+    except HTTPException:
+        return None
+
+def require_admin(x_admin_token: Optional[str]=Header(None)):
+    """
+    admin endpoints take the shared ADMIN_API_TOKEN, they 404 while it is unset
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
@@ -0,0 +1,76 @@
+import io
+import tempfile
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from app.api.dependencies import require_admin
+from app.async_database import get_async_db_connection, async_db
+from app.config import settings
+from app.services.audit_log import audit_log
+from app.services.user_cache import user_cache
+from app.services.bulk_users import BulkUserImporter, read_rows, export_users
+from app.services.hashing_pool import HashingPool
+from app.api.routes.auth import password_manager
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+#one process pool shared by every import, only its executor is used, which is
+#created on the first import so each pre-forked worker gets its own
+import_pool = HashingPool(workers=settings.BULK_IMPORT_HASH_WORKERS, queue_size=0, mode="process")
+
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    format: str = Query("jsonl", pattern="^(csv|jsonl)$"),
+    max_errors: int = Query(1000, ge=0, le=100000)
+):
+    #spool the upload (to disk past 8MB) so a large file never sits in memory
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    try:
+        async with get_async_db_connection() as conn:
+            importer = BulkUserImporter(
+                conn, password_manager, import_pool.executor, import_pool.workers,
+                batch_size=settings.BULK_IMPORT_BATCH_SIZE, max_errors=max_errors
+            )
+            lines = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            await importer.run(read_rows(lines, format))
+
+            #new users may have cached "not found" entries on any worker
+            if importer.report["imported"]:
+                user_cache.invalidate("missing")
+                await user_cache.broadcast(conn, "missing")
+    finally:
+        spool.close()
+
+    report = importer.report
+    await audit_log.record(
+        "bulk_import", "success",
+        metadata={"rows": report["rows"], "imported": report["imported"], "failed": report["failed"]}
+    )
+    return report
+
+
+@router.get("/users/export")
+async def export_users_stream(
+    format: str = Query("jsonl", pattern="^(csv|jsonl)$"),
+    include_hashes: bool = False
+):
+    async def body():
+        #the connection is held for as long as the response streams
+        conn = await async_db.checkout()
+        try:
+            async for chunk in export_users(conn, format, include_hashes):
+                yield chunk
+        finally:
+            await async_db.release(conn)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{format}"}
+    )
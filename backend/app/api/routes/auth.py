@@ -1,19 +1,24 @@
-from fastapi import APIRouter, HTTPException, status, Request, Depends
-from typing import Dict
+from fastapi import APIRouter, HTTPException, status, Request, Depends, Query
+from typing import Dict, Optional
+from datetime import datetime
 from app.models.schemas import (
     RegisterRequest,
     LoginRequest,
     RefreshTokenRequest,
     TokenResponse,
     MessageResponse,
-    UserResponse
+    UserResponse,
+    AuditLogPage
 )
-from app.api.dependencies import get_current_user
+from app.api.dependencies import get_current_user, get_optional_user
 from app.database import get_db_connection
+from app.async_database import get_async_db_connection
 from app.services.auth_service import AuthService
 from app.services.password_manager import PasswordManager
 from app.services.token_manager import token_manager
 from app.services.rate_limiter import rate_limiter
+from app.services.audit_store import user_history
+from app.services.metrics import metrics
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -21,13 +26,27 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 password_manager = PasswordManager()
 
 def get_auth_service():
+    #one pooled connection per request, returned once the response is sent
     with get_db_connection() as conn:
-        return AuthService(conn, token_manager, password_manager)
+        yield AuthService(conn, token_manager, password_manager)
+
+
+async def get_async_auth_service():
+    #asyncpg backed service used by the handlers, keeps the event loop free
+    async with get_async_db_connection() as conn:
+        yield AuthService(conn, token_manager, password_manager)
     
 
+def bearer_token(req: Request) -> Optional[str]:
+    #the client's last access token, expired or not, matches legacy refresh tokens to their user
+    scheme, _, token = req.headers.get("authorization", "").partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+
 def rate_limit(prefix: str):
     def dependency(req: Request):
-        allowed, wait_time = rate_limiter.is_allowed(f"{prefix}_{req.client.host}")
+        with metrics.span("rate_limit"):
+            allowed, wait_time = rate_limiter.is_allowed(f"{prefix}_{req.client.host}")
         if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -39,14 +58,15 @@ def rate_limit(prefix: str):
 @router.post("/register", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     request: RegisterRequest,
-    auth_service: AuthService = Depends(get_auth_service),
+    req: Request,
+    auth_service: AuthService = Depends(get_async_auth_service),
     _: None = Depends(rate_limit("register"))
 ):
-    success, message, user_id = auth_service.register_user(
+    success, message, user_id = await auth_service.register_user_async(
         email=request.email,
         username=request.username,
         password=request.password,
-        ip_address=None, user_agent=""
+        ip_address=req.client.host, user_agent=req.headers.get("user-agent", "")
     )
 
     if not success:
@@ -58,13 +78,14 @@ async def register(
 @router.post("/login", response_model=TokenResponse)
 async def login(
     request: LoginRequest,
-    auth_service: AuthService = Depends(get_auth_service),
+    req: Request,
+    auth_service: AuthService = Depends(get_async_auth_service),
     _: None = Depends(rate_limit("login"))
 ):
-    success, message, tokens = auth_service.login_user(
+    success, message, tokens = await auth_service.login_user_async(
         email_or_username=request.email_or_username,
         password=request.password,
-        ip_address=None, user_agent=""
+        ip_address=req.client.host, user_agent=req.headers.get("user-agent", "")
     )
 
     if not success:
@@ -76,22 +97,26 @@ async def login(
 @router.post("/refresh")
 async def refresh_token(
     request: RefreshTokenRequest,
-    auth_service: AuthService = Depends(get_auth_service)
+    req: Request,
+    auth_service: AuthService = Depends(get_async_auth_service)
 ):
-    success, message, access_token = auth_service.refresh_access_token(request.refresh_token)
+    success, message, tokens = await auth_service.refresh_access_token_async(request.refresh_token, bearer_token(req))
 
     if not success:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=message)
 
-    return {"access_token": access_token, "token_type": "Bearer", "expires_in": 900}
+    #refresh_token is only present when rotation is on, the client must keep the new one
+    return {**tokens, "token_type": "Bearer", "expires_in": 900}
 
 
 @router.post("/logout", response_model=MessageResponse)
 async def logout(
     request: RefreshTokenRequest,
-    auth_service: AuthService = Depends(get_auth_service)
+    req: Request,
+    auth_service: AuthService = Depends(get_async_auth_service),
+    current_user: Optional[Dict] = Depends(get_optional_user)
 ):
-    success, message = auth_service.logout_user(request.refresh_token)
+    success, message = await auth_service.logout_user_async(request.refresh_token, current_user, bearer_token(req))
 
     if not success:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=message)
@@ -99,6 +124,15 @@ async def logout(
     return MessageResponse(message=message)
 
 
+@router.post("/logout-all", response_model=MessageResponse)
+async def logout_all(
+    current_user: Dict = Depends(get_current_user),
+    auth_service: AuthService = Depends(get_async_auth_service)
+):
+    success, message = await auth_service.logout_all_async(current_user["user_id"])
+    return MessageResponse(message=message)
+
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: Dict = Depends(get_current_user)):
     return UserResponse(**current_user, is_verified=True)
@@ -110,3 +144,20 @@ async def protected_route(current_user: Dict = Depends(get_current_user)):
         "message": f"Hello {current_user['username']}! This is a protected route.",
         "user_id": current_user["user_id"]
     }
+
+
+@router.get("/me/audit", response_model=AuditLogPage)
+async def get_audit_history(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Dict = Depends(get_current_user)
+):
+    try:
+        async with get_async_db_connection() as conn:
+            page = await user_history(conn, current_user["user_id"], since, until, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return AuditLogPage(**page)
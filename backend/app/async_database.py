@@ -0,0 +1,154 @@
+import asyncio
+import time
+import asyncpg
+from contextlib import asynccontextmanager
+from typing import Dict
+from app.config import settings
+from app.database import PoolTimeoutError
+
+
+class AsyncDatabase():
+    """
+    asyncpg connection pool used by the request handlers
+
+    mirrors app.database.Database so the event loop never blocks on a query,
+    the sync pool stays available for scripts and tests, like there a connection
+    idle for longer than DB_POOL_HEALTHCHECK_AFTER is pinged before it is handed out
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.min_size = settings.DB_POOL_MIN_SIZE
+        self.max_size = settings.DB_POOL_MAX_SIZE
+        self.timeout = settings.DB_POOL_TIMEOUT
+        self.healthcheck_after = settings.DB_POOL_HEALTHCHECK_AFTER
+
+        #acquire hands out a new proxy every time, the backend pid names the connection
+        self._last_used: Dict[int, float] = {}
+        self._connecting = asyncio.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def connect(self):
+        try:
+            self.pool = await asyncpg.create_pool(
+                host=settings.DATABASE_HOST,
+                port=settings.DATABASE_PORT,
+                database=settings.DATABASE_NAME,
+                user=settings.DATABASE_USER,
+                password=settings.DATABASE_PASSWORD,
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+
+            print(f"database: async pool ready ({self.min_size}-{self.max_size} connections)")
+            return self.pool
+        except Exception as e:
+            print(f"databae connection failed: {e}")
+            raise
+
+    async def disconnect(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            self._last_used.clear()
+            print(f"databse: async pool closed")
+
+    async def dedicated(self):
+        """a connection outside the pool, for LISTEN, the caller closes it"""
+        return await asyncpg.connect(
+            host=settings.DATABASE_HOST,
+            port=settings.DATABASE_PORT,
+            database=settings.DATABASE_NAME,
+            user=settings.DATABASE_USER,
+            password=settings.DATABASE_PASSWORD,
+        )
+
+    async def checkout(self):
+        if not self.pool:
+            #concurrent first requests would each create a pool otherwise
+            async with self._connecting:
+                if not self.pool:
+                    await self.connect()
+
+        started = time.monotonic()
+        try:
+            conn = await self._get_healthy_connection(started + self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeoutError(f"no database connection available after {self.timeout}s")
+
+        waited = time.monotonic() - started
+        self._in_use += 1
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    async def release(self, conn):
+        #asyncpg resets the connection (and rolls back open transactions) on release
+        try:
+            if self.pool is None:
+                return
+            if not conn.is_closed():
+                now = time.monotonic()
+                self._last_used[conn.get_server_pid()] = now
+                if len(self._last_used) > self.max_size * 4:
+                    #pids of connections the pool has since replaced, stale ones get pinged anyway
+                    self._last_used = {pid: t for pid, t in self._last_used.items() if now - t < self.healthcheck_after}
+            await self.pool.release(conn)
+        finally:
+            self._in_use -= 1
+
+    async def _get_healthy_connection(self, deadline:float):
+        #a dead connection is dropped and replaced, up to three tries in all
+        for _ in range(3):
+            conn = await self.pool.acquire(timeout=max(deadline - time.monotonic(), 0))
+            if not conn.is_closed() and await self._is_fresh(conn):
+                return conn
+
+            self._last_used.pop(conn.get_server_pid(), None)
+            conn.terminate()
+            await self.pool.release(conn)
+            self._discarded += 1
+
+        raise asyncpg.InterfaceError("no healthy database connection after 3 attempts")
+
+    async def _is_fresh(self, conn) -> bool:
+        last_used = self._last_used.get(conn.get_server_pid())
+        if last_used is not None and time.monotonic() - last_used < self.healthcheck_after:
+            return True
+        try:
+            await conn.fetchval("SELECT 1")
+            return True
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError):
+            return False
+
+    def pool_stats(self) -> Dict:
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self._in_use,
+            "saturation": round(self._in_use / self.max_size, 3),
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+            "discarded": self._discarded,
+            "wait_seconds_total": round(self._wait_total, 6),
+            "wait_seconds_max": round(self._wait_max, 6),
+            "wait_seconds_avg": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+        }
+
+async_db = AsyncDatabase()
+
+@asynccontextmanager
+async def get_async_db_connection():
+    """check out a pooled asyncpg connection for the duration of the block"""
+    conn = await async_db.checkout()
+    try:
+        yield conn
+    finally:
+        await async_db.release(conn)
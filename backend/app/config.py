@@ -4,7 +4,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Settings():
-    """Application Settings and conifguration"""
+    """
+    Application Settings and conifguration
+
+    read from the environment once at import, validated and then frozen,
+    so every worker forked from the same master sees the same values
+    """
 
     DATABASE_HOST: str = os.getenv("DATABASE_HOST", "localhost")
     DATABASE_PORT: int = int(os.getenv("DATABAE_PORT", 5432))
@@ -12,24 +17,207 @@ class Settings():
     DATABASE_USER: str = os.getenv("DATABASE_USER", "authuser")
     DATABASE_PASSWORD: str = os.getenv("DATABASE_PASSWORD", "authpassword")
 
+    #connection pool
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    #idle seconds after which a pooled connection is pinged before reuse
+    DB_POOL_HEALTHCHECK_AFTER: float = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", 30))
+
     @property
     def DATABASE_URL(self)-> str:
         return f"postgresql://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
-    
+
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "auth-system-prod-secret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+    #asymmetric signing (JWT_ALGORITHM=EdDSA or ES256), keys are published at /.well-known/jwks.json
+    JWT_KEYS_DIR: str = os.getenv("JWT_KEYS_DIR", "")
+    JWT_KEY_ROTATION_DAYS: float = float(os.getenv("JWT_KEY_ROTATION_DAYS", 30))
+    JWT_KEY_PUBLISH_AHEAD: float = float(os.getenv("JWT_KEY_PUBLISH_AHEAD", 3600))
+    JWT_KEYS_RETAINED: int = int(os.getenv("JWT_KEYS_RETAINED", 3))
+    JWT_KEY_CHECK_INTERVAL: float = float(os.getenv("JWT_KEY_CHECK_INTERVAL", 300))
+    #keep accepting HS256 tokens without a kid while switching to asymmetric signing
+    JWT_ACCEPT_HS256: bool = os.getenv("JWT_ACCEPT_HS256", "true").lower() == "true"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 15))
     REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+    #verified access token cache, entries never outlive the token's exp
+    ACCESS_TOKEN_CACHE_SIZE: int = int(os.getenv("ACCESS_TOKEN_CACHE_SIZE", 10000))
+    ACCESS_TOKEN_CACHE_TTL: float = float(os.getenv("ACCESS_TOKEN_CACHE_TTL", 60))
+    #login user cache, invalidations reach the other workers over postgres
+    #LISTEN/NOTIFY ("postgres") or not at all ("none", single worker only)
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", 30))
+    USER_CACHE_NEGATIVE_TTL: float = float(os.getenv("USER_CACHE_NEGATIVE_TTL", 5))
+    USER_CACHE_INVALIDATION: str = os.getenv("USER_CACHE_INVALIDATION", "postgres")
+    USER_CACHE_CHANNEL: str = os.getenv("USER_CACHE_CHANNEL", "user_cache")
+    #access token revocation, workers poll token_revocations every interval
+    REVOCATION_POLL_INTERVAL: float = float(os.getenv("REVOCATION_POLL_INTERVAL", 1))
+    REVOCATION_FILTER_CAPACITY: int = int(os.getenv("REVOCATION_FILTER_CAPACITY", 100000))
+    REVOCATION_FILTER_FP_RATE: float = float(os.getenv("REVOCATION_FILTER_FP_RATE", 0.001))
+    #every refresh consumes the refresh token and returns its successor,
+    #replaying a consumed one ends the session and revokes the access tokens minted from it
+    REFRESH_TOKEN_ROTATION: bool = os.getenv("REFRESH_TOKEN_ROTATION", "true").lower() == "true"
+    #the token rotated out last is still accepted this many seconds, for concurrent refreshes
+    REFRESH_TOKEN_REUSE_GRACE: float = float(os.getenv("REFRESH_TOKEN_REUSE_GRACE", 10))
+    #without rotation, last_used_at is only rewritten once it is this many seconds old
+    SESSION_TOUCH_INTERVAL: float = float(os.getenv("SESSION_TOUCH_INTERVAL", 300))
+    REFRESH_TOKEN_HMAC_KEY: str = os.getenv("REFRESH_TOKEN_HMAC_KEY", JWT_SECRET_KEY)
+    #accept bcrypt hashed refresh tokens issued before selectors were added, they
+    #are matched among the sessions of the user in the access token sent with them,
+    #every legacy token has expired REFRESH_TOKEN_EXPIRE_DAYS after upgrading, turn
+    #it off then, the setting goes away in the release after
+    LEGACY_REFRESH_TOKENS: bool = os.getenv("LEGACY_REFRESH_TOKENS", "true").lower() == "true"
+    #per user, each lookup bcrypt checks that user's legacy sessions
+    LEGACY_REFRESH_MAX_PER_MINUTE: int = int(os.getenv("LEGACY_REFRESH_MAX_PER_MINUTE", 10))
     
+    #password hashing, stored hashes with another scheme or cost are upgraded on login
+    PASSWORD_HASH_SCHEME: str = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    ARGON2_TIME_COST: int = int(os.getenv("ARGON2_TIME_COST", 3))
+    ARGON2_MEMORY_COST: int = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+    ARGON2_PARALLELISM: int = int(os.getenv("ARGON2_PARALLELISM", 4))
+    #when > 0 the cost is calibrated at startup to hit this verify latency, each
+    #host picks its own, for one cost everywhere run python -m app.services.password_manager
+    #offline and pin the printed BCRYPT_ROUNDS / ARGON2_* instead
+    PASSWORD_HASH_TARGET_MS: float = float(os.getenv("PASSWORD_HASH_TARGET_MS", 0))
+
+    #password hashing pool, "thread" or "process"
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE_SIZE: int = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 32))
+    PASSWORD_HASH_RETRY_AFTER: int = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 1))
+
+    #rate limiting, backend is "memory", "shared" (mmap, one host) or "redis"
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_MAX_ATTEMPTS: int = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", 5))
+    RATE_LIMIT_WINDOW_SECONDS: int = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", 60))
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+    RATE_LIMIT_SHARED_PATH: str = os.getenv("RATE_LIMIT_SHARED_PATH", "/dev/shm/auth-rate-limit")
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+    #failed login lockouts, backend is "postgres" (unlogged table), "shared" (mmap, one host) or "memory",
+    #a lock lasts base seconds, doubling per repeat lockout up to max, counters reset after reset seconds
+    LOCKOUT_BACKEND: str = os.getenv("LOCKOUT_BACKEND", "postgres")
+    LOCKOUT_ACCOUNT_THRESHOLD: int = int(os.getenv("LOCKOUT_ACCOUNT_THRESHOLD", 5))
+    LOCKOUT_IP_THRESHOLD: int = int(os.getenv("LOCKOUT_IP_THRESHOLD", 20))
+    LOCKOUT_BASE_SECONDS: float = float(os.getenv("LOCKOUT_BASE_SECONDS", 60))
+    LOCKOUT_MAX_SECONDS: float = float(os.getenv("LOCKOUT_MAX_SECONDS", 3600))
+    LOCKOUT_RESET_SECONDS: float = float(os.getenv("LOCKOUT_RESET_SECONDS", 3600))
+    LOCKOUT_MAX_KEYS: int = int(os.getenv("LOCKOUT_MAX_KEYS", 100000))
+    LOCKOUT_SHARED_PATH: str = os.getenv("LOCKOUT_SHARED_PATH", "/dev/shm/auth-lockouts")
+
+    #audit log batching, policy is "drop" or "block" when the queue is full
+    AUDIT_LOG_BATCH_SIZE: int = int(os.getenv("AUDIT_LOG_BATCH_SIZE", 500))
+    AUDIT_LOG_FLUSH_INTERVAL: float = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", 1))
+    AUDIT_LOG_QUEUE_SIZE: int = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", 10000))
+    AUDIT_LOG_POLICY: str = os.getenv("AUDIT_LOG_POLICY", "drop")
+    AUDIT_LOG_BLOCK_TIMEOUT: float = float(os.getenv("AUDIT_LOG_BLOCK_TIMEOUT", 0.05))
+
+    #audit_logs daily partitions
+    AUDIT_LOG_PARTITION_DAYS_AHEAD: int = int(os.getenv("AUDIT_LOG_PARTITION_DAYS_AHEAD", 7))
+    AUDIT_LOG_RETENTION_DAYS: int = int(os.getenv("AUDIT_LOG_RETENTION_DAYS", 90))
+    AUDIT_LOG_PARTITION_INTERVAL: float = float(os.getenv("AUDIT_LOG_PARTITION_INTERVAL", 3600))
+    AUDIT_LOG_HISTORY_DAYS: int = int(os.getenv("AUDIT_LOG_HISTORY_DAYS", 30))
+
+    #background reaper for expired sessions, tokens and lockouts
+    MAINTENANCE_ENABLED: bool = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+    MAINTENANCE_INTERVAL: float = float(os.getenv("MAINTENANCE_INTERVAL", 60))
+    MAINTENANCE_JITTER: float = float(os.getenv("MAINTENANCE_JITTER", 0.2))
+    MAINTENANCE_BATCH_SIZE: int = int(os.getenv("MAINTENANCE_BATCH_SIZE", 1000))
+    MAINTENANCE_MAX_BATCHES: int = int(os.getenv("MAINTENANCE_MAX_BATCHES", 50))
+    MAINTENANCE_BATCH_PAUSE: float = float(os.getenv("MAINTENANCE_BATCH_PAUSE", 0.1))
+    #only the worker holding a postgres advisory lock runs the jobs
+    MAINTENANCE_LEADER_ONLY: bool = os.getenv("MAINTENANCE_LEADER_ONLY", "true").lower() == "true"
+
+    #queries slower than this are logged, see app/services/query_registry.py
+    QUERY_SLOW_THRESHOLD_MS: float = float(os.getenv("QUERY_SLOW_THRESHOLD_MS", 100))
+
+    #readiness probes, run in the background and served from cache
+    HEALTH_PROBE_INTERVAL: float = float(os.getenv("HEALTH_PROBE_INTERVAL", 1))
+    HEALTH_PROBE_TTL: float = float(os.getenv("HEALTH_PROBE_TTL", 5))
+    HEALTH_PROBE_TIMEOUT: float = float(os.getenv("HEALTH_PROBE_TIMEOUT", 1))
+    HEALTH_MAX_POOL_SATURATION: float = float(os.getenv("HEALTH_MAX_POOL_SATURATION", 1.0))
+    #0 = the hashing queue size, i.e. not ready once logins start being rejected
+    HEALTH_MAX_HASHING_QUEUE: int = int(os.getenv("HEALTH_MAX_HASHING_QUEUE", 0))
+
+    #bulk user import/export (python -m app.services.bulk_users, /admin/users)
+    BULK_IMPORT_BATCH_SIZE: int = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 1000))
+    BULK_IMPORT_HASH_WORKERS: int = int(os.getenv("BULK_IMPORT_HASH_WORKERS", os.cpu_count() or 1))
+    #admin endpoints are disabled while this is empty
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "")
+
     CSRF_SECRET_KEY: str = os.getenv("CSRF_SECRET_KEY", "auth-csrf-secret")
+    #comma separated, still accepted for verification after a rotation
+    CSRF_PREVIOUS_SECRET_KEYS: tuple = tuple(k for k in os.getenv("CSRF_PREVIOUS_SECRET_KEYS", "").split(",") if k)
+    #off until the API authenticates with cookies, tokens travel in the Authorization header today
+    CSRF_ENABLED: bool = os.getenv("CSRF_ENABLED", "false").lower() == "true"
+    #comma separated names of the cookies that carry credentials, only requests sending one are checked
+    CSRF_AUTH_COOKIES: tuple = tuple(c for c in os.getenv("CSRF_AUTH_COOKIES", "").split(",") if c)
+    CSRF_TOKEN_MAX_AGE: int = int(os.getenv("CSRF_TOKEN_MAX_AGE", 43200))
+    CSRF_COOKIE_NAME: str = os.getenv("CSRF_COOKIE_NAME", "csrf_token")
+    CSRF_HEADER_NAME: str = os.getenv("CSRF_HEADER_NAME", "X-CSRF-Token")
+    CSRF_EXEMPT_PATHS: tuple = tuple(p for p in os.getenv("CSRF_EXEMPT_PATHS", "").split(",") if p)
 
     ENVOIRONMENT: str = os.getenv("ENVOIRONMENT", "development")
 
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
     API_PORT: int = int(os.getenv("API_PORT", 8000))
 
+    #startup, more than one worker pre-forks them from a master that has
+    #already imported and warmed the app, see app/prefork.py
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", 1))
+    #connect the pool, prepare statements, load keys and start the hashing pool before serving
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+    #comma separated modules the pre-fork master imports on top of the app so workers share them
+    STARTUP_PRELOAD: tuple = tuple(m for m in os.getenv("STARTUP_PRELOAD", "").split(",") if m)
+
 
     #cors
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+    CHOICES = {
+        "JWT_ALGORITHM": ("HS256", "HS384", "HS512", "EdDSA", "ES256"),
+        "USER_CACHE_INVALIDATION": ("postgres", "none"),
+        "PASSWORD_HASH_SCHEME": ("bcrypt", "argon2id"),
+        "PASSWORD_HASH_EXECUTOR": ("thread", "process"),
+        "RATE_LIMIT_BACKEND": ("memory", "shared", "redis"),
+        "LOCKOUT_BACKEND": ("postgres", "shared", "memory"),
+        "AUDIT_LOG_POLICY": ("drop", "block"),
+    }
+    POSITIVE = (
+        "DB_POOL_MAX_SIZE", "DB_POOL_TIMEOUT", "ACCESS_TOKEN_EXPIRE_MINUTES", "REFRESH_TOKEN_EXPIRE_DAYS",
+        "JWT_KEYS_RETAINED", "PASSWORD_HASH_WORKERS", "RATE_LIMIT_MAX_ATTEMPTS", "RATE_LIMIT_WINDOW_SECONDS",
+        "LOCKOUT_ACCOUNT_THRESHOLD", "LOCKOUT_BASE_SECONDS", "AUDIT_LOG_BATCH_SIZE", "AUDIT_LOG_QUEUE_SIZE",
+        "MAINTENANCE_INTERVAL", "MAINTENANCE_BATCH_SIZE", "HEALTH_PROBE_INTERVAL", "BULK_IMPORT_BATCH_SIZE",
+        "CSRF_TOKEN_MAX_AGE", "SERVER_WORKERS", "LEGACY_REFRESH_MAX_PER_MINUTE",
+    )
+
+    def __init__(self):
+        problems = self.validate()
+        if problems:
+            raise ValueError("invalid settings: " + "; ".join(problems))
+        self._frozen = True
+
+    def validate(self) -> list:
+        """every problem with the loaded values, empty when they are usable"""
+        problems = []
+        for name, choices in self.CHOICES.items():
+            if getattr(self, name) not in choices:
+                problems.append(f"{name} must be one of {', '.join(choices)}, got {getattr(self, name)!r}")
+        for name in self.POSITIVE:
+            if getattr(self, name) <= 0:
+                problems.append(f"{name} must be positive, got {getattr(self, name)}")
+        if not 0 <= self.DB_POOL_MIN_SIZE <= self.DB_POOL_MAX_SIZE:
+            problems.append("DB_POOL_MIN_SIZE must be between 0 and DB_POOL_MAX_SIZE")
+        if not 4 <= self.BCRYPT_ROUNDS <= 31:
+            problems.append("BCRYPT_ROUNDS must be between 4 and 31")
+        if self.LOCKOUT_MAX_SECONDS < self.LOCKOUT_BASE_SECONDS:
+            problems.append("LOCKOUT_MAX_SECONDS must be at least LOCKOUT_BASE_SECONDS")
+        return problems
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"settings are read-only, set {name} in the environment instead")
+        super().__setattr__(name, value)
+
 settings = Settings()
\ No newline at end of file
@@ -1,19 +1,48 @@
+import time
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from threading import BoundedSemaphore, Lock
 from contextlib import contextmanager
+from typing import Dict
 from app.config import settings
 
+
+class PoolTimeoutError(Exception):
+    """raised when no connection could be checked out within DB_POOL_TIMEOUT"""
+
+
 class Database():
     """
-    database connection manager
+    database connection pool manager
+
+    every request checks out its own connection and returns it when done,
+    checkouts block for at most DB_POOL_TIMEOUT seconds when the pool is full
     """
 
     def __init__(self):
-        self.connection = None
+        self.pool = None
+        self.min_size = settings.DB_POOL_MIN_SIZE
+        self.max_size = settings.DB_POOL_MAX_SIZE
+        self.timeout = settings.DB_POOL_TIMEOUT
+        self.healthcheck_after = settings.DB_POOL_HEALTHCHECK_AFTER
+
+        self._slots = BoundedSemaphore(self.max_size)
+        self._last_used = {}
+        self._stats_lock = Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
 
     def connect(self):
         try:
-            self.connection = psycopg2.connect(
+            self.pool = ThreadedConnectionPool(
+                self.min_size,
+                self.max_size,
                 host=settings.DATABASE_HOST,
                 port=settings.DATABASE_PORT,
                 database=settings.DATABASE_NAME,
@@ -22,35 +51,119 @@ class Database():
                 cursor_factory=RealDictCursor
             )
 
-            print(f"database: conneted sucessfully")
-            return self.connection
+            print(f"database: pool ready ({self.min_size}-{self.max_size} connections)")
+            return self.pool
         except Exception as e:
             print(f"databae connection failed: {e}")
             raise
 
     def disconnect(self):
-        if self.connection:
-            self.connect.close()
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+            self._last_used.clear()
             print(f"databse: disconnetd")
 
-    def get_connection(self):
-        if not self.connection or self.connection.closed:
+    def checkout(self):
+        """take a healthy connection out of the pool"""
+        if not self.pool:
             self.connect()
 
-        return self.connection
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"no database connection available after {self.timeout}s")
+
+        try:
+            conn = self._get_healthy_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        """return a connection, rolling back anything the request left open"""
+        close = conn.closed != 0
+        if not close and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                close = True
+
+        try:
+            if self.pool is None:
+                #disconnect() already closed the pool, nothing to hand back to
+                self._last_used.pop(id(conn), None)
+                if not conn.closed:
+                    conn.close()
+                return
+
+            self._last_used[id(conn)] = time.monotonic()
+            if close:
+                self._last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=close)
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _get_healthy_connection(self):
+        #connections idle for longer than healthcheck_after are pinged before use,
+        #a dead one is dropped and replaced, up to three tries in all
+        for _ in range(3):
+            conn = self.pool.getconn()
+            if not conn.closed and self._is_fresh(conn):
+                return conn
+
+            self._last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=True)
+            with self._stats_lock:
+                self._discarded += 1
+
+        raise psycopg2.OperationalError("no healthy database connection after 3 attempts")
+
+    def _is_fresh(self, conn) -> bool:
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def pool_stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "saturation": round(self._in_use / self.max_size, 3),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "wait_seconds_avg": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
 
 db = Database() #TODO: global database instance
 
 @contextmanager
 def get_db_connection():
-    #TODO: contex manager for database connection
-    conn = db.get_connection()
+    """check out a pooled connection for the duration of the block"""
+    conn = db.checkout()
     try:
         yield conn
     finally:
-        pass
-
-
-def get_db_cursor():
-    conn = db.get_connection()
-    return conn.cursor()
\ No newline at end of file
+        db.release(conn)
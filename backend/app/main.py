@@ -1,9 +1,27 @@
+import asyncio
+import time
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.api.routes import auth
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api.routes import auth, admin
 from app.config import settings
-from app.database import db
+from app.database import db, PoolTimeoutError
+from app.async_database import async_db
+from app.services.hashing_pool import hashing_pool, HashingQueueFullError
+from app.services.audit_log import audit_log
+from app.services.audit_store import audit_partitions
+from app.services.token_cache import token_cache
+from app.services.token_manager import token_manager
+from app.services.revocation import revocation_list
+from app.services.maintenance import maintenance_reaper
+from app.services.query_registry import query_registry
+from app.services.metrics import metrics
+from app.services.rate_limiter import rate_limiter
+from app.services.health import health_monitor
+from app.services.user_cache import user_cache
+from app.services.lockout import login_lockout
+from app.services.csrf_protection import CSRFProtection, CSRFMiddleware
+from app.services.startup import startup_timer, warm_statements, warm_tokens
 
 
 app = FastAPI(
@@ -12,6 +30,22 @@ app = FastAPI(
     version="1.0.0"
 )
 
+#CSRF double-submit check, added first so CORS headers wrap its 403s
+if settings.CSRF_ENABLED:
+    app.add_middleware(
+        CSRFMiddleware,
+        protection=CSRFProtection(
+            settings.CSRF_SECRET_KEY,
+            settings.CSRF_PREVIOUS_SECRET_KEYS,
+            max_age=settings.CSRF_TOKEN_MAX_AGE
+        ),
+        cookie_name=settings.CSRF_COOKIE_NAME,
+        header_name=settings.CSRF_HEADER_NAME,
+        secure=settings.ENVOIRONMENT == "production",
+        exempt_paths=settings.CSRF_EXEMPT_PATHS,
+        auth_cookies=settings.CSRF_AUTH_COOKIES,
+    )
+
 #CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,8 +66,37 @@ async def add_security_headers(request: Request, call_next):
         response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
     return response
 
+#request counters and latency, labelled by route template to keep cardinality bounded
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.inc("http_requests_in_flight")
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.inc("http_requests_in_flight", value=-1)
+        route = request.scope.get("route")
+        path = route.path if route else "unmatched"
+        metrics.inc("http_requests_total", (request.method, path, str(status_code)))
+        metrics.observe("http_request_duration_seconds", elapsed, (request.method, path))
+        if startup_timer.first_request is None:
+            startup_timer.request_served(elapsed)
+
+#gauges read at scrape time
+metrics.gauge("rate_limiter_keys", "identifiers tracked by the rate limiter", rate_limiter.key_count)
+metrics.gauge("db_pool_in_use", "async pool connections checked out", lambda: async_db.pool_stats()["in_use"])
+metrics.gauge("db_pool_saturation", "async pool connections checked out / max", lambda: async_db.pool_stats()["saturation"])
+metrics.gauge("db_sync_pool_in_use", "sync pool connections checked out", lambda: db.pool_stats()["in_use"])
+metrics.gauge("hashing_queue_depth", "password hashes waiting for a worker", hashing_pool.queue_depth)
+metrics.collector(query_registry.prometheus_lines)
+
 #includes router
 app.include_router(auth.router)
+app.include_router(admin.router)
 
 #root endpoint
 @app.get("/")
@@ -44,29 +107,160 @@ async def root():
         "status": "running"
     }
 
-#health check
+#liveness, the process is up and the event loop answers
 @app.get("/health")
+@app.get("/health/live")
 async def health():
     return {"status": "healthy"}
 
+#readiness, served from the background probe so it never hits the database
+@app.get("/health/ready")
+async def readiness():
+    result = health_monitor.readiness()
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=result)
+
+#public keys for verifying access tokens without calling this API
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    return JSONResponse(
+        content=token_manager.jwks(),
+        headers={"Cache-Control": "public, max-age=300"}
+    )
+
+#prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+#connection pool metrics
+@app.get("/metrics/db")
+async def db_metrics():
+    return {"async": async_db.pool_stats(), "sync": db.pool_stats()}
+
+#password hashing pool metrics
+@app.get("/metrics/hashing")
+async def hashing_metrics():
+    return hashing_pool.stats()
+
+#audit log writer metrics
+@app.get("/metrics/audit")
+async def audit_metrics():
+    return {**audit_log.stats(), "partitions": audit_partitions.last_run}
+
+#verified token cache metrics
+@app.get("/metrics/tokens")
+async def token_metrics():
+    return {**token_cache.stats(), "revocations": revocation_list.stats()}
+
+#login user cache metrics
+@app.get("/metrics/users")
+async def user_cache_metrics():
+    return user_cache.stats()
+
+#failed login lockout metrics
+@app.get("/metrics/lockouts")
+async def lockout_metrics():
+    return login_lockout.stats()
+
+#per-query latency, the query with the largest share of time first
+@app.get("/metrics/queries")
+async def query_metrics():
+    return query_registry.stats()
+
+#background reaper metrics
+@app.get("/metrics/maintenance")
+async def maintenance_metrics():
+    return maintenance_reaper.stats()
+
+#where this worker's startup time went
+@app.get("/metrics/startup")
+async def startup_metrics():
+    return startup_timer.stats()
+
+#startup warmups, run concurrently
+async def start_database():
+    with startup_timer.phase("database"):
+        await async_db.connect()
+    if settings.STARTUP_WARMUP:
+        with startup_timer.phase("statements"):
+            await warm_statements(async_db, query_registry)
+
+async def start_tokens():
+    with startup_timer.phase("tokens"):
+        if token_manager.keyring:
+            await token_manager.keyring.start()
+        if settings.STARTUP_WARMUP:
+            await asyncio.get_running_loop().run_in_executor(None, warm_tokens, token_manager)
+
+async def start_hashing():
+    with startup_timer.phase("hashing"):
+        if settings.PASSWORD_HASH_TARGET_MS > 0:
+            #runs in this process so the calibrated cost sticks to the shared manager
+            loop = asyncio.get_running_loop()
+            params = await loop.run_in_executor(None, auth.password_manager.calibrate, settings.PASSWORD_HASH_TARGET_MS)
+            print(f"password hashing calibrated: {params}")
+        if settings.PASSWORD_HASH_EXECUTOR == "process" and settings.STARTUP_WARMUP:
+            #spawns the hashing processes now rather than on the first login
+            await hashing_pool.run(auth.password_manager.hash_password, "startup-warmup")
+
 #startup event
 @app.on_event("startup")
 async def startup_event():
     """
-    initialize database connection on startup
+    connect the database, load keys and set up hashing in parallel, then start the background services
     """
-    db.connect()
+    await asyncio.gather(start_database(), start_tokens(), start_hashing())
+
+    with startup_timer.phase("services"):
+        await health_monitor.start()
+        await audit_log.start()
+        await audit_partitions.start()
+        await revocation_list.start()
+        await user_cache.start()
+        if settings.MAINTENANCE_ENABLED:
+            await maintenance_reaper.start()
+
+    startup_timer.serving()
     print("server started successfully")
 
 #shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     """
-    close database connection on shutdown
+    flush pending audit events and close database connection on shutdown
     """
+    if token_manager.keyring:
+        await token_manager.keyring.stop()
+    await maintenance_reaper.stop()
+    await user_cache.stop()
+    await revocation_list.stop()
+    await audit_partitions.stop()
+    await audit_log.stop()
+    await health_monitor.stop()
+    await async_db.disconnect()
     db.disconnect()
+    hashing_pool.shutdown()
+    admin.import_pool.shutdown()
     print("server shut down")
 
+#pool exhausted, ask the client to back off instead of queueing forever
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily unavailable"},
+        headers={"Retry-After": "1"}
+    )
+
+#too many logins/registrations queued for bcrypt, shed load early
+@app.exception_handler(HashingQueueFullError)
+async def hashing_queue_full_handler(request: Request, exc: HashingQueueFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service busy, please retry"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 #global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -76,4 +270,6 @@ async def global_exception_handler(request: Request, exc: Exception):
             "detail": "Internal server error",
             "path": str(request.url)
         }
-    )
\ No newline at end of file
+    )
+
+startup_timer.mark("imports")
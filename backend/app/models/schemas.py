@@ -1,10 +1,12 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, List
+from datetime import datetime
 
 
 #request model
 class RegisterRequest(BaseModel):
-    email: EmailStr
+    #format is checked once, by AuthService (app.utils.validators)
+    email: str = Field(..., max_length=255)
     username: str = Field(..., min_length=3, max_length=50)
     password: str = Field(..., min_length=12)
 
@@ -33,5 +35,18 @@ class UserResponse(BaseModel):
     username: str
     is_verified: bool
 
+class AuditLogEntry(BaseModel):
+    id: int
+    action: str
+    status: Optional[str] = None
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    metadata: Optional[Dict] = None
+    created_at: datetime
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogEntry]
+    next_cursor: Optional[str] = None
+
 class ErrorResponse(BaseModel):
     detail: str
\ No newline at end of file
@@ -0,0 +1,122 @@
+import gc
+import os
+import signal
+import socket
+import time
+from typing import Dict
+import uvicorn
+from app.config import settings
+
+
+class PreforkServer:
+    """
+    a master that imports and warms the app once, then forks the workers
+
+    everything loaded before the fork (modules, settings, signing keys, the
+    argon2 hasher, shared rate limit tables) is shared copy-on-write instead
+    of being rebuilt per worker, gc.freeze() keeps the collector from
+    touching those objects so their pages stay shared, each worker still
+    opens its own pool, tasks and executors in the app's startup event, the
+    master only restarts workers that die and passes SIGTERM/SIGINT on
+    """
+
+    #a worker dying sooner than this after being forked is likely a crash loop
+    MIN_WORKER_LIFETIME = 1.0
+
+    def __init__(self, host:str, port:int, workers:int, log_level:str="info"):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.log_level = log_level
+        self.app = None
+        self.sock = None
+        self._children: Dict[int, float] = {}
+        self._stopping = False
+
+    def preload(self):
+        from app.main import app
+        from app.api.routes import auth
+        from app.services.startup import preload, startup_timer, warm_tokens
+        from app.services.token_manager import token_manager
+
+        with startup_timer.phase("preload"):
+            warm_tokens(token_manager)
+            if auth.password_manager.scheme == "argon2id":
+                preload(["argon2"])
+            preload(settings.STARTUP_PRELOAD)
+        self.app = app
+
+    def bind(self):
+        self.sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+    def run(self):
+        self.preload()
+        self.bind()
+
+        #everything allocated so far is long lived, move it out of the collector's reach
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        print(f"prefork: master {os.getpid()} serving {self.host}:{self.port} with {self.workers} workers")
+        for _ in range(self.workers):
+            self._spawn()
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            forked_at = self._children.pop(pid, None)
+            if forked_at is None or self._stopping:
+                continue
+            print(f"prefork: worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - forked_at < self.MIN_WORKER_LIFETIME:
+                time.sleep(self.MIN_WORKER_LIFETIME)
+            if not self._stopping:
+                self._spawn()
+
+        self.sock.close()
+        print("prefork: master stopped")
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            return
+
+        #worker, never returns into the master's loop
+        code = 0
+        try:
+            self._serve()
+        except BaseException as e:
+            print(f"prefork: worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _serve(self):
+        from app.services.startup import startup_timer
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        startup_timer.forked()
+
+        config = uvicorn.Config(self.app, log_level=self.log_level)
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, Optional
+from app.config import settings
+from app.async_database import async_db
+
+
+class AuditLogWriter:
+    """
+    buffers audit events in memory and writes them to audit_logs in batches
+
+    a flush happens when batch_size events are queued or flush_interval
+    seconds have passed, each one is a single COPY, when the queue is full
+    the "drop" policy discards the event and "block" waits up to
+    block_timeout for room before dropping it
+    """
+
+    COLUMNS = ("user_id", "action", "ip_address", "user_agent", "status", "metadata", "created_at")
+
+    def __init__(self, database, batch_size:int, flush_interval:float, queue_size:int, policy:str="drop", block_timeout:float=0.05):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue = None
+        self._batch_ready = None
+        self._stopping = False
+        self._task = None
+
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+
+    async def start(self):
+        if self._task:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._batch_ready = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        stop the flusher once it has written whatever is still queued,
+        it isn't cancelled so a batch already taken off the queue is never lost
+        """
+        if not self._task:
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+
+        #anything recorded while the flusher was finishing, later events write straight through
+        queue, self._queue = self._queue, None
+        while not queue.empty():
+            await self._write(self._drain(queue))
+
+    async def record(
+        self,
+        action:str,
+        status:str,
+        user_id=None,
+        ip_address:Optional[str]=None,
+        user_agent:Optional[str]=None,
+        metadata:Optional[Dict]=None
+    ):
+        event = (
+            user_id,
+            action,
+            ip_address,
+            user_agent,
+            status,
+            json.dumps(metadata) if metadata is not None else None,
+            datetime.utcnow()
+        )
+
+        if self._queue is None:
+            #writer not started (scripts), write straight through
+            await self._write([event])
+            return
+
+        try:
+            if self.policy == "block":
+                await asyncio.wait_for(self._queue.put(event), self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self._dropped += 1
+            return
+
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            while not self._queue.empty():
+                await self._write(self._drain(self._queue))
+            if self._stopping:
+                return
+
+    def _drain(self, queue:asyncio.Queue) -> list:
+        batch = []
+        while len(batch) < self.batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def _write(self, batch:list):
+        if not batch:
+            return
+        try:
+            conn = await self.database.checkout()
+            try:
+                await conn.copy_records_to_table("audit_logs", records=batch, columns=self.COLUMNS)
+            finally:
+                await self.database.release(conn)
+            self._written += len(batch)
+            self._flushes += 1
+        except asyncio.CancelledError:
+            self._failed += len(batch)
+            print(f"audit log flush cancelled ({len(batch)} events lost)")
+            raise
+        except Exception as e:
+            self._failed += len(batch)
+            print(f"audit log flush failed ({len(batch)} events): {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "policy": self.policy,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "written": self._written,
+            "flushes": self._flushes,
+            "dropped": self._dropped,
+            "failed": self._failed,
+        }
+
+
+audit_log = AuditLogWriter(
+    async_db,
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+    queue_size=settings.AUDIT_LOG_QUEUE_SIZE,
+    policy=settings.AUDIT_LOG_POLICY,
+    block_timeout=settings.AUDIT_LOG_BLOCK_TIMEOUT,
+)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from app.config import settings
+from app.async_database import async_db
+
+
+class AuditLogPartitions:
+    """
+    keeps the daily audit_logs partitions ahead of time and drops the ones
+    past retention, runs every interval seconds once started
+    """
+
+    def __init__(self, database, days_ahead:int, retention_days:int, interval:float):
+        self.database = database
+        self.days_ahead = days_ahead
+        self.retention_days = retention_days
+        self.interval = interval
+        self._task = None
+        self.last_run = None
+
+    async def maintain(self) -> Dict:
+        conn = await self.database.checkout()
+        try:
+            created = await conn.fetchval("SELECT create_audit_log_partitions($1)", self.days_ahead)
+            dropped = 0
+            if self.retention_days > 0:
+                dropped = await conn.fetchval("SELECT drop_audit_log_partitions($1)", self.retention_days)
+        finally:
+            await self.database.release(conn)
+
+        self.last_run = {"at": datetime.utcnow().isoformat(), "created": created, "dropped": dropped}
+        return self.last_run
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                print(f"audit log partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def encode_cursor(created_at:datetime, entry_id:int) -> str:
+    return f"{created_at.isoformat()}|{entry_id}"
+
+def decode_cursor(cursor:str) -> tuple[datetime, int]:
+    created_at, entry_id = cursor.split("|")
+    return naive_utc(datetime.fromisoformat(created_at)), int(entry_id)
+
+def naive_utc(value:Optional[datetime]) -> Optional[datetime]:
+    #created_at is a plain TIMESTAMP in UTC, asyncpg rejects aware datetimes for it
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def user_history(
+    conn,
+    user_id:str,
+    since:Optional[datetime]=None,
+    until:Optional[datetime]=None,
+    cursor:Optional[str]=None,
+    limit:int=50
+) -> Dict:
+    """
+    page one user's audit events newest first within [since, until)
+
+    the range is always bounded (default: the last AUDIT_LOG_HISTORY_DAYS days)
+    so postgres prunes to the matching daily partitions, paging is keyset on
+    (created_at, id) so deep pages cost the same as the first one
+    """
+    until = naive_utc(until) or datetime.utcnow() + timedelta(seconds=1)
+    since = naive_utc(since) or until - timedelta(days=settings.AUDIT_LOG_HISTORY_DAYS)
+
+    before_at, before_id = until, None
+    if cursor:
+        before_at, before_id = decode_cursor(cursor)
+
+    rows = await conn.fetch("""
+        SELECT id, action, status, ip_address, user_agent, metadata, created_at
+        FROM audit_logs
+        WHERE user_id = $1
+            AND created_at >= $2 AND created_at < $3
+            AND ($5::BIGINT IS NULL OR (created_at, id) < ($4, $5))
+            -- plain bound so deep pages also prune partitions
+            AND created_at <= $4
+        ORDER BY created_at DESC, id DESC
+        LIMIT $6
+    """, user_id, since, until, before_at, before_id, limit + 1)
+
+    items = [
+        {
+            "id": row["id"],
+            "action": row["action"],
+            "status": row["status"],
+            "ip_address": row["ip_address"],
+            "user_agent": row["user_agent"],
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else None,
+            "created_at": row["created_at"],
+        }
+        for row in rows[:limit]
+    ]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+audit_partitions = AuditLogPartitions(
+    async_db,
+    days_ahead=settings.AUDIT_LOG_PARTITION_DAYS_AHEAD,
+    retention_days=settings.AUDIT_LOG_RETENTION_DAYS,
+    interval=settings.AUDIT_LOG_PARTITION_INTERVAL,
+)
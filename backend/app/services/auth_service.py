@@ -1,25 +1,171 @@
-from datetime import datetime, timedelta
+import json
+import math
+from datetime import datetime
 from typing import Optional, Dict
 from app.services.token_manager import TokenManager
 from app.services.password_manager import PasswordManager
+from app.services.hashing_pool import HashingQueueFullError
+from app.services.audit_log import AuditLogWriter, audit_log as default_audit_log
+from app.services.revocation import RevocationList, revocation_list as default_revocation_list
+from app.services.query_registry import QueryRegistry, query_registry as default_query_registry
+from app.services.user_cache import UserCache, user_cache as default_user_cache
+from app.services.lockout import LoginLockout, login_lockout as default_login_lockout
+from app.services.metrics import metrics
+from app.services.rate_limiter import RateLimiter, rate_limiter
 from app.utils.validators import is_valid_email, is_valid_username
-import bcrypt
+from app.config import settings
+
+
+#every statement the service runs, by name, see QueryRegistry
+default_query_registry.register_many({
+    "user_exists": """
+        SELECT id FROM users WHERE email = $1 OR username = $2
+    """,
+    "insert_user": """
+        INSERT INTO users (email, username, password_hash)
+        VALUES ($1, $2, $3)
+        RETURNING id
+    """,
+    "user_by_login": """
+        SELECT id, email, username, password_hash, is_verified, is_active
+        FROM users
+        WHERE email = $1 OR username = $1
+    """,
+    #everything a successful login writes, as one statement: the users row
+    #is only touched when there is a new hash to store
+    "login_success": """
+        WITH account AS (
+            UPDATE users SET password_hash = $6::VARCHAR
+            WHERE id = $1 AND $6::VARCHAR IS NOT NULL
+        )
+        INSERT INTO sessions
+        (user_id, refresh_token_selector, refresh_token_hash, device_info, expires_at)
+        VALUES ($1, $2, $3, $4, $5)
+    """,
+    #same, plus the audit row (sync path, which has no batched writer)
+    "login_success_audited": """
+        WITH account AS (
+            UPDATE users SET password_hash = $6::VARCHAR
+            WHERE id = $1 AND $6::VARCHAR IS NOT NULL
+        ), session AS (
+            INSERT INTO sessions
+            (user_id, refresh_token_selector, refresh_token_hash, device_info, expires_at)
+            VALUES ($1, $2, $3, $4, $5)
+        )
+        INSERT INTO audit_logs
+        (user_id, action, ip_address, user_agent, status)
+        VALUES ($1, 'login', $7, $8, 'success')
+    """,
+    "insert_audit_log": """
+        INSERT INTO audit_logs
+        (user_id, action, ip_address, user_agent, status, metadata)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """,
+    "session_by_selector": """
+        SELECT s.id, s.user_id, s.refresh_token_hash, s.last_used_at,
+            u.email, u.username, u.is_active
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        WHERE s.refresh_token_selector = $1 AND s.expires_at > $2
+    """,
+    "legacy_sessions": """
+        SELECT s.id, s.user_id, s.refresh_token_hash,
+            u.email, u.username, u.is_active
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        WHERE s.user_id = $1 AND s.refresh_token_selector IS NULL AND s.expires_at > $2
+        ORDER BY s.created_at DESC
+    """,
+    "rekey_legacy_session": """
+        UPDATE sessions
+        SET refresh_token_selector = $1, refresh_token_hash = $2
+        WHERE id = $3
+    """,
+    #a refresh with rotation, as one statement on the selector index: the
+    #session row is the token family (its selector never changes), a current
+    #verifier swaps in the next one, the verifier rotated out last is still
+    #accepted for $5 seconds (recent, two tabs refreshing at once) without
+    #rotating again, any other verifier for the selector is a rotated-out
+    #token being replayed and the whole family is deleted,
+    #$1 selector, $2 presented verifier hash, $3 next verifier hash, $4 now
+    "rotate_session": """
+        WITH session AS (
+            SELECT s.id, s.user_id, s.refresh_token_hash = $2 AS current,
+                COALESCE(s.previous_token_hash = $2 AND s.rotated_at > $4 - make_interval(secs => $5), FALSE) AS recent,
+                u.email, u.username, u.is_active
+            FROM sessions s
+            JOIN users u ON s.user_id = u.id
+            WHERE s.refresh_token_selector = $1 AND s.expires_at > $4
+            FOR UPDATE OF s
+        ), rotated AS (
+            UPDATE sessions s
+            SET refresh_token_hash = $3, previous_token_hash = s.refresh_token_hash, rotated_at = $4, last_used_at = $4
+            FROM session
+            WHERE s.id = session.id AND session.current AND session.is_active
+        ), revoked AS (
+            DELETE FROM sessions s USING session
+            WHERE s.id = session.id AND NOT session.current AND NOT session.recent
+        )
+        SELECT id, user_id, current, recent, email, username, is_active FROM session
+    """,
+    "touch_session": """
+        UPDATE sessions SET last_used_at = $1 WHERE id = $2
+    """,
+    "delete_session": """
+        DELETE FROM sessions WHERE id = $1
+    """,
+    "delete_user_sessions": """
+        DELETE FROM sessions WHERE user_id = $1
+    """,
+})
+
+#a legacy lookup bcrypt checks every legacy session of one user, so each
+#user's lookups are capped, on the app limiter's store
+legacy_refresh_limiter = RateLimiter(
+    max_attempts=settings.LEGACY_REFRESH_MAX_PER_MINUTE,
+    window_seconds=60,
+    store=rate_limiter.store
+)
+
+metrics.describe(
+    "legacy_refresh_lookups_total", "counter",
+    "refresh tokens from before selectors, by outcome", ("outcome",)
+)
 
 
 class AuthService:
     """
     core authentication service
-    """
 
-    LOCKOUT_THRESOLD = 5
-    LOCKOUT_DURATION = timedelta(minutes=30)
+    bound to either a psycopg2 connection (sync methods, used by scripts and
+    tests) or an asyncpg connection (the *_async methods used by the routes),
+    the async methods hand audit events to the batched AuditLogWriter instead
+    of inserting them inside the request transaction, login reads users
+    through the UserCache and counts failures in LoginLockout, so users is
+    only written when profile data changes
+    """
 
-    def __init__(self, db_connection, token_manager:TokenManager, password_manager:PasswordManager):
+    def __init__(
+        self,
+        db_connection,
+        token_manager:TokenManager,
+        password_manager:PasswordManager,
+        audit_log:AuditLogWriter=default_audit_log,
+        revocation_list:RevocationList=default_revocation_list,
+        queries:QueryRegistry=default_query_registry,
+        user_cache:UserCache=default_user_cache,
+        lockout:LoginLockout=default_login_lockout
+    ):
         self.db = db_connection
         self.token_manager = token_manager
         self.password_manager = password_manager
+        self.audit_log = audit_log
+        self.revocation_list = revocation_list
+        self.queries = queries
+        self.user_cache = user_cache
+        self.lockout = lockout
+
 
-    
     def register_user(
         self,
         email:str,
@@ -31,47 +177,30 @@ class AuthService:
         #register new user
 
         #validate input
-        if not is_valid_email(email=email):
-            return False, "Invalid email format", None
-        
-        if not is_valid_username(username=username):
-            return False , "Username must be 3-50 alphanumeric characters", None
-        
-        is_strong, msg = self.password_manager.validate_strength(password)
-        if not is_strong:
-            return False, msg, None
-        
-        cursor = self.db.cursor()
+        error = self._validate_registration(email, username, password)
+        if error:
+            return False, error, None
 
         #check if user exists
-        cursor.execute(
-            "SELECT id FROM users WHERE email = %s OR username = %s",
-            (email.lower(), username.lower())
-        )
-
-        if cursor.fetchone():
+        if self.queries.run(self.db, "user_exists", email.lower(), username.lower()).fetchone():
             return False, "User Already exists", None
-        
+
         #hash password
         password_hash = self.password_manager.hash_password(password)
 
         try:
-            cursor.execute("""
-                INSERT INTO users (email, username, password_hash)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """, (email.lower(), username.lower(), password_hash))
-
-            user_id = cursor.fetchone()['id']
+            user_id = self.queries.run(
+                self.db, "insert_user", email.lower(), username.lower(), password_hash
+            ).fetchone()['id']
 
             #audit log
-            cursor.execute("""
-                INSERT INTO audit_logs
-                (user_id, action, ip_address, user_agent, status)
-                VALUES (%s, 'register', %s, %s, 'sucess')
-            """, (user_id, ip_address, user_agent))
+            self.queries.run(
+                self.db, "insert_audit_log", user_id, "register", ip_address, user_agent, "success", None
+            )
+            self.user_cache.broadcast_sync(self.db, *self._new_user_keys(email, username))
 
             self.db.commit()
+            self.user_cache.invalidate(*self._new_user_keys(email, username))
             return True, "Registration successful", str(user_id)
         except Exception as e:
             self.db.rollback()
@@ -85,165 +214,508 @@ class AuthService:
         ip_address:str,
         user_agent:str
     )-> tuple[bool, str, Optional[str]]:
-        cursor = self.db.cursor()
-
         #find user
-        cursor.execute("""
-            SELECT id, email, username, password_hash, is_verified,
-                is_active, failed_login_attempts, locked_until
-            FROM users
-            WHERE email = %s OR username = %s
-        """, (email_or_username.lower(), email_or_username.lower()))
-
-        user = cursor.fetchone()
+        login = email_or_username.lower()
+        cached, user = self.user_cache.lookup(login)
+        if not cached:
+            user = self.queries.run(self.db, "user_by_login", login).fetchone()
+            self._cache_user(login, user)
+
+        user_id = user['id'] if user else None
+
+        #check if the account or the client is locked out
+        locked_for, has_failures = self.lockout.check_sync(self.db, user_id, ip_address)
+        if locked_for:
+            return False, self._locked_message(locked_for), None
+
         if not user:
+            self.lockout.failed_sync(self.db, None, ip_address)
             self._log_failed_login(None, ip_address, user_agent, "user_not_found")
             return False, "Invalid credentials", None
-        
-        user_id = user['id']
-        locked_until = user['locked_until']
-        failed_attempts = user['failed_login_attempts']
-
-        #check if locked
-        if locked_until and datetime.utcnow() < locked_until:
-            remaining = int((locked_until - datetime.utcnow()).total_seconds() / 60)
-            return False, f"Account locked. Try again in {remaining} minutes", None
-        
-        # check if active
+
         if not user['is_active']:
             return False, "Account is deactivated", None
 
-
         # verify password
         if not self.password_manager.verify_password(password, user['password_hash']):
-            failed_attempts += 1
-            
-            if failed_attempts >= self.LOCKOUT_THRESHOLD:
-                cursor.execute("""
-                    UPDATE users
-                    SET failed_login_attempts = %s, locked_until = %s
-                    WHERE id = %s
-                """, (failed_attempts, datetime.utcnow() + self.LOCKOUT_DURATION, user_id))
-            else:
-                cursor.execute("""
-                    UPDATE users SET failed_login_attempts = %s WHERE id = %s
-                """, (failed_attempts, user_id))
-            
-            self.db.commit()
+            self.lockout.failed_sync(self.db, user_id, ip_address)
             self._log_failed_login(user_id, ip_address, user_agent, "wrong_password")
             return False, "Invalid credentials", None
-        
-        #reset failed attempts
-        cursor.execute("""
-            UPDATE users
-            SET failed_login_attempts = 0, locked_until = NULL
-            WHERE id = %s
-        """, (user_id,))
-        
-        #create tokens
-        access_token = self.token_manager.create_access_token(
-            str(user_id), user['email'], user['username']
-        )
-        
-        refresh_token, refresh_token_hash = self.token_manager.create_refresh_token()
-        
-        #store session
-        cursor.execute("""
-            INSERT INTO sessions 
-            (user_id, refresh_token_hash, device_info, expires_at)
-            VALUES (%s, %s, %s, %s)
-        """, (
+
+        if has_failures:
+            self.lockout.succeeded_sync(self.db, user_id)
+
+        #move the stored hash to the current scheme/cost while we have the password
+        new_hash = None
+        if self.password_manager.needs_rehash(user['password_hash']):
+            new_hash = self.password_manager.hash_password(password)
+
+        refresh_token, selector, refresh_token_hash = self.token_manager.create_refresh_token()
+
+        #reset lockout, store session and audit log in one round-trip
+        self.queries.run(
+            self.db,
+            "login_success_audited",
             user_id,
+            selector,
             refresh_token_hash,
-            f'{{"ip": "{ip_address}", "user_agent": "{user_agent}"}}',
-            datetime.utcnow() + self.token_manager.refersh_token_expires
-        ))
-
-        #audit log
-        cursor.execute("""
-            INSERT INTO audit_logs 
-            (user_id, action, ip_address, user_agent, status)
-            VALUES (%s, 'login', %s, %s, 'success')
-        """, (user_id, ip_address, user_agent))
-        
+            self._device_info(ip_address, user_agent),
+            datetime.utcnow() + self.token_manager.refersh_token_expires,
+            new_hash,
+            ip_address,
+            user_agent
+        )
+        self.user_cache.broadcast_sync(self.db, *self._record_rehash(user, new_hash))
+
         self.db.commit()
-        
-        return True, "Login successful", {
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "token_type": "Bearer",
-            "expires_in": 900
-        }
 
-    def refresh_access_token(self, refresh_token: str) -> tuple[bool, str, Optional[str]]:
-        """refresh access token"""
-        
-        cursor = self.db.cursor()
-        
-        #get all active sessions
-        cursor.execute("""
-            SELECT s.id, s.user_id, s.refresh_token_hash,
-                u.email, u.username, u.is_active
-            FROM sessions s
-            JOIN users u ON s.user_id = u.id
-            WHERE s.expires_at > %s
-        """, (datetime.utcnow(),))
-        
-        sessions = cursor.fetchall()
-        
-        #verify token
-        valid_session = None
-        for session in sessions:
-            if self.token_manager.verify_refresh_token(refresh_token, session['refresh_token_hash']):
-                valid_session = session
-                break
-        
+        return True, "Login successful", self._token_response(user, refresh_token)
+
+    def refresh_access_token(self, refresh_token: str, access_token: Optional[str] = None) -> tuple[bool, str, Optional[Dict]]:
+        """
+        refresh access token, and rotate the refresh token when REFRESH_TOKEN_ROTATION is on,
+        access_token is the client's last one, expired or not, it finds a legacy token's session
+        """
+        selector, verifier = self.token_manager.split_refresh_token(refresh_token)
+
+        if settings.REFRESH_TOKEN_ROTATION:
+            next_token, next_hash = self.token_manager.rotate_refresh_token(selector)
+            args = self._rotate_args(selector, verifier, next_hash)
+
+            valid_session = self.queries.run(self.db, "rotate_session", *args).fetchone()
+            if valid_session is None:
+                owner = self._legacy_owner(refresh_token, access_token)
+                if owner and self._migrate_legacy_session(refresh_token, selector, verifier, owner):
+                    valid_session = self.queries.run(self.db, "rotate_session", *args).fetchone()
+            self.db.commit()
+
+            if valid_session and not valid_session['current']:
+                if not valid_session['recent']:
+                    session_id = self.token_manager.session_id(selector)
+                    revocation = self.revocation_list.revoke_session_sync(self.db, session_id)
+                    self.queries.run(
+                        self.db, "insert_audit_log",
+                        valid_session['user_id'], "refresh_token_reuse", None, None, "failed",
+                        json.dumps({"session_id": str(valid_session['id'])})
+                    )
+                    self.db.commit()
+                    self.revocation_list.apply(*revocation)
+                    return False, "Invalid refresh token", None
+                #a concurrent refresh already rotated it, the client keeps the token it has
+                next_token = None
+        else:
+            next_token = None
+            valid_session = self._find_session(refresh_token, access_token)
+
         if not valid_session:
             return False, "Invalid refresh token", None
-        
+
         if not valid_session['is_active']:
             return False, "Account deactivated", None
-        
+
         #create new access token
         access_token = self.token_manager.create_access_token(
             str(valid_session['user_id']),
             valid_session['email'],
-            valid_session['username']
+            valid_session['username'],
+            self.token_manager.session_id(selector)
         )
-        
-        #update session
-        cursor.execute("""
-            UPDATE sessions SET last_used_at = %s WHERE id = %s
-        """, (datetime.utcnow(), valid_session['id']))
-        
-        self.db.commit()
-        
-        return True, "Token refreshed", access_token
-    
-    def logout_user(self, refresh_token: str) -> tuple[bool, str]:
+
+        #without rotation, last_used_at is only written once it is stale
+        if not settings.REFRESH_TOKEN_ROTATION and self._session_stale(valid_session):
+            self.queries.run(self.db, "touch_session", datetime.utcnow(), valid_session['id'])
+            self.db.commit()
+
+        return True, "Token refreshed", self._refresh_response(access_token, next_token)
+
+    def logout_user(self, refresh_token: str, access_token: Optional[str] = None) -> tuple[bool, str]:
         """Logout user"""
-        cursor = self.db.cursor()
-        
-        #find and delete matching sessions
-        cursor.execute("SELECT id, refresh_token_hash FROM sessions WHERE expires_at > %s", (datetime.utcnow(),))
-        sessions = cursor.fetchall()
-        
+        session = self._find_session(refresh_token, access_token)
+        if not session:
+            return False, "Invalid token"
+
+        self.queries.run(self.db, "delete_session", session['id'])
+        self.db.commit()
+        return True, "Logged out successfully"
+
+    def _find_session(self, refresh_token: str, access_token: Optional[str] = None) -> Optional[Dict]:
+        """
+        find the live session for a refresh token with one indexed lookup
+        on the selector and a constant time compare of the verifier
+        """
+        selector, verifier = self.token_manager.split_refresh_token(refresh_token)
+
+        session = self.queries.run(self.db, "session_by_selector", selector, datetime.utcnow()).fetchone()
+        if session:
+            if self.token_manager.verify_refresh_token(verifier, session['refresh_token_hash']):
+                return session
+            return None
+
+        owner = self._legacy_owner(refresh_token, access_token)
+        if owner:
+            return self._migrate_legacy_session(refresh_token, selector, verifier, owner)
+
+        return None
+
+    def _migrate_legacy_session(self, refresh_token: str, selector: str, verifier: str, user_id: str) -> Optional[Dict]:
+        """
+        match a bcrypt hashed session from before selectors existed among
+        its user's sessions and re-key it, so every later use of the same
+        token takes the indexed path
+        """
+        sessions = self.queries.run(self.db, "legacy_sessions", user_id, datetime.utcnow()).fetchall()
+
         for session in sessions:
-            if self.token_manager.verify_refresh_token(refresh_token, session['refresh_token_hash']):
-                cursor.execute("DELETE FROM sessions WHERE id = %s", (session['id'],))
+            if self.token_manager.verify_legacy_refresh_token(refresh_token, session['refresh_token_hash']):
+                self.queries.run(
+                    self.db, "rekey_legacy_session",
+                    selector, self.token_manager.hash_refresh_verifier(verifier), session['id']
+                )
                 self.db.commit()
-                return True, "Logged out successfully"
-        
-        return False, "Invalid token"
-    
+                metrics.inc("legacy_refresh_lookups_total", ("migrated",))
+                return session
+
+        metrics.inc("legacy_refresh_lookups_total", ("not_found",))
+        return None
+
 
     def _log_failed_login(self, user_id, ip_address, user_agent, reason):
         #log failed login
-        curr = self.db.cursor()
-        curr.execute("""
-            INSERT INTO audit_logs
-            (user_id, action, ip_address, user_agent, status, metadata)
-            VALUES (%s, 'login), %s, %s, 'failed', %s)
-        """, (user_id, ip_address, user_agent, f'{{"reason": "{reason}"}}'))
+        self.queries.run(
+            self.db, "insert_audit_log",
+            user_id, "login", ip_address, user_agent, "failed", json.dumps({"reason": reason})
+        )
 
         self.db.commit()
+
+    #async variants, self.db is an asyncpg connection
+
+    async def register_user_async(
+        self,
+        email:str,
+        username:str,
+        password:str,
+        ip_address:str,
+        user_agent:str
+    )-> tuple[bool, str, Optional[str]]:
+        error = self._validate_registration(email, username, password)
+        if error:
+            return False, error, None
+
+        #check if user exists
+        with metrics.span("register_user_lookup"):
+            existing = await self.queries.fetchval(self.db, "user_exists", email.lower(), username.lower())
+        if existing:
+            return False, "User Already exists", None
+
+        #hash password off the event loop
+        password_hash = await self.password_manager.hash_password_async(password)
+
+        try:
+            with metrics.span("register_user_write"):
+                user_id = await self.queries.fetchval(
+                    self.db, "insert_user", email.lower(), username.lower(), password_hash
+                )
+        except Exception as e:
+            print(f"Registration error: {e}")
+            return False, "regisration failed", None
+
+        #drop "not found" entries for the new names, here and on the other workers
+        keys = self._new_user_keys(email, username)
+        self.user_cache.invalidate(*keys)
+        await self.user_cache.broadcast(self.db, *keys)
+
+        await self.audit_log.record("register", "success", user_id, ip_address, user_agent)
+        return True, "Registration successful", str(user_id)
+
+    async def login_user_async(
+        self,
+        email_or_username:str,
+        password:str,
+        ip_address:str,
+        user_agent:str
+    )-> tuple[bool, str, Optional[Dict]]:
+        #find user, service accounts and repeat logins are usually cached
+        login = email_or_username.lower()
+        cached, user = self.user_cache.lookup(login)
+        if not cached:
+            with metrics.span("login_user_lookup"):
+                user = await self.queries.fetchrow(self.db, "user_by_login", login)
+            self._cache_user(login, user)
+
+        user_id = user['id'] if user else None
+
+        with metrics.span("lockout_check"):
+            locked_for, has_failures = await self.lockout.check(self.db, user_id, ip_address)
+        if locked_for:
+            return False, self._locked_message(locked_for), None
+
+        if not user:
+            with metrics.span("login_failure_write"):
+                await self.lockout.failed(self.db, None, ip_address)
+            await self._log_failed_login_async(None, ip_address, user_agent, "user_not_found")
+            return False, "Invalid credentials", None
+
+        if not user['is_active']:
+            return False, "Account is deactivated", None
+
+        # verify password
+        if not await self.password_manager.verify_password_async(password, user['password_hash']):
+            with metrics.span("login_failure_write"):
+                await self.lockout.failed(self.db, user_id, ip_address)
+            await self._log_failed_login_async(user_id, ip_address, user_agent, "wrong_password")
+            return False, "Invalid credentials", None
+
+        if has_failures:
+            with metrics.span("login_failure_write"):
+                await self.lockout.succeeded(self.db, user_id)
+
+        refresh_token, selector, refresh_token_hash = self.token_manager.create_refresh_token()
+
+        #the upgrade is best effort, a full hashing pool must not fail the login
+        new_hash = None
+        if self.password_manager.needs_rehash(user['password_hash']):
+            try:
+                new_hash = await self.password_manager.hash_password_async(password)
+            except HashingQueueFullError:
+                pass
+
+        #rehash and session insert as a single statement, no
+        #explicit transaction needed, the audit event goes to the batched writer
+        with metrics.span("login_session_write"):
+            await self.queries.execute(
+                self.db,
+                "login_success",
+                user_id,
+                selector,
+                refresh_token_hash,
+                self._device_info(ip_address, user_agent),
+                datetime.utcnow() + self.token_manager.refersh_token_expires,
+                new_hash
+            )
+            await self.user_cache.broadcast(self.db, *self._record_rehash(user, new_hash))
+
+        await self.audit_log.record("login", "success", user_id, ip_address, user_agent)
+        return True, "Login successful", self._token_response(user, refresh_token)
+
+    async def refresh_access_token_async(self, refresh_token: str, access_token: Optional[str] = None) -> tuple[bool, str, Optional[Dict]]:
+        selector, _ = self.token_manager.split_refresh_token(refresh_token)
+        if settings.REFRESH_TOKEN_ROTATION:
+            with metrics.span("refresh_session_rotate"):
+                valid_session, next_token = await self._rotate_session_async(refresh_token, access_token)
+            if valid_session and not valid_session['current']:
+                if not valid_session['recent']:
+                    await self._revoke_family_async(valid_session, selector)
+                    return False, "Invalid refresh token", None
+                #a concurrent refresh already rotated it, the client keeps the token it has
+                next_token = None
+        else:
+            next_token = None
+            with metrics.span("refresh_session_lookup"):
+                valid_session = await self._find_session_async(refresh_token, access_token)
+
+        if not valid_session:
+            return False, "Invalid refresh token", None
+
+        if not valid_session['is_active']:
+            return False, "Account deactivated", None
+
+        with metrics.span("jwt_sign"):
+            access_token = self.token_manager.create_access_token(
+                str(valid_session['user_id']),
+                valid_session['email'],
+                valid_session['username'],
+                self.token_manager.session_id(selector)
+            )
+
+        #without rotation, last_used_at is only written once it is stale
+        if not settings.REFRESH_TOKEN_ROTATION and self._session_stale(valid_session):
+            with metrics.span("refresh_session_write"):
+                await self.queries.execute(self.db, "touch_session", datetime.utcnow(), valid_session['id'])
+
+        return True, "Token refreshed", self._refresh_response(access_token, next_token)
+
+    async def _rotate_session_async(self, refresh_token: str, access_token: Optional[str] = None) -> tuple[Optional[Dict], str]:
+        """
+        consume refresh_token and swap in its successor, one round trip,
+        returns (session, next token), session['current'] is False on replay,
+        session['recent'] tells a replay within the grace period
+        """
+        selector, verifier = self.token_manager.split_refresh_token(refresh_token)
+        next_token, next_hash = self.token_manager.rotate_refresh_token(selector)
+        args = self._rotate_args(selector, verifier, next_hash)
+
+        session = await self.queries.fetchrow(self.db, "rotate_session", *args)
+        if session is None:
+            owner = self._legacy_owner(refresh_token, access_token)
+            if owner and await self._migrate_legacy_session_async(refresh_token, selector, verifier, owner):
+                session = await self.queries.fetchrow(self.db, "rotate_session", *args)
+        return session, next_token
+
+    def _rotate_args(self, selector: str, verifier: str, next_hash: str) -> tuple:
+        #the stored hash is a keyed HMAC, comparing it in SQL leaks nothing useful
+        return (
+            selector, self.token_manager.hash_refresh_verifier(verifier), next_hash,
+            datetime.utcnow(), settings.REFRESH_TOKEN_REUSE_GRACE
+        )
+
+    async def _revoke_family_async(self, session, selector: str):
+        """
+        a rotated-out token came back, either the client or a thief holds a
+        stale copy, the statement already deleted the session, also cut off
+        the access tokens minted from it, the user's other sessions keep theirs
+        """
+        await self.revocation_list.revoke_session(self.db, self.token_manager.session_id(selector))
+        await self.audit_log.record(
+            "refresh_token_reuse", "failed", session['user_id'],
+            metadata={"session_id": str(session['id'])}
+        )
+
+    async def logout_user_async(
+        self,
+        refresh_token: str,
+        access_payload: Optional[Dict] = None,
+        access_token: Optional[str] = None
+    ) -> tuple[bool, str]:
+        session = await self._find_session_async(refresh_token, access_token)
+        if not session:
+            return False, "Invalid token"
+
+        await self.queries.execute(self.db, "delete_session", session['id'])
+
+        #also kill the access token sent with the request, it would otherwise live until exp
+        if access_payload and access_payload.get("user_id") == str(session['user_id']):
+            await self.revocation_list.revoke_jti(
+                self.db, access_payload["jti"], datetime.utcfromtimestamp(access_payload["exp"])
+            )
+        return True, "Logged out successfully"
+
+    async def logout_all_async(self, user_id: str) -> tuple[bool, str]:
+        """log out every device: drop all sessions and revoke every access token issued so far"""
+        async with self.db.transaction():
+            await self.queries.execute(self.db, "delete_user_sessions", user_id)
+            revocation = await self.revocation_list.revoke_user(self.db, user_id)
+        self.revocation_list.apply(*revocation)
+
+        await self.audit_log.record("logout_all", "success", user_id)
+        return True, "Logged out from all devices"
+
+    async def _find_session_async(self, refresh_token: str, access_token: Optional[str] = None) -> Optional[Dict]:
+        selector, verifier = self.token_manager.split_refresh_token(refresh_token)
+
+        session = await self.queries.fetchrow(self.db, "session_by_selector", selector, datetime.utcnow())
+
+        if session:
+            if self.token_manager.verify_refresh_token(verifier, session['refresh_token_hash']):
+                return session
+            return None
+
+        owner = self._legacy_owner(refresh_token, access_token)
+        if owner:
+            return await self._migrate_legacy_session_async(refresh_token, selector, verifier, owner)
+
+        return None
+
+    async def _migrate_legacy_session_async(self, refresh_token: str, selector: str, verifier: str, user_id: str) -> Optional[Dict]:
+        sessions = await self.queries.fetch(self.db, "legacy_sessions", user_id, datetime.utcnow())
+
+        for session in sessions:
+            if await self.password_manager.run_blocking(
+                self.token_manager.verify_legacy_refresh_token, refresh_token, session['refresh_token_hash']
+            ):
+                await self.queries.execute(
+                    self.db, "rekey_legacy_session",
+                    selector, self.token_manager.hash_refresh_verifier(verifier), session['id']
+                )
+                metrics.inc("legacy_refresh_lookups_total", ("migrated",))
+                return session
+
+        metrics.inc("legacy_refresh_lookups_total", ("not_found",))
+        return None
+
+    async def _log_failed_login_async(self, user_id, ip_address, user_agent, reason):
+        await self.audit_log.record("login", "failed", user_id, ip_address, user_agent, {"reason": reason})
+
+    #helpers shared by the sync and async paths
+
+    def _legacy_owner(self, refresh_token:str, access_token:Optional[str]) -> Optional[str]:
+        """
+        the user whose sessions a legacy refresh token is matched against,
+        taken from the access token the client holds alongside it, None
+        when the token isn't legacy or there is nothing to match it with
+        """
+        if not settings.LEGACY_REFRESH_TOKENS or not self.token_manager.is_legacy_refresh_token(refresh_token):
+            return None
+        user_id = self.token_manager.token_owner(access_token) if access_token else None
+        if user_id is None:
+            metrics.inc("legacy_refresh_lookups_total", ("no_access_token",))
+            return None
+        allowed, _ = legacy_refresh_limiter.is_allowed(f"legacy_refresh_{user_id}")
+        if not allowed:
+            metrics.inc("legacy_refresh_lookups_total", ("rate_limited",))
+            return None
+        return user_id
+
+    def _validate_registration(self, email:str, username:str, password:str) -> Optional[str]:
+        if not is_valid_email(email=email):
+            return "Invalid email format"
+
+        if not is_valid_username(username=username):
+            return "Username must be 3-50 alphanumeric characters"
+
+        is_strong, msg = self.password_manager.validate_strength(password)
+        if not is_strong:
+            return msg
+
+        return None
+
+    def _cache_user(self, login:str, user):
+        if user:
+            self.user_cache.put(user)
+        else:
+            self.user_cache.put_missing(login)
+
+    @staticmethod
+    def _new_user_keys(email:str, username:str) -> tuple:
+        return f"login:{email.lower()}", f"login:{username.lower()}"
+
+    def _record_rehash(self, user, new_hash:Optional[str]) -> tuple:
+        """write a new hash through to the cache, returns the keys other workers must drop"""
+        if not new_hash:
+            return ()
+        self.user_cache.update(user['id'], password_hash=new_hash)
+        #a stale hash elsewhere still verifies, it would just be rehashed again
+        return (f"user:{user['id']}",)
+
+    @staticmethod
+    def _locked_message(seconds:int) -> str:
+        return f"Account locked. Try again in {math.ceil(seconds / 60)} minutes"
+
+    @staticmethod
+    def _session_stale(session) -> bool:
+        last_used_at = session['last_used_at']
+        return last_used_at is None or (datetime.utcnow() - last_used_at).total_seconds() >= settings.SESSION_TOUCH_INTERVAL
+
+    @staticmethod
+    def _refresh_response(access_token:str, refresh_token:Optional[str]) -> Dict:
+        tokens = {"access_token": access_token}
+        if refresh_token:
+            tokens["refresh_token"] = refresh_token
+        return tokens
+
+    def _token_response(self, user, refresh_token:str) -> Dict:
+        selector, _ = self.token_manager.split_refresh_token(refresh_token)
+        with metrics.span("jwt_sign"):
+            access_token = self.token_manager.create_access_token(
+                str(user['id']), user['email'], user['username'], self.token_manager.session_id(selector)
+            )
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+            "expires_in": 900
+        }
+
+    @staticmethod
+    def _device_info(ip_address, user_agent) -> str:
+        return json.dumps({"ip": ip_address, "user_agent": user_agent})
@@ -0,0 +1,321 @@
+import asyncio
+import csv
+import io
+import json
+import re
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.config import settings
+from app.services.password_manager import PasswordManager
+from app.utils.validators import validate_emails, validate_usernames, check_passwords
+
+
+BCRYPT_HASH = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+
+EXPORT_COLUMNS = ("id", "email", "username", "is_verified", "is_active", "created_at")
+
+
+def read_rows(lines:Iterable[str], fmt:str) -> Iterator[Tuple[int, Dict]]:
+    """(line number, row) pairs from CSV with a header row or from JSONL"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, {"_error": f"invalid JSON: {e}"}
+            continue
+        yield line_no, row if isinstance(row, dict) else {"_error": "expected a JSON object"}
+
+
+def batched(rows:Iterable, size:int) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _hash_chunk(manager:PasswordManager, passwords:List[str]) -> List[str]:
+    #runs in a worker process, one pickle of the manager per chunk
+    return [manager.hash_password(password) for password in passwords]
+
+
+class BulkUserImporter:
+    """
+    loads users in batches: validate, skip the ones that already exist,
+    hash plaintext passwords across an executor (a process pool in practice),
+    then COPY the batch into a temp table and move it into users with
+    ON CONFLICT DO NOTHING so a concurrent signup only fails its own row,
+    rows may carry a password (hashed here) or an existing bcrypt hash
+    (stored as-is), every rejected row is reported with its line number
+    """
+
+    def __init__(
+        self,
+        conn,
+        password_manager:PasswordManager,
+        executor:Executor,
+        workers:int,
+        batch_size:int=1000,
+        max_errors:int=1000,
+        on_error:Optional[Callable[[Dict], None]]=None
+    ):
+        self.conn = conn
+        self.password_manager = password_manager
+        self.executor = executor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.on_error = on_error
+
+        self.report = {"rows": 0, "imported": 0, "failed": 0, "batches": 0, "errors": []}
+
+    def _error(self, line_no:int, row:Dict, message:str):
+        error = {"line": line_no, "email": row.get("email"), "username": row.get("username"), "error": message}
+        self.report["failed"] += 1
+        if len(self.report["errors"]) < self.max_errors:
+            self.report["errors"].append(error)
+        if self.on_error:
+            self.on_error(error)
+
+    def _validate(self, batch:List[Tuple[int, Dict]]) -> List[Dict]:
+        """normalize a batch and check it column by column with the batch validators"""
+        rows = []
+        for line_no, row in batch:
+            if "_error" in row:
+                self._error(line_no, row, row["_error"])
+                continue
+            rows.append({
+                "line": line_no,
+                "email": (row.get("email") or "").strip().lower(),
+                "username": (row.get("username") or "").strip().lower(),
+                "password": row.get("password") or None,
+                "password_hash": row.get("password_hash") or None,
+                "is_verified": str(row.get("is_verified", "")).strip().lower() in ("1", "true", "yes"),
+            })
+
+        emails_ok = validate_emails([r["email"] for r in rows])
+        usernames_ok = validate_usernames([r["username"] for r in rows])
+        plaintext = [r for r in rows if not r["password_hash"] and r["password"]]
+        weak = dict(zip(map(id, plaintext), check_passwords([r["password"] for r in plaintext])))
+
+        valid = []
+        for row, email_ok, username_ok in zip(rows, emails_ok, usernames_ok):
+            if not email_ok:
+                self._error(row["line"], row, "Invalid email format")
+            elif not username_ok:
+                self._error(row["line"], row, "Username must be 3-50 alphanumeric characters")
+            elif row["password_hash"]:
+                if BCRYPT_HASH.match(row["password_hash"]):
+                    valid.append(row)
+                else:
+                    self._error(row["line"], row, "password_hash is not a bcrypt hash")
+            elif not row["password"]:
+                self._error(row["line"], row, "password or password_hash is required")
+            elif weak[id(row)]:
+                self._error(row["line"], row, weak[id(row)])
+            else:
+                valid.append(row)
+        return valid
+
+    def _candidates(self, batch:List[Tuple[int, Dict]]) -> List[Dict]:
+        """the valid rows of a batch, minus repeats of an email or username within the import"""
+        candidates, emails, usernames = [], set(), set()
+        for candidate in self._validate(batch):
+            if candidate["email"] in emails or candidate["username"] in usernames:
+                self._error(candidate["line"], candidate, "duplicate in import")
+                continue
+            emails.add(candidate["email"])
+            usernames.add(candidate["username"])
+            candidates.append(candidate)
+        return candidates
+
+    async def _existing(self, candidates:List[Dict]) -> Tuple[set, set]:
+        rows = await self.conn.fetch("""
+            SELECT email, username FROM users
+            WHERE email = ANY($1::VARCHAR[]) OR username = ANY($2::VARCHAR[])
+        """, [c["email"] for c in candidates], [c["username"] for c in candidates])
+        return {r["email"] for r in rows}, {r["username"] for r in rows}
+
+    async def _hash(self, candidates:List[Dict]):
+        pending = [c for c in candidates if not c["password_hash"]]
+        if not pending:
+            return
+
+        loop = asyncio.get_running_loop()
+        chunk = max(1, -(-len(pending) // self.workers))
+        chunks = [pending[i:i + chunk] for i in range(0, len(pending), chunk)]
+        hashed = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _hash_chunk, self.password_manager, [c["password"] for c in part])
+            for part in chunks
+        ))
+        for part, hashes in zip(chunks, hashed):
+            for candidate, password_hash in zip(part, hashes):
+                candidate["password_hash"] = password_hash
+
+    async def _load(self, candidates:List[Dict]) -> set:
+        """COPY the batch in, returns the emails that were actually inserted"""
+        async with self.conn.transaction():
+            await self.conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS users_import (
+                    email VARCHAR(255),
+                    username VARCHAR(50),
+                    password_hash VARCHAR(255),
+                    is_verified BOOLEAN
+                ) ON COMMIT DELETE ROWS
+            """)
+            await self.conn.copy_records_to_table(
+                "users_import",
+                records=[(c["email"], c["username"], c["password_hash"], c["is_verified"]) for c in candidates],
+                columns=("email", "username", "password_hash", "is_verified")
+            )
+            rows = await self.conn.fetch("""
+                INSERT INTO users (email, username, password_hash, is_verified)
+                SELECT email, username, password_hash, is_verified FROM users_import
+                ON CONFLICT DO NOTHING
+                RETURNING email
+            """)
+        return {r["email"] for r in rows}
+
+    async def import_batch(self, batch:List[Tuple[int, Dict]]):
+        self.report["rows"] += len(batch)
+        self.report["batches"] += 1
+
+        #validation is pure python over the whole batch, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(None, self._candidates, batch)
+        if not candidates:
+            return
+
+        #drop existing users before paying for their hashes
+        taken_emails, taken_usernames = await self._existing(candidates)
+        fresh = []
+        for candidate in candidates:
+            if candidate["email"] in taken_emails or candidate["username"] in taken_usernames:
+                self._error(candidate["line"], candidate, "User Already exists")
+            else:
+                fresh.append(candidate)
+
+        if not fresh:
+            return
+
+        await self._hash(fresh)
+        inserted = await self._load(fresh)
+        for candidate in fresh:
+            if candidate["email"] not in inserted:
+                self._error(candidate["line"], candidate, "User Already exists")
+        self.report["imported"] += len(inserted)
+
+    async def run(self, rows:Iterable[Tuple[int, Dict]]) -> Dict:
+        #rows is usually a parser over a file, each batch is read in a thread
+        loop = asyncio.get_running_loop()
+        batches = batched(rows, self.batch_size)
+        while True:
+            batch = await loop.run_in_executor(None, next, batches, None)
+            if batch is None:
+                return self.report
+            await self.import_batch(batch)
+
+
+async def export_users(conn, fmt:str="jsonl", include_hashes:bool=False, batch_size:int=1000) -> AsyncIterator[str]:
+    """stream the users table through a server-side cursor, batch_size rows at a time, in heap order"""
+    columns = EXPORT_COLUMNS + (("password_hash",) if include_hashes else ())
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    async with conn.transaction():
+        cursor = conn.cursor(f"SELECT {', '.join(columns)} FROM users", prefetch=batch_size)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+        async for row in cursor:
+            if fmt == "csv":
+                writer.writerow([row[c] for c in columns])
+            else:
+                buffer.write(json.dumps({c: row[c] for c in columns}, default=str) + "\n")
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from concurrent.futures import ProcessPoolExecutor
+    from app.async_database import async_db
+
+    parser = argparse.ArgumentParser(description="bulk import or export users")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importing = commands.add_parser("import", help="load users from a CSV or JSONL file")
+    importing.add_argument("path")
+    importing.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    importing.add_argument("--errors", help="write every rejected row here as JSONL")
+    importing.add_argument("--batch-size", type=int, default=settings.BULK_IMPORT_BATCH_SIZE)
+    importing.add_argument("--workers", type=int, default=settings.BULK_IMPORT_HASH_WORKERS)
+
+    exporting = commands.add_parser("export", help="stream users to a CSV or JSONL file")
+    exporting.add_argument("path", help="output file, - for stdout")
+    exporting.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+    exporting.add_argument("--include-hashes", action="store_true")
+
+    args = parser.parse_args()
+
+    async def run_import():
+        fmt = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+        errors_file = open(args.errors, "w") if args.errors else None
+        on_error = (lambda error: errors_file.write(json.dumps(error) + "\n")) if errors_file else None
+
+        conn = await async_db.checkout()
+        try:
+            with open(args.path, newline="") as source, ProcessPoolExecutor(max_workers=args.workers) as executor:
+                importer = BulkUserImporter(
+                    conn, PasswordManager(), executor, args.workers,
+                    batch_size=args.batch_size, max_errors=0, on_error=on_error
+                )
+                for batch in batched(read_rows(source, fmt), args.batch_size):
+                    await importer.import_batch(batch)
+                    report = importer.report
+                    print(f"{report['rows']} rows, {report['imported']} imported, {report['failed']} failed", file=sys.stderr)
+        finally:
+            await async_db.release(conn)
+            await async_db.disconnect()
+            if errors_file:
+                errors_file.close()
+
+        report = {k: v for k, v in importer.report.items() if k != "errors"}
+        print(json.dumps(report))
+
+    async def run_export():
+        out = sys.stdout if args.path == "-" else open(args.path, "w", newline="")
+        conn = await async_db.checkout()
+        try:
+            async for chunk in export_users(conn, args.format, args.include_hashes):
+                out.write(chunk)
+        finally:
+            await async_db.release(conn)
+            await async_db.disconnect()
+            if out is not sys.stdout:
+                out.close()
+
+    asyncio.run(run_import() if args.command == "import" else run_export())
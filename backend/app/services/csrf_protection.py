@@ -1,55 +1,170 @@
-from datetime import datetime
+import base64
 import hmac
 import hashlib
+import json
+import os
+import struct
+import time
+from typing import Dict, Iterable, Optional, Sequence
 
 class CSRFProtection:
     """
     CSRF token generation and validation
+
+    a token is base64url(timestamp | nonce | mac) with mac a truncated
+    HMAC-SHA256 over (session id, timestamp, nonce), the keyed HMAC state
+    for every secret is built once and copied per call, tokens signed with
+    a previous secret keep validating until they expire so the secret can
+    be rotated without logging anyone out
     """
-    
-    def __init__(self, secret_key: str):
-        self.secret_key = secret_key
-    
-    def generate_token(self, session_id: str) -> str:
+
+    NONCE_BYTES = 8
+    MAC_BYTES = 16
+    _PAYLOAD = struct.Struct(">I")
+    TOKEN_BYTES = _PAYLOAD.size + NONCE_BYTES + MAC_BYTES
+
+    def __init__(self, secret_key: str, previous_keys: Sequence[str] = (), max_age: int = 3600):
+        self.max_age = max_age
+        #current secret first, it signs, the rest only verify
+        self._bases = [
+            hmac.new(key.encode(), digestmod=hashlib.sha256)
+            for key in (secret_key, *previous_keys) if key
+        ]
+
+    def _mac(self, base, session_id: bytes, payload: bytes) -> bytes:
+        mac = base.copy()
+        mac.update(session_id)
+        mac.update(payload)
+        return mac.digest()[:self.MAC_BYTES]
+
+    def generate_token(self, session_id: str = "") -> str:
         """Generate CSRF token"""
-        timestamp = str(int(datetime.utcnow().timestamp()))
-        message = f"{session_id}:{timestamp}"
-        
-        signature = hmac.new(
-            self.secret_key.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        return f"{message}:{signature}"
-    
-    def validate_token(self, token: str, session_id: str, max_age: int = 3600) -> bool:
+        payload = self._PAYLOAD.pack(int(time.time())) + os.urandom(self.NONCE_BYTES)
+        raw = payload + self._mac(self._bases[0], session_id.encode(), payload)
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    def validate_token(self, token: str, session_id: str = "", max_age: Optional[int] = None) -> bool:
         """Validate CSRF token"""
         try:
-            parts = token.split(":")
-            if len(parts) != 3:
-                return False
-            
-            token_session_id, timestamp, signature = parts
-            
-            # Verify session ID matches
-            if token_session_id != session_id:
-                return False
-            
-            # Verify not expired
-            token_time = int(timestamp)
-            if datetime.utcnow().timestamp() - token_time > max_age:
-                return False
-            
-            # Verify signature
-            message = f"{token_session_id}:{timestamp}"
-            expected_signature = hmac.new(
-                self.secret_key.encode(),
-                message.encode(),
-                hashlib.sha256
-            ).hexdigest()
-            
-            return hmac.compare_digest(signature, expected_signature)
-        
-        except Exception:
-            return False
\ No newline at end of file
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            return False
+        if len(raw) != self.TOKEN_BYTES:
+            return False
+
+        payload, mac = raw[:-self.MAC_BYTES], raw[-self.MAC_BYTES:]
+        issued_at, = self._PAYLOAD.unpack_from(payload)
+        if time.time() - issued_at > (max_age if max_age is not None else self.max_age):
+            return False
+
+        session = session_id.encode()
+        for base in self._bases:
+            if hmac.compare_digest(mac, self._mac(base, session, payload)):
+                return True
+        return False
+
+
+class CSRFMiddleware:
+    """
+    double-submit cookie check for cookie-authenticated, state-changing requests
+
+    only requests carrying one of auth_cookies are checked, anything else
+    can't ride on ambient credentials and passes through untouched: safe
+    requests without a valid token cookie get one (readable by the frontend,
+    SameSite=Strict), unsafe requests must echo the cookie value in the CSRF
+    header and the token must verify, requests authenticated with an
+    Authorization header can't be forged cross-site and skip the check
+    """
+
+    SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "TRACE"))
+
+    def __init__(
+        self,
+        app,
+        protection: CSRFProtection,
+        cookie_name: str = "csrf_token",
+        header_name: str = "x-csrf-token",
+        secure: bool = True,
+        exempt_paths: Iterable[str] = (),
+        auth_cookies: Iterable[str] = ()
+    ):
+        self.app = app
+        self.protection = protection
+        self.cookie_name = cookie_name
+        self.header_name = header_name.lower().encode()
+        self.exempt_paths = tuple(exempt_paths)
+        self.auth_cookies = frozenset(auth_cookies)
+        attributes = f"Path=/; Max-Age={protection.max_age}; SameSite=Strict"
+        if secure:
+            attributes += "; Secure"
+        self._cookie_attributes = attributes
+        self._rejection = json.dumps({"detail": "CSRF token missing or invalid"}).encode()
+
+    @staticmethod
+    def _cookies(cookie_header: bytes) -> Dict[str, str]:
+        cookies = {}
+        for part in cookie_header.decode("latin-1").split(";"):
+            name, _, value = part.strip().partition("=")
+            cookies.setdefault(name, value)
+        return cookies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.auth_cookies or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        cookie_header = authorization = submitted = None
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookie_header = value
+            elif name == b"authorization":
+                authorization = value
+            elif name == self.header_name:
+                submitted = value
+
+        cookies = self._cookies(cookie_header) if cookie_header else {}
+        if self.auth_cookies.isdisjoint(cookies):
+            #no ambient credentials, nothing to forge and no token to hand out
+            await self.app(scope, receive, send)
+            return
+
+        token = cookies.get(self.cookie_name)
+
+        if scope["method"] in self.SAFE_METHODS:
+            if token and self.protection.validate_token(token):
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, self._issuing(send))
+            return
+
+        if authorization is None:
+            if not (
+                token
+                and submitted
+                and hmac.compare_digest(submitted, token.encode())
+                and self.protection.validate_token(token)
+            ):
+                await self._reject(send)
+                return
+
+        await self.app(scope, receive, send)
+
+    def _issuing(self, send):
+        cookie = f"{self.cookie_name}={self.protection.generate_token()}; {self._cookie_attributes}".encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie)]
+            await send(message)
+        return send_with_cookie
+
+    async def _reject(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(self._rejection)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": self._rejection})
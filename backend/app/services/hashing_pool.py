@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict
+from app.config import settings
+
+
+class HashingQueueFullError(Exception):
+    """raised when the hashing pool already has queue_size jobs waiting"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class HashingPool:
+    """
+    dedicated executor for bcrypt work with a bounded queue
+
+    keeps password hashing off the event loop and off the default threadpool,
+    so a flood of logins can't starve cheap endpoints like /auth/me, once
+    workers + queue_size jobs are in flight new work is rejected straight away
+    """
+
+    def __init__(self, workers: int, queue_size: int, mode: str = "thread", retry_after: int = 1):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.mode = mode
+        self.retry_after = retry_after
+        self._executor = None
+
+        #only touched from the event loop thread
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                #bcrypt releases the GIL so threads scale with cores
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, func, *args):
+        if self._pending >= self.capacity:
+            self._rejected += 1
+            raise HashingQueueFullError(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        self._pending += 1
+        future.add_done_callback(self._finished)
+        #a cancelled caller (client gone) must not cancel the bookkeeping, the job
+        #keeps its worker until it is done, so it stays counted against capacity
+        return await asyncio.shield(future)
+
+    def _finished(self, future):
+        self._pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            self._failed += 1
+        else:
+            self._completed += 1
+
+    def queue_depth(self) -> int:
+        return max(self._pending - self.workers, 0)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._pending,
+            "queued": self.queue_depth(),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+    mode=settings.PASSWORD_HASH_EXECUTOR,
+    retry_after=settings.PASSWORD_HASH_RETRY_AFTER,
+)
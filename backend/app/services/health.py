@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict
+from app.config import settings
+from app.async_database import async_db
+from app.services.hashing_pool import hashing_pool
+
+
+class HealthMonitor:
+    """
+    readiness computed in the background and served from a cache
+
+    a task probes the database (SELECT 1 through the pool), pool saturation
+    and hashing queue depth every interval seconds, /health/ready only reads
+    the last result so orchestrator probes never reach postgres, a result
+    older than ttl counts as not ready so a stuck probe loop can't keep a
+    dead pod in rotation
+    """
+
+    def __init__(
+        self,
+        database,
+        hashing,
+        interval:float,
+        ttl:float,
+        probe_timeout:float,
+        max_pool_saturation:float,
+        max_hashing_queue:int
+    ):
+        self.database = database
+        self.hashing = hashing
+        self.interval = interval
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.max_pool_saturation = max_pool_saturation
+        self.max_hashing_queue = max_hashing_queue
+        self._task = None
+
+        self._result = None
+        self._checked_at = 0.0
+
+    async def _ping_database(self):
+        conn = await self.database.checkout()
+        try:
+            await conn.fetchval("SELECT 1")
+        finally:
+            await self.database.release(conn)
+
+    async def probe(self) -> Dict:
+        checks = {}
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._ping_database(), self.probe_timeout)
+            checks["database"] = {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as e:
+            checks["database"] = {"ok": False, "error": str(e) or type(e).__name__}
+
+        saturation = self.database.pool_stats()["saturation"]
+        checks["pool"] = {"ok": saturation < self.max_pool_saturation, "saturation": saturation}
+
+        queued = self.hashing.queue_depth()
+        checks["hashing"] = {"ok": queued < self.max_hashing_queue, "queued": queued}
+
+        self._result = {
+            "ready": all(check["ok"] for check in checks.values()),
+            "checks": checks,
+            "checked_at": datetime.utcnow().isoformat(),
+        }
+        self._checked_at = time.monotonic()
+        return self._result
+
+    def readiness(self) -> Dict:
+        """the cached probe result, never touches the database"""
+        if self._result is None:
+            return {"ready": False, "reason": "not probed yet"}
+
+        age = time.monotonic() - self._checked_at
+        if age > self.ttl:
+            return {**self._result, "ready": False, "reason": f"probe result is {age:.1f}s old"}
+        return {**self._result, "age_seconds": round(age, 3)}
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                print(f"health probe failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+health_monitor = HealthMonitor(
+    async_db,
+    hashing_pool,
+    interval=settings.HEALTH_PROBE_INTERVAL,
+    ttl=settings.HEALTH_PROBE_TTL,
+    probe_timeout=settings.HEALTH_PROBE_TIMEOUT,
+    max_pool_saturation=settings.HEALTH_MAX_POOL_SATURATION,
+    max_hashing_queue=settings.HEALTH_MAX_HASHING_QUEUE or hashing_pool.queue_size,
+)
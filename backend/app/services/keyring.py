@@ -0,0 +1,181 @@
+import asyncio
+import fcntl
+import os
+import secrets
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+
+class SigningKey:
+    """a parsed, kid-tagged signing key, built once and reused for every token"""
+
+    def __init__(self, kid:str, algorithm:str, private_key, created_at:float):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.created_at = created_at
+
+    def to_jwk(self) -> Dict:
+        from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+        if self.algorithm == "EdDSA":
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            jwk = ECAlgorithm.to_jwk(self.public_key, as_dict=True)
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+
+class KeyRing:
+    """
+    asymmetric signing keys for access tokens (EdDSA or ES256)
+
+    keys live in keys_dir as <created_unix>-<kid>.pem so every worker and
+    node sharing the directory sees the same ring, a new key is generated
+    once the active one is older than rotation_days and only starts signing
+    publish_ahead seconds later, so verifiers caching the JWKS have already
+    seen it, the newest `retained` keys stay published for verification,
+    without a keys_dir a single in-memory key is used (development only)
+    """
+
+    def __init__(
+        self,
+        algorithm:str,
+        keys_dir:str="",
+        rotation_days:float=30,
+        publish_ahead:float=3600,
+        retained:int=3,
+        check_interval:float=300
+    ):
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self.rotation_seconds = rotation_days * 86400
+        self.publish_ahead = publish_ahead
+        self.retained = retained
+        self.check_interval = check_interval
+        self._task = None
+
+        self._keys: Dict[str, SigningKey] = {}
+        self._active: Optional[SigningKey] = None
+        self._jwks: Dict = {"keys": []}
+        self._lock = Lock()
+
+        if keys_dir:
+            os.makedirs(keys_dir, mode=0o700, exist_ok=True)
+            self.rotate_if_due()
+        else:
+            print("keyring: no JWT_KEYS_DIR set, using an ephemeral in-memory key")
+            key = self._new_key()
+            self._install([key])
+
+    def _new_key(self) -> SigningKey:
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+        if self.algorithm == "EdDSA":
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            private_key = ec.generate_private_key(ec.SECP256R1())
+        return SigningKey(secrets.token_urlsafe(8), self.algorithm, private_key, time.time())
+
+    def _install(self, keys:List[SigningKey]):
+        #newest first, the active key is the newest one past its publish window
+        keys = sorted(keys, key=lambda k: k.created_at, reverse=True)[:self.retained]
+        now = time.time()
+        active = next((k for k in keys if now - k.created_at >= self.publish_ahead), keys[-1])
+
+        with self._lock:
+            self._keys = {k.kid: k for k in keys}
+            self._active = active
+            self._jwks = {"keys": [k.to_jwk() for k in keys]}
+
+    def reload(self):
+        """pick up keys written by other workers, only new files are parsed"""
+        if not self.keys_dir:
+            return
+
+        keys = []
+        for name in os.listdir(self.keys_dir):
+            if not name.endswith(".pem"):
+                continue
+            created, _, kid = name[:-4].partition("-")
+            key = self._keys.get(kid)
+            if key is None:
+                from cryptography.hazmat.primitives import serialization
+                with open(os.path.join(self.keys_dir, name), "rb") as f:
+                    private_key = serialization.load_pem_private_key(f.read(), password=None)
+                key = SigningKey(kid, self.algorithm, private_key, float(created))
+            keys.append(key)
+
+        if keys:
+            self._install(keys)
+
+    def rotate_if_due(self):
+        """generate the next key when the newest one is older than the rotation period"""
+        if not self.keys_dir:
+            return
+
+        lock_path = os.path.join(self.keys_dir, ".lock")
+        with open(lock_path, "w") as lock_file:
+            #one worker generates, the others just reload what it wrote
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.reload()
+
+            newest = max(self._keys.values(), key=lambda k: k.created_at, default=None)
+            if newest is None or time.time() - newest.created_at >= self.rotation_seconds:
+                self._write(self._new_key())
+                self._prune()
+                self.reload()
+
+    def _write(self, key:SigningKey):
+        from cryptography.hazmat.primitives import serialization
+        pem = key.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        path = os.path.join(self.keys_dir, f"{int(key.created_at)}-{key.kid}.pem")
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        os.replace(tmp_path, path)
+
+    def _prune(self):
+        names = sorted(
+            (n for n in os.listdir(self.keys_dir) if n.endswith(".pem")),
+            key=lambda n: float(n.partition("-")[0]),
+            reverse=True
+        )
+        for name in names[self.retained:]:
+            os.remove(os.path.join(self.keys_dir, name))
+
+    async def start(self):
+        if self.keys_dir and not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await loop.run_in_executor(None, self.rotate_if_due)
+            except Exception as e:
+                print(f"keyring rotation failed: {e}")
+
+    def active(self) -> SigningKey:
+        return self._active
+
+    def get(self, kid:str) -> Optional[SigningKey]:
+        return self._keys.get(kid)
+
+    def jwks(self) -> Dict:
+        return self._jwks
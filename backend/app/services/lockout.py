@@ -0,0 +1,141 @@
+import math
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.lockout_stores import MemoryLockoutStore, SharedLockoutStore, PostgresLockoutStore
+
+
+class LoginLockout:
+    """
+    failed login tracking with exponential backoff, kept off the users row
+
+    failures are counted per account and per client IP, each with its own
+    threshold, reaching it locks that key for base_seconds, doubling with
+    every further lockout up to max_seconds, the store does the whole
+    increment-and-check atomically in one call, see lockout_stores
+    """
+
+    def __init__(
+        self,
+        store,
+        account_threshold:int=5,
+        ip_threshold:int=20,
+        base_seconds:float=60,
+        max_seconds:float=3600,
+        reset_seconds:float=3600
+    ):
+        self.store = store
+        self.account_threshold = account_threshold
+        self.ip_threshold = ip_threshold
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.reset_seconds = reset_seconds
+
+        self._checks = 0
+        self._blocked = 0
+        self._failures = 0
+        self._lockouts = 0
+        self._resets = 0
+
+    @staticmethod
+    def _account_key(user_id) -> str:
+        return f"account:{user_id}"
+
+    def _keys(self, user_id, ip_address:Optional[str]) -> List[Tuple[str, int]]:
+        #account first, stores count keys in this order
+        keys = []
+        if user_id is not None:
+            keys.append((self._account_key(user_id), self.account_threshold))
+        if ip_address and self.ip_threshold > 0:
+            keys.append((f"ip:{ip_address}", self.ip_threshold))
+        return keys
+
+    def _checked(self, user_id, live:Dict[str, float]) -> Tuple[int, bool]:
+        self._checks += 1
+        remaining = math.ceil(max(live.values(), default=0))
+        if remaining:
+            self._blocked += 1
+        return remaining, self._account_key(user_id) in live
+
+    def _failed(self, locked_for:float) -> int:
+        self._failures += 1
+        if locked_for:
+            self._lockouts += 1
+        return math.ceil(locked_for)
+
+    async def check(self, conn, user_id, ip_address:Optional[str]) -> Tuple[int, bool]:
+        """(seconds locked, 0 when allowed, whether the account has failures to reset)"""
+        keys = [key for key, _ in self._keys(user_id, ip_address)]
+        if not keys:
+            return 0, False
+        live = self.store.check(conn, keys)
+        if self.store.is_async:
+            live = await live
+        return self._checked(user_id, live)
+
+    async def failed(self, conn, user_id, ip_address:Optional[str]) -> int:
+        """count a failed login, returns the seconds it locked the account or IP for"""
+        keys = self._keys(user_id, ip_address)
+        if not keys:
+            return 0
+        locked_for = self.store.fail(conn, keys, self.base_seconds, self.max_seconds, self.reset_seconds)
+        if self.store.is_async:
+            locked_for = await locked_for
+        return self._failed(locked_for)
+
+    async def succeeded(self, conn, user_id):
+        """clear the account's streak, the IP keeps its count"""
+        self._resets += 1
+        reset = self.store.reset(conn, self._account_key(user_id))
+        if self.store.is_async:
+            await reset
+
+    #sync variants for the psycopg2 AuthService methods
+
+    def check_sync(self, conn, user_id, ip_address:Optional[str]) -> Tuple[int, bool]:
+        keys = [key for key, _ in self._keys(user_id, ip_address)]
+        if not keys:
+            return 0, False
+        check = self.store.check_sync if self.store.is_async else self.store.check
+        return self._checked(user_id, check(conn, keys))
+
+    def failed_sync(self, conn, user_id, ip_address:Optional[str]) -> int:
+        keys = self._keys(user_id, ip_address)
+        if not keys:
+            return 0
+        fail = self.store.fail_sync if self.store.is_async else self.store.fail
+        return self._failed(fail(conn, keys, self.base_seconds, self.max_seconds, self.reset_seconds))
+
+    def succeeded_sync(self, conn, user_id):
+        self._resets += 1
+        reset = self.store.reset_sync if self.store.is_async else self.store.reset
+        reset(conn, self._account_key(user_id))
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.store).__name__,
+            "keys": self.store.key_count(),
+            "checks": self._checks,
+            "blocked": self._blocked,
+            "failures": self._failures,
+            "lockouts": self._lockouts,
+            "resets": self._resets,
+        }
+
+
+def create_store(backend:str):
+    #"postgres" spans nodes, "shared" spans workers on one host, "memory" is per process
+    if backend == "shared":
+        return SharedLockoutStore(settings.LOCKOUT_SHARED_PATH, slots=settings.LOCKOUT_MAX_KEYS)
+    if backend == "memory":
+        return MemoryLockoutStore(max_keys=settings.LOCKOUT_MAX_KEYS)
+    return PostgresLockoutStore()
+
+
+login_lockout = LoginLockout(
+    create_store(settings.LOCKOUT_BACKEND),
+    account_threshold=settings.LOCKOUT_ACCOUNT_THRESHOLD,
+    ip_threshold=settings.LOCKOUT_IP_THRESHOLD,
+    base_seconds=settings.LOCKOUT_BASE_SECONDS,
+    max_seconds=settings.LOCKOUT_MAX_SECONDS,
+    reset_seconds=settings.LOCKOUT_RESET_SECONDS,
+)
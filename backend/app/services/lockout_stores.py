@@ -0,0 +1,203 @@
+import struct
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from app.services.query_registry import query_registry
+from app.services.rate_limit_stores import SharedSlotTable
+
+
+query_registry.register_many({
+    #live state per key, remaining is 0 for a key that has failures but no lock
+    "lockout_check": """
+        SELECT key, GREATEST(EXTRACT(EPOCH FROM locked_until - (NOW() AT TIME ZONE 'UTC')), 0) AS remaining
+        FROM login_lockouts
+        WHERE key = ANY($1::VARCHAR[]) AND expires_at > NOW() AT TIME ZONE 'UTC'
+    """,
+    #keys are counted in the order given, always account before ip, so two
+    #requests never lock the same pair of rows in opposite orders
+    "lockout_fail": """
+        SELECT COALESCE(MAX(record_login_failure(key, threshold, $3, $4, $5)), 0)
+        FROM unnest($1::VARCHAR[], $2::INTEGER[]) AS failure(key, threshold)
+    """,
+    "lockout_reset": """
+        DELETE FROM login_lockouts WHERE key = $1
+    """,
+})
+
+#doubling stops here, the max duration caps it long before anyway
+MAX_DOUBLINGS = 32
+
+
+def lockout_fail(
+    state:list,
+    now:float,
+    threshold:int,
+    base:float,
+    max_duration:float,
+    reset_after:float
+) -> float:
+    """
+    count a failure on state = [expires_at, locked_until, failures, lockouts]
+
+    mutates state in place, reaching threshold locks the key for base seconds
+    doubled for every earlier lockout (capped at max_duration) and starts a
+    new streak, state is forgotten reset_after seconds after the last failure
+    or once the lock ends, whichever is later, returns the seconds the key is
+    locked for, 0 when it isn't
+    """
+    if state[0] <= now:
+        state[:] = [0.0, 0.0, 0, 0]
+
+    state[2] += 1
+    if state[2] >= threshold:
+        state[1] = now + min(base * 2 ** min(state[3], MAX_DOUBLINGS), max_duration)
+        state[2] = 0
+        state[3] += 1
+
+    state[0] = max(state[1], now + reset_after)
+    return max(state[1] - now, 0.0)
+
+
+class MemoryLockoutStore:
+    """per-process store, an LRU capped at max_keys, expired keys are dropped as new ones arrive"""
+
+    is_async = False
+
+    def __init__(self, max_keys:int=100_000):
+        self.max_keys = max_keys
+        self._keys = OrderedDict()
+        self._lock = Lock()
+
+    def check(self, conn, keys:List[str]) -> Dict[str, float]:
+        now = time.time()
+        live = {}
+        with self._lock:
+            for key in keys:
+                state = self._keys.get(key)
+                if state is not None and state[0] > now:
+                    live[key] = max(state[1] - now, 0.0)
+        return live
+
+    def fail(self, conn, failures:List[Tuple[str, int]], base:float, max_duration:float, reset_after:float) -> float:
+        now = time.time()
+        locked_for = 0.0
+        with self._lock:
+            for key, threshold in failures:
+                state = self._keys.get(key)
+                if state is None:
+                    self._evict(now)
+                    state = [0.0, 0.0, 0, 0]
+                    self._keys[key] = state
+                else:
+                    self._keys.move_to_end(key)
+                locked_for = max(locked_for, lockout_fail(state, now, threshold, base, max_duration, reset_after))
+        return locked_for
+
+    def _evict(self, now:float):
+        #least recently failed first, drop them while expired or over the cap
+        while self._keys:
+            oldest_key = next(iter(self._keys))
+            if len(self._keys) >= self.max_keys or self._keys[oldest_key][0] <= now:
+                del self._keys[oldest_key]
+            else:
+                break
+
+    def reset(self, conn, key:str):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def key_count(self) -> int:
+        return len(self._keys)
+
+
+class SharedLockoutStore(SharedSlotTable):
+    """store shared by every worker process on one host, see SharedSlotTable"""
+
+    #key hash, expires at, locked until, failures, lockouts
+    SLOT = struct.Struct("<Qddii")
+    EMPTY = (0.0, 0.0, 0, 0)
+    is_async = False
+
+    def check(self, conn, keys:List[str]) -> Dict[str, float]:
+        now = time.time()
+        live = {}
+        for key in keys:
+            key_hash = self._key_hash(key)
+            bucket = self._bucket(key_hash)
+            with self._locked(bucket):
+                slot = self._find_slot(bucket, key_hash, create=False)
+                if slot is None:
+                    continue
+                _, expires_at, locked_until, _, _ = self.SLOT.unpack_from(self._map, slot * self.SLOT.size)
+            if expires_at > now:
+                live[key] = max(locked_until - now, 0.0)
+        return live
+
+    def fail(self, conn, failures:List[Tuple[str, int]], base:float, max_duration:float, reset_after:float) -> float:
+        now = time.time()
+        locked_for = 0.0
+        for key, threshold in failures:
+            key_hash = self._key_hash(key)
+            bucket = self._bucket(key_hash)
+            with self._locked(bucket):
+                slot = self._find_slot(bucket, key_hash, create=True)
+                offset = slot * self.SLOT.size
+                state = list(self.SLOT.unpack_from(self._map, offset)[1:])
+                locked = lockout_fail(state, now, threshold, base, max_duration, reset_after)
+                self.SLOT.pack_into(self._map, offset, key_hash, *state)
+            locked_for = max(locked_for, locked)
+        return locked_for
+
+    def reset(self, conn, key:str):
+        super().reset(key)
+
+
+class PostgresLockoutStore:
+    """
+    store in the login_lockouts table, shared by every node
+
+    the table is UNLOGGED: no WAL per failed login, at the price of losing
+    the counters on a crash, the increment-and-check runs in the
+    record_login_failure function under a row lock, so it is atomic across
+    nodes, every call is one round trip on the caller's connection
+    """
+
+    is_async = True
+
+    def __init__(self, queries=query_registry):
+        self.queries = queries
+
+    async def check(self, conn, keys:List[str]) -> Dict[str, float]:
+        rows = await self.queries.fetch(conn, "lockout_check", keys)
+        return {row["key"]: float(row["remaining"]) for row in rows}
+
+    async def fail(self, conn, failures:List[Tuple[str, int]], base:float, max_duration:float, reset_after:float) -> float:
+        keys, thresholds = zip(*failures)
+        locked_for = await self.queries.fetchval(
+            conn, "lockout_fail", list(keys), list(thresholds), base, max_duration, reset_after
+        )
+        return float(locked_for)
+
+    async def reset(self, conn, key:str):
+        await self.queries.execute(conn, "lockout_reset", key)
+
+    #psycopg2 variants for the sync AuthService methods, the caller commits
+
+    def check_sync(self, conn, keys:List[str]) -> Dict[str, float]:
+        rows = self.queries.run(conn, "lockout_check", keys).fetchall()
+        return {row["key"]: float(row["remaining"]) for row in rows}
+
+    def fail_sync(self, conn, failures:List[Tuple[str, int]], base:float, max_duration:float, reset_after:float) -> float:
+        keys, thresholds = zip(*failures)
+        row = self.queries.run(
+            conn, "lockout_fail", list(keys), list(thresholds), base, max_duration, reset_after
+        ).fetchone()
+        return float(next(iter(row.values())))
+
+    def reset_sync(self, conn, key:str):
+        self.queries.run(conn, "lockout_reset", key)
+
+    def key_count(self) -> Optional[int]:
+        #would be a count(*) round trip, not worth it for a gauge
+        return None
@@ -0,0 +1,153 @@
+import asyncio
+import random
+from datetime import datetime
+from typing import Dict
+from app.config import settings
+from app.async_database import async_db
+
+
+class MaintenanceReaper:
+    """
+    periodically removes expired rows so the hot tables and their indexes stay small
+
+    every job works in batches of batch_size rows (at most max_batches per
+    run, with a short pause in between) so it never holds long locks, runs
+    are spaced by interval +/- jitter, in leader_only mode a run first takes
+    a postgres advisory lock so only one worker across the fleet does the work
+    """
+
+    ADVISORY_LOCK_KEY = 0x61757468 #"auth"
+
+    #name -> statement, $1 = now, $2 = batch size
+    JOBS = {
+        "sessions": """
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at < $1
+                LIMIT $2 FOR UPDATE SKIP LOCKED
+            )
+        """,
+        "verification_tokens": """
+            DELETE FROM verification_tokens WHERE id IN (
+                SELECT id FROM verification_tokens WHERE expires_at < $1
+                LIMIT $2 FOR UPDATE SKIP LOCKED
+            )
+        """,
+        "token_revocations": """
+            DELETE FROM token_revocations WHERE id IN (
+                SELECT id FROM token_revocations WHERE expires_at < $1
+                LIMIT $2 FOR UPDATE SKIP LOCKED
+            )
+        """,
+        #no index on expires_at, it would stop the counter updates from being HOT,
+        #the table only holds keys with recent failures
+        "login_lockouts": """
+            DELETE FROM login_lockouts WHERE key IN (
+                SELECT key FROM login_lockouts WHERE expires_at < $1
+                LIMIT $2 FOR UPDATE SKIP LOCKED
+            )
+        """,
+    }
+
+    def __init__(
+        self,
+        database,
+        interval:float,
+        jitter:float,
+        batch_size:int,
+        max_batches:int,
+        batch_pause:float,
+        leader_only:bool=True
+    ):
+        self.database = database
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.batch_pause = batch_pause
+        self.leader_only = leader_only
+        self._task = None
+
+        self._reclaimed = {name: 0 for name in self.JOBS}
+        self._runs = 0
+        self._skipped = 0
+        self._failures = 0
+        self._last_run = None
+
+    async def run_once(self) -> Dict:
+        """run every job once, returns rows reclaimed per job (None when not leader)"""
+        conn = await self.database.checkout()
+        try:
+            if self.leader_only and not await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.ADVISORY_LOCK_KEY):
+                self._skipped += 1
+                return None
+
+            try:
+                reclaimed = {}
+                for name, statement in self.JOBS.items():
+                    reclaimed[name] = await self._run_job(conn, statement)
+                    self._reclaimed[name] += reclaimed[name]
+            finally:
+                if self.leader_only:
+                    await conn.execute("SELECT pg_advisory_unlock($1)", self.ADVISORY_LOCK_KEY)
+        finally:
+            await self.database.release(conn)
+
+        self._runs += 1
+        self._last_run = {"at": datetime.utcnow().isoformat(), "reclaimed": reclaimed}
+        return reclaimed
+
+    async def _run_job(self, conn, statement:str) -> int:
+        total = 0
+        for _ in range(self.max_batches):
+            status = await conn.execute(statement, datetime.utcnow(), self.batch_size)
+            #"DELETE 42" / "UPDATE 42"
+            count = int(status.split()[-1])
+            total += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+        return total
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            #jitter keeps workers started together from hitting the database in lockstep
+            await asyncio.sleep(self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+            try:
+                await self.run_once()
+            except Exception as e:
+                self._failures += 1
+                print(f"maintenance run failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "leader_only": self.leader_only,
+            "runs": self._runs,
+            "skipped_not_leader": self._skipped,
+            "failures": self._failures,
+            "rows_reclaimed": dict(self._reclaimed),
+            "last_run": self._last_run,
+        }
+
+
+maintenance_reaper = MaintenanceReaper(
+    async_db,
+    interval=settings.MAINTENANCE_INTERVAL,
+    jitter=settings.MAINTENANCE_JITTER,
+    batch_size=settings.MAINTENANCE_BATCH_SIZE,
+    max_batches=settings.MAINTENANCE_MAX_BATCHES,
+    batch_pause=settings.MAINTENANCE_BATCH_PAUSE,
+    leader_only=settings.MAINTENANCE_LEADER_ONLY,
+)
@@ -0,0 +1,156 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+class _Shard:
+    """one thread's counters and histograms, only that thread ever writes to it"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple, float] = {}
+        self.histograms: Dict[Tuple, List] = {}
+
+
+class Metrics:
+    """
+    in-process metrics rendered in the prometheus text format
+
+    every thread records into its own shard so the hot path is a dict
+    update with no lock, shards are only summed when /metrics is scraped,
+    gauges and collectors are callbacks evaluated at scrape time so values
+    that already live elsewhere (pool usage, limiter keys) are not copied
+    """
+
+    #upper bounds in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, buckets:Iterable[float]=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        self._gauges: List[Tuple[str, Callable]] = []
+        self._collectors: List[Callable] = []
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def describe(self, name:str, kind:str, help_text:str, labels:Tuple[str, ...]=()):
+        self._help[name] = (kind, help_text, labels)
+
+    def inc(self, name:str, labels:Tuple=(), value:float=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float, labels:Tuple=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            #per bucket counts, then +Inf, sum, count
+            hist = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        hist[bisect.bisect_left(self.buckets, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    @contextmanager
+    def span(self, stage:str):
+        """time a named stage of a request into auth_stage_seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("auth_stage_seconds", time.perf_counter() - started, (stage,))
+
+    def gauge(self, name:str, help_text:str, read:Callable[[], float]):
+        self.describe(name, "gauge", help_text)
+        self._gauges.append((name, read))
+
+    def collector(self, collect:Callable[[], Iterable[str]]):
+        """register a callback returning extra exposition lines"""
+        self._collectors.append(collect)
+
+    def _merged(self):
+        counters: Dict[Tuple, float] = {}
+        histograms: Dict[Tuple, List] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            #dict.copy is atomic under the GIL, the owning thread may keep writing
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, hist in shard.histograms.copy().items():
+                merged = histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(list(hist)):
+                    merged[i] += value
+        return counters, histograms
+
+    def _header(self, lines:List[str], name:str, seen:set):
+        if name in seen or name not in self._help:
+            return
+        kind, help_text, _ = self._help[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        seen.add(name)
+
+    def _labels(self, name:str, values:Tuple, extra:str="") -> str:
+        names = self._help.get(name, ("", "", ()))[2]
+        pairs = [f'{label}="{value}"' for label, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        counters, histograms = self._merged()
+        lines: List[str] = []
+        seen = set()
+
+        for (name, labels), value in sorted(counters.items()):
+            self._header(lines, name, seen)
+            lines.append(f"{name}{self._labels(name, labels)} {value}")
+
+        for (name, labels), hist in sorted(histograms.items()):
+            self._header(lines, name, seen)
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), hist):
+                running += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{self._labels(name, labels, le)} {running}")
+            lines.append(f"{name}_sum{self._labels(name, labels)} {round(hist[-2], 6)}")
+            lines.append(f"{name}_count{self._labels(name, labels)} {hist[-1]}")
+
+        for name, read in self._gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            self._header(lines, name, seen)
+            lines.append(f"{name} {value}")
+
+        for collect in self._collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                print(f"metrics collector failed: {e}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+metrics.describe("http_requests_total", "counter", "requests handled", ("method", "route", "status"))
+metrics.describe("http_request_duration_seconds", "histogram", "request latency", ("method", "route"))
+metrics.describe("http_requests_in_flight", "gauge", "requests being handled")
+metrics.describe("auth_stage_seconds", "histogram", "time spent in each stage of an auth request", ("stage",))
@@ -1,16 +1,70 @@
+import math
+import time
 import bcrypt
+from typing import Dict
 from app.utils.validators import is_strong_password
+from app.services.hashing_pool import hashing_pool
+from app.services.metrics import metrics
+from app.config import settings
 
 class PasswordManager:
+    """
+    password hashing with a configurable scheme ("bcrypt" or "argon2id") and cost
 
-    @staticmethod
-    def hash_password(password: str)-> str:
-        salt = bcrypt.gensalt(rounds=12)
+    stored hashes carry their own scheme and parameters, so any of them can be
+    verified and needs_rehash tells login when one should be upgraded
+    """
+
+    BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+    ARGON2_PREFIX = "$argon2id$"
+    MIN_BCRYPT_ROUNDS = 10
+    MAX_BCRYPT_ROUNDS = 16
+
+    def __init__(
+        self,
+        scheme: str = None,
+        bcrypt_rounds: int = None,
+        argon2_time_cost: int = None,
+        argon2_memory_cost: int = None,
+        argon2_parallelism: int = None
+    ):
+        self.scheme = scheme or settings.PASSWORD_HASH_SCHEME
+        self.bcrypt_rounds = bcrypt_rounds or settings.BCRYPT_ROUNDS
+        self.argon2_time_cost = argon2_time_cost or settings.ARGON2_TIME_COST
+        self.argon2_memory_cost = argon2_memory_cost or settings.ARGON2_MEMORY_COST
+        self.argon2_parallelism = argon2_parallelism or settings.ARGON2_PARALLELISM
+        self._argon2 = None
+
+    def __getstate__(self):
+        #the hasher is rebuilt lazily, keeps the manager picklable for process pools
+        state = self.__dict__.copy()
+        state["_argon2"] = None
+        return state
+
+    @property
+    def argon2(self) -> "PasswordHasher":
+        if self._argon2 is None:
+            #only imported when argon2id is configured or an argon2 hash shows up
+            from argon2 import PasswordHasher
+            self._argon2 = PasswordHasher(
+                time_cost=self.argon2_time_cost,
+                memory_cost=self.argon2_memory_cost,
+                parallelism=self.argon2_parallelism
+            )
+        return self._argon2
+
+    def hash_password(self, password: str)-> str:
+        if self.scheme == "argon2id":
+            return self.argon2.hash(password)
+
+        salt = bcrypt.gensalt(rounds=self.bcrypt_rounds)
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
-    @staticmethod
-    def verify_password(password: str, hash_password: str)->bool:
+    def verify_password(self, password: str, hash_password: str)->bool:
         try:
+            if hash_password.startswith(self.ARGON2_PREFIX):
+                return self.argon2.verify(hash_password, password)
+
             return bcrypt.checkpw(
                 password.encode('utf-8'),
                 hash_password.encode('utf-8')
@@ -18,6 +72,108 @@ class PasswordManager:
         except Exception:
             return False
 
+    def needs_rehash(self, hash_password: str)-> bool:
+        """
+        true when a stored hash uses another scheme or a lower cost than configured,
+        never for a higher one, so hosts calibrated to different costs don't keep
+        rehashing the same password back and forth
+        """
+        if hash_password.startswith(self.ARGON2_PREFIX):
+            if self.scheme != "argon2id":
+                return True
+            from argon2 import extract_parameters
+            try:
+                params = extract_parameters(hash_password)
+            except Exception:
+                return True
+            return params.time_cost < self.argon2_time_cost or params.memory_cost < self.argon2_memory_cost
+
+        if hash_password.startswith(self.BCRYPT_PREFIXES):
+            return self.scheme != "bcrypt" or self.bcrypt_rounds_of(hash_password) < self.bcrypt_rounds
+
+        return True
+
+    @staticmethod
+    def bcrypt_rounds_of(hash_password: str)-> int:
+        #$2b$12$... -> 12
+        return int(hash_password.split("$")[2])
+
+    def calibrate(self, target_ms: float)-> Dict:
+        """
+        benchmark this host and set the cost so one hash (and so one verify)
+        takes about target_ms, returns the chosen parameters
+        """
+        sample = "calibration-Password-1!"
+
+        if self.scheme == "argon2id":
+            probe = PasswordManager(
+                "argon2id",
+                argon2_time_cost=1,
+                argon2_memory_cost=self.argon2_memory_cost,
+                argon2_parallelism=self.argon2_parallelism
+            )
+            elapsed = self._time_hash(probe, sample)
+            self.argon2_time_cost = max(1, int(target_ms / elapsed))
+            self._argon2 = None
+            params = {
+                "scheme": "argon2id",
+                "time_cost": self.argon2_time_cost,
+                "memory_cost": self.argon2_memory_cost,
+                "parallelism": self.argon2_parallelism,
+            }
+        else:
+            #each extra bcrypt round doubles the cost
+            probe = PasswordManager("bcrypt", bcrypt_rounds=self.MIN_BCRYPT_ROUNDS)
+            elapsed = self._time_hash(probe, sample)
+            extra = math.floor(math.log2(max(target_ms / elapsed, 1)))
+            self.bcrypt_rounds = min(self.MIN_BCRYPT_ROUNDS + extra, self.MAX_BCRYPT_ROUNDS)
+            params = {"scheme": "bcrypt", "rounds": self.bcrypt_rounds}
+
+        params["measured_ms"] = round(self._time_hash(self, sample), 1)
+        params["target_ms"] = target_ms
+        return params
+
+    @staticmethod
+    def _time_hash(manager: "PasswordManager", sample: str)-> float:
+        started = time.perf_counter()
+        manager.hash_password(sample)
+        return (time.perf_counter() - started) * 1000
+
+    #async wrappers so request handlers never run bcrypt on the event loop,
+    #they raise HashingQueueFullError when the hashing pool is saturated
+
+    @staticmethod
+    async def run_blocking(func, *args):
+        return await hashing_pool.run(func, *args)
+
+    async def hash_password_async(self, password: str)-> str:
+        #timed here rather than in hash_password, which may run in a worker process
+        with metrics.span("password_hash"):
+            return await self.run_blocking(self.hash_password, password)
+
+    async def verify_password_async(self, password: str, hash_password: str)-> bool:
+        with metrics.span("password_verify"):
+            return await self.run_blocking(self.verify_password, password, hash_password)
+
     @staticmethod
     def validate_strength(password:str)-> tuple[bool, str]:
-        return is_strong_password(password=password)
\ No newline at end of file
+        return is_strong_password(password=password)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pick a password hash cost for this host")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2id"], default=settings.PASSWORD_HASH_SCHEME)
+    parser.add_argument("--target-ms", type=float, default=settings.PASSWORD_HASH_TARGET_MS or 250)
+    args = parser.parse_args()
+
+    result = PasswordManager(scheme=args.scheme).calibrate(args.target_ms)
+    print(result)
+    print(f"PASSWORD_HASH_SCHEME={result['scheme']}")
+    if result["scheme"] == "argon2id":
+        print(f"ARGON2_TIME_COST={result['time_cost']}")
+        print(f"ARGON2_MEMORY_COST={result['memory_cost']}")
+        print(f"ARGON2_PARALLELISM={result['parallelism']}")
+    else:
+        print(f"BCRYPT_ROUNDS={result['rounds']}")
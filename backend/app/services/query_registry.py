@@ -0,0 +1,225 @@
+import bisect
+import time
+import weakref
+from threading import Lock
+from typing import Dict, List
+from app.config import settings
+
+
+class QueryStats:
+    """latency histogram and row counts for one named statement"""
+
+    #upper bounds in seconds, the last bucket is everything slower
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, elapsed:float, rows:int, slow:bool):
+        self.calls += 1
+        self.rows += rows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.buckets[bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+        if slow:
+            self.slow += 1
+
+    def cumulative(self) -> list:
+        #prometheus style, each bucket counts every call at or below its bound
+        counts, running = [], 0
+        for count in self.buckets:
+            running += count
+            counts.append(running)
+        return counts
+
+    def to_dict(self) -> Dict:
+        counts = self.cumulative()
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "slow": self.slow,
+            "seconds_total": round(self.total, 6),
+            "seconds_max": round(self.max, 6),
+            "seconds_avg": round(self.total / self.calls, 6) if self.calls else 0.0,
+            "histogram": {
+                **{f"le_{bound}": count for bound, count in zip(self.BUCKETS, counts)},
+                "le_inf": counts[-1],
+            },
+        }
+
+
+class QueryRegistry:
+    """
+    named SQL statements, prepared once per connection and timed on every call
+
+    statements are written once in asyncpg's $n form and used by both paths,
+    asyncpg prepares them through its per-connection statement cache, psycopg2
+    connections get a server-side PREPARE the first time a name is used on
+    them and EXECUTE after that, every call is recorded under its name and
+    calls slower than slow_threshold_ms are logged
+    """
+
+    def __init__(self, slow_threshold_ms:float):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self._statements: Dict[str, str] = {}
+        self._stats: Dict[str, QueryStats] = {}
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = Lock()
+
+    def register(self, name:str, sql:str) -> str:
+        existing = self._statements.get(name)
+        if existing is not None and existing != sql:
+            raise ValueError(f"query {name!r} is already registered with different SQL")
+        self._statements[name] = sql
+        self._stats.setdefault(name, QueryStats())
+        return name
+
+    def register_many(self, statements:Dict[str, str]):
+        for name, sql in statements.items():
+            self.register(name, sql)
+
+    def sql(self, name:str) -> str:
+        return self._statements[name]
+
+    def names(self) -> List[str]:
+        return list(self._statements)
+
+    def _record(self, name:str, started:float, rows:int):
+        elapsed = time.perf_counter() - started
+        slow = elapsed >= self.slow_threshold
+        with self._lock:
+            self._stats[name].observe(elapsed, rows, slow)
+        if slow:
+            print(f"slow query {name}: {elapsed * 1000:.1f}ms, {rows} rows")
+
+    def _failed(self, name:str):
+        with self._lock:
+            self._stats[name].errors += 1
+
+    #asyncpg
+
+    async def fetch(self, conn, name:str, *args):
+        started = time.perf_counter()
+        try:
+            rows = await conn.fetch(self._statements[name], *args)
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started, len(rows))
+        return rows
+
+    async def fetchrow(self, conn, name:str, *args):
+        started = time.perf_counter()
+        try:
+            row = await conn.fetchrow(self._statements[name], *args)
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started, 0 if row is None else 1)
+        return row
+
+    async def fetchval(self, conn, name:str, *args):
+        started = time.perf_counter()
+        try:
+            value = await conn.fetchval(self._statements[name], *args)
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started, 0 if value is None else 1)
+        return value
+
+    async def execute(self, conn, name:str, *args) -> str:
+        started = time.perf_counter()
+        try:
+            status = await conn.execute(self._statements[name], *args)
+        except Exception:
+            self._failed(name)
+            raise
+        #"INSERT 0 1" / "UPDATE 3" / "DELETE 0"
+        count = status.split()[-1]
+        self._record(name, started, int(count) if count.isdigit() else 0)
+        return status
+
+    async def prepare(self, conn, names:List[str]=None) -> int:
+        """
+        parse statements into an asyncpg connection's statement cache ahead of
+        the first request, nothing is executed, returns how many were prepared
+        """
+        prepared = 0
+        for name in names or self.names():
+            try:
+                #executemany with no rows goes through the cache but runs nothing,
+                #conn.prepare() would build a statement the cache never sees
+                await conn.executemany(self._statements[name], [])
+                prepared += 1
+            except Exception as e:
+                print(f"could not prepare {name}: {e}")
+        return prepared
+
+    #psycopg2
+
+    def run(self, conn, name:str, *args):
+        """EXECUTE a registered statement on a psycopg2 connection, returns the cursor"""
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        try:
+            prepared = self._prepared.setdefault(conn, set())
+            if name not in prepared:
+                cursor.execute(f"PREPARE {name} AS {self._statements[name]}")
+                prepared.add(name)
+            if args:
+                cursor.execute(f"EXECUTE {name}({', '.join(['%s'] * len(args))})", args)
+            else:
+                cursor.execute(f"EXECUTE {name}")
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started, max(cursor.rowcount, 0))
+        return cursor
+
+    def prometheus_lines(self) -> List[str]:
+        """the per-query histograms in the prometheus text format"""
+        with self._lock:
+            snapshot = [(name, stats.cumulative(), stats.total, stats.calls, stats.rows) for name, stats in self._stats.items()]
+
+        lines = [
+            "# HELP db_query_duration_seconds latency of each named query",
+            "# TYPE db_query_duration_seconds histogram",
+        ]
+        for name, counts, total, calls, _ in snapshot:
+            for bound, count in zip(QueryStats.BUCKETS + ("+Inf",), counts):
+                lines.append(f'db_query_duration_seconds_bucket{{query="{name}",le="{bound}"}} {count}')
+            lines.append(f'db_query_duration_seconds_sum{{query="{name}"}} {round(total, 6)}')
+            lines.append(f'db_query_duration_seconds_count{{query="{name}"}} {calls}')
+
+        lines.append("# HELP db_query_rows_total rows returned or affected by each named query")
+        lines.append("# TYPE db_query_rows_total counter")
+        for name, _, _, _, rows in snapshot:
+            lines.append(f'db_query_rows_total{{query="{name}"}} {rows}')
+        return lines
+
+    def stats(self) -> Dict:
+        """per-query stats, the queries taking the most total time first"""
+        with self._lock:
+            queries = {name: stats.to_dict() for name, stats in self._stats.items()}
+
+        grand_total = sum(q["seconds_total"] for q in queries.values())
+        for q in queries.values():
+            q["share_of_time"] = round(q["seconds_total"] / grand_total, 3) if grand_total else 0.0
+
+        ordered = sorted(queries.items(), key=lambda item: item[1]["seconds_total"], reverse=True)
+        return {
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "seconds_total": round(grand_total, 6),
+            "queries": dict(ordered),
+        }
+
+
+query_registry = QueryRegistry(slow_threshold_ms=settings.QUERY_SLOW_THRESHOLD_MS)
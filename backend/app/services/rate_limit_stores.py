@@ -0,0 +1,300 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+
+def sliding_window_hit(state:list, now:float, window:int, max_attempts:int) -> tuple[bool, Optional[int]]:
+    """
+    sliding-window-counter check on state = [window_start, previous, current]
+
+    mutates state in place, counts the attempt only when it is allowed
+    """
+    window_start = now - (now % window)
+    if state[0] != window_start:
+        state[1] = state[2] if window_start - state[0] == window else 0
+        state[0] = window_start
+        state[2] = 0
+
+    elapsed = now - window_start
+    previous, current = state[1], state[2]
+    if previous * (1 - elapsed / window) + current < max_attempts:
+        state[2] += 1
+        return True, None
+
+    if current >= max_attempts or previous == 0:
+        wait_time = math.ceil(window - elapsed)
+    else:
+        #seconds until the previous window's share decays below the limit
+        wait_time = math.ceil(window * (1 - (max_attempts - current) / previous) - elapsed)
+    return False, max(wait_time, 1)
+
+
+class MemoryStore:
+    """
+    per-process store, keys spread over lock stripes, each stripe an LRU
+    capped at max_keys / stripes with keys idle for two windows evicted
+    """
+
+    def __init__(self, stripes:int=16, max_keys:int=100_000):
+        self.max_keys_per_stripe = max(1, max_keys // stripes)
+        self._stripes = [OrderedDict() for _ in range(stripes)]
+        self._locks = [Lock() for _ in range(stripes)]
+
+    def _stripe(self, key:str) -> int:
+        return hash(key) % len(self._stripes)
+
+    def hit(self, key:str, max_attempts:int, window:int) -> tuple[bool, Optional[int]]:
+        now = time.monotonic()
+        index = self._stripe(key)
+
+        with self._locks[index]:
+            keys = self._stripes[index]
+            state = keys.get(key)
+            if state is None:
+                state = [now - (now % window), 0, 0]
+                keys[key] = state
+                self._evict(keys, now - 2 * window)
+            else:
+                keys.move_to_end(key)
+
+            return sliding_window_hit(state, now, window, max_attempts)
+
+    def _evict(self, keys:OrderedDict, idle_before:float):
+        #oldest entries sit at the front, drop them while idle or over the cap
+        while keys:
+            oldest_key = next(iter(keys))
+            if len(keys) > self.max_keys_per_stripe or keys[oldest_key][0] < idle_before:
+                del keys[oldest_key]
+            else:
+                break
+
+    def reset(self, key:str):
+        index = self._stripe(key)
+        with self._locks[index]:
+            self._stripes[index].pop(key, None)
+
+    def key_count(self) -> int:
+        return sum(len(keys) for keys in self._stripes)
+
+
+class SharedSlotTable:
+    """
+    fixed-size hash table in an mmap'd file (put it on /dev/shm) shared by
+    every worker process on one host
+
+    split into buckets of BUCKET_SLOTS slots, a key only ever lives in its
+    own bucket so a lookup reads at most one bucket under one lock, processes
+    are excluded with an fcntl byte-range lock per stripe and threads with a
+    Lock per stripe, a full bucket recycles its stalest slot (lowest second
+    field) which caps the tracked keys, subclasses define SLOT and EMPTY
+    """
+
+    #key hash, then a float the stalest slot is picked by, then the payload
+    SLOT: struct.Struct
+    EMPTY: tuple
+    BUCKET_SLOTS = 8
+
+    def __init__(self, path:str, slots:int=65536, stripes:int=64):
+        self.path = path
+        self.buckets = max(1, slots // self.BUCKET_SLOTS)
+        self.stripes = stripes
+        self._size = self.buckets * self.BUCKET_SLOTS * self.SLOT.size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self._size:
+            os.ftruncate(self._fd, self._size)
+        self._map = mmap.mmap(self._fd, self._size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._locks = [Lock() for _ in range(stripes)]
+
+    @staticmethod
+    def _key_hash(key:str) -> int:
+        #stable across processes unlike hash(), 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") | 1
+
+    def _bucket(self, key_hash:int) -> int:
+        return (key_hash >> 1) % self.buckets
+
+    def _locked(self, bucket:int):
+        return _StripeLock(self._locks[bucket % self.stripes], self._fd, bucket % self.stripes)
+
+    def _find_slot(self, bucket:int, key_hash:int, create:bool) -> Optional[int]:
+        first = bucket * self.BUCKET_SLOTS
+        empty = None
+        stalest, stalest_start = None, None
+        for slot in range(first, first + self.BUCKET_SLOTS):
+            stored_hash, stamp = self.SLOT.unpack_from(self._map, slot * self.SLOT.size)[:2]
+            if stored_hash == key_hash:
+                return slot
+            if stored_hash == 0:
+                if empty is None:
+                    empty = slot
+            elif stalest is None or stamp < stalest_start:
+                stalest, stalest_start = slot, stamp
+
+        if not create:
+            return None
+        slot = empty if empty is not None else stalest
+        self.SLOT.pack_into(self._map, slot * self.SLOT.size, key_hash, *self.EMPTY)
+        return slot
+
+    def reset(self, key:str):
+        key_hash = self._key_hash(key)
+        bucket = self._bucket(key_hash)
+        with self._locked(bucket):
+            slot = self._find_slot(bucket, key_hash, create=False)
+            if slot is not None:
+                self.SLOT.pack_into(self._map, slot * self.SLOT.size, 0, *self.EMPTY)
+
+    def key_count(self) -> int:
+        count = 0
+        for slot in range(self.buckets * self.BUCKET_SLOTS):
+            if self.SLOT.unpack_from(self._map, slot * self.SLOT.size)[0]:
+                count += 1
+        return count
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedMemoryStore(SharedSlotTable):
+    """rate limit store shared by every worker process on one host, see SharedSlotTable"""
+
+    #key hash, window start, previous count, current count
+    SLOT = struct.Struct("<Qdii")
+    EMPTY = (0.0, 0, 0)
+
+    def hit(self, key:str, max_attempts:int, window:int) -> tuple[bool, Optional[int]]:
+        key_hash = self._key_hash(key)
+        bucket = self._bucket(key_hash)
+
+        with self._locked(bucket):
+            slot = self._find_slot(bucket, key_hash, create=True)
+            offset = slot * self.SLOT.size
+            _, window_start, previous, current = self.SLOT.unpack_from(self._map, offset)
+
+            state = [window_start, previous, current]
+            result = sliding_window_hit(state, time.time(), window, max_attempts)
+            self.SLOT.pack_into(self._map, offset, key_hash, *state)
+            return result
+
+
+class _StripeLock:
+    #thread lock plus a one-byte fcntl lock, posix locks don't exclude threads
+
+    def __init__(self, lock:Lock, fd:int, offset:int):
+        self.lock = lock
+        self.fd = fd
+        self.offset = offset
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.offset)
+        except Exception:
+            self.lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.offset)
+        finally:
+            self.lock.release()
+
+
+class RedisStore:
+    """
+    store shared by every node, each check is one EVALSHA round trip
+
+    the script reads the server clock so skew between nodes doesn't matter
+    """
+
+    SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local max_attempts = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    local window_start = now - (now % window)
+
+    local state = redis.call('HMGET', KEYS[1], 's', 'p', 'c')
+    local started = tonumber(state[1])
+    local previous = tonumber(state[2]) or 0
+    local current = tonumber(state[3]) or 0
+    if started ~= window_start then
+        if started and window_start - started == window then
+            previous = current
+        else
+            previous = 0
+        end
+        current = 0
+    end
+
+    local elapsed = now - window_start
+    if previous * (1 - elapsed / window) + current < max_attempts then
+        current = current + 1
+        redis.call('HSET', KEYS[1], 's', window_start, 'p', previous, 'c', current)
+        redis.call('EXPIRE', KEYS[1], window * 2)
+        return {1, 0}
+    end
+
+    local wait_time
+    if current >= max_attempts or previous == 0 then
+        wait_time = window - elapsed
+    else
+        wait_time = window * (1 - (max_attempts - current) / previous) - elapsed
+    end
+    redis.call('HSET', KEYS[1], 's', window_start, 'p', previous, 'c', current)
+    redis.call('EXPIRE', KEYS[1], window * 2)
+    return {0, math.max(math.ceil(wait_time), 1)}
+    """
+
+    def __init__(self, client, prefix:str="ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    @classmethod
+    def from_url(cls, url:str, **kwargs) -> "RedisStore":
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def hit(self, key:str, max_attempts:int, window:int) -> tuple[bool, Optional[int]]:
+        allowed, wait_time = self._script(keys=[self.prefix + key], args=[max_attempts, window])
+        if allowed:
+            return True, None
+        return False, int(wait_time)
+
+    def reset(self, key:str):
+        self.client.delete(self.prefix + key)
+
+    def key_count(self) -> Optional[int]:
+        #counting would need a SCAN over the keyspace, not worth it for a gauge
+        return None
+
+
+class LocalRedis:
+    """
+    in-process stand-in for the redis client used by RedisStore in tests,
+    register_script returns a callable that runs the same algorithm locally
+    """
+
+    def __init__(self):
+        self.store = MemoryStore(stripes=1)
+        self.calls = 0
+
+    def register_script(self, script:str):
+        def run(keys, args):
+            self.calls += 1
+            allowed, wait_time = self.store.hit(keys[0], int(args[0]), int(args[1]))
+            return [1 if allowed else 0, wait_time or 0]
+        return run
+
+    def delete(self, key:str):
+        self.store.reset(key)
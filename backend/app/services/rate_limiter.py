@@ -1,44 +1,45 @@
-from collections import defaultdict
-from datetime import datetime, timedelta
-from threading import Lock
 from typing import Optional
+from app.config import settings
+from app.services.rate_limit_stores import MemoryStore, SharedMemoryStore, RedisStore
 
 
 class RateLimiter:
-    #simple in-memory rate limiter
-    
-    def __init__(self, max_attempts:int=5, window_seconds:int=60):
+    """
+    sliding-window-counter rate limiter over a pluggable store
+
+    the store does the whole check-and-count atomically in one call, so with
+    the shared or redis store the limit holds across workers and nodes
+    """
+
+    def __init__(self, max_attempts:int=5, window_seconds:int=60, store=None):
         self.max_attempts = max_attempts
         self.window = window_seconds
-        self.attempts = defaultdict(list)
-        self.lock = Lock()
+        self.store = store if store is not None else MemoryStore()
 
     def is_allowed(self, indentifier:str) -> tuple[bool, Optional[int]]:
-        with self.lock:
-            now = datetime.utcnow()
-
-            #clean old attempts outside the window
-            self.attempts[indentifier] = [
-                ts for ts in self.attempts[indentifier]
-                if now - ts < timedelta(seconds=self.window)
-            ]
-        
-            if len(self.attempts[indentifier]) >= self.max_attempts:
-                oldest = self.attempts[indentifier][0]
-                wait_time = int(oldest + self.window - now).total_seconds()
-                return False, max(wait_time, 1)
-            
-            self.attempts[indentifier].append(now)
-            return True, None
+        return self.store.hit(indentifier, self.max_attempts, self.window)
 
     def reset(self, indentifier:str) :
         """
         reset attempts for indentifier
         """
+        self.store.reset(indentifier)
+
+    def key_count(self) -> Optional[int]:
+        return self.store.key_count()
+
 
-        with self.lock:
-            if indentifier in self.attempts:
-                del self.attempts[indentifier]
+def create_store(backend:str):
+    #"memory" is per process, "shared" spans workers on one host, "redis" spans nodes
+    if backend == "shared":
+        return SharedMemoryStore(settings.RATE_LIMIT_SHARED_PATH, slots=settings.RATE_LIMIT_MAX_KEYS)
+    if backend == "redis":
+        return RedisStore.from_url(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryStore(max_keys=settings.RATE_LIMIT_MAX_KEYS)
 
 
-rate_limiter = RateLimiter(max_attempts=5, window_seconds=60)
+rate_limiter = RateLimiter(
+    max_attempts=settings.RATE_LIMIT_MAX_ATTEMPTS,
+    window_seconds=settings.RATE_LIMIT_WINDOW_SECONDS,
+    store=create_store(settings.RATE_LIMIT_BACKEND)
+)
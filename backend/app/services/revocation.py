@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from app.config import settings
+from app.async_database import async_db
+from app.services.token_cache import token_cache
+
+
+def _epoch(value:datetime) -> float:
+    #timestamps in the database are naive UTC
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class BloomFilter:
+    """fixed-size bloom filter, k bit positions per item from one blake2b digest"""
+
+    def __init__(self, capacity:int, fp_rate:float):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item:str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item:str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item:str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    """
+    revoked access tokens, by jti, by session (a replayed refresh token
+    family) or by user ("log out all devices")
+
+    revocations are rows in token_revocations, every worker polls the table
+    and adds new rows to a bloom filter, ids don't commit in order so a poll
+    can't resume after the highest id it saw, it resumes from the oldest
+    transaction still running at the previous poll (the snapshot xmin) and
+    skips the rows it already has, a revocation committing late is picked
+    up by the poll after it commits, get_current_user asks the filter first so the common case (not
+    revoked) is a constant time miss, hits are confirmed against the exact
+    maps, entries drop out once the tokens they cover have expired and the
+    filter is rebuilt from the live entries
+    """
+
+    def __init__(self, database, capacity:int, fp_rate:float, poll_interval:float):
+        self.database = database
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.poll_interval = poll_interval
+        self.retention = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+        self._filter = BloomFilter(capacity, fp_rate)
+        self._jtis: Dict[str, float] = {}
+        self._users: Dict[str, float] = {}
+        self._sessions: Dict[str, float] = {}
+        self._expires: Dict[str, float] = {}
+        #rows with xact_id >= horizon may still be committing, they are re-read every poll
+        self._horizon = "0"
+        self._seen: Dict[int, float] = {}
+        self._synced = False
+        self._task = None
+
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+        self._loaded = 0
+        self._rebuilds = 0
+        self._false_positives = 0
+
+    def is_revoked(self, payload:Dict) -> bool:
+        jti = payload.get("jti")
+        user_id = payload.get("user_id")
+        session_id = payload.get("sid")
+
+        if (
+            f"jti:{jti}" not in self._filter
+            and f"user:{user_id}" not in self._filter
+            and (session_id is None or f"sid:{session_id}" not in self._filter)
+        ):
+            return False
+
+        if jti in self._jtis or session_id in self._sessions:
+            return True
+        revoked_before = self._users.get(user_id)
+        #iat has millisecond precision, a token issued right after the revocation survives it
+        if revoked_before is not None and payload.get("iat", 0) <= revoked_before:
+            return True
+
+        self._false_positives += 1
+        return False
+
+    async def revoke_jti(self, conn, jti:str, expires_at:Optional[datetime]=None) -> tuple:
+        """
+        revoke one token, returns the revocation, inside a transaction it
+        only takes effect here once the caller applies it after the commit
+        """
+        expires_at = expires_at or datetime.utcnow() + self.retention
+        await conn.execute("""
+            INSERT INTO token_revocations (jti, expires_at, created_at)
+            VALUES ($1, $2, $3)
+        """, jti, expires_at, datetime.utcnow())
+        return self._applied(conn, (jti, None, None, expires_at))
+
+    async def revoke_user(self, conn, user_id:str) -> tuple:
+        """revoke every access token issued to user_id up to now, see revoke_jti"""
+        now = datetime.utcnow()
+        await conn.execute("""
+            INSERT INTO token_revocations (user_id, revoked_before, expires_at, created_at)
+            VALUES ($1, $2, $3, $2)
+        """, user_id, now, now + self.retention)
+        return self._applied(conn, (None, str(user_id), now, now + self.retention))
+
+    async def revoke_session(self, conn, session_id:str) -> tuple:
+        """revoke the access tokens minted from one refresh token family, see revoke_jti"""
+        expires_at = datetime.utcnow() + self.retention
+        await conn.execute("""
+            INSERT INTO token_revocations (session_id, expires_at, created_at)
+            VALUES ($1, $2, $3)
+        """, session_id, expires_at, datetime.utcnow())
+        return self._applied(conn, (None, None, None, expires_at, session_id))
+
+    def revoke_session_sync(self, conn, session_id:str) -> tuple:
+        """revoke_session on a psycopg2 connection, the caller applies it after committing"""
+        expires_at = datetime.utcnow() + self.retention
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO token_revocations (session_id, expires_at, created_at)
+                VALUES (%s, %s, %s)
+            """, (session_id, expires_at, datetime.utcnow()))
+        return (None, None, None, expires_at, session_id)
+
+    def _applied(self, conn, revocation:tuple) -> tuple:
+        #a rollback must not leave the token revoked here, so wait for the caller's commit
+        if not conn.is_in_transaction():
+            self.apply(*revocation)
+        return revocation
+
+    def apply(self, jti, user_id, revoked_before, expires_at:datetime, session_id=None):
+        """make a committed revocation effective locally, other workers catch up on sync"""
+        expires = _epoch(expires_at)
+        if jti:
+            self._jtis[jti] = expires
+            self._expires[f"jti:{jti}"] = expires
+            self._filter.add(f"jti:{jti}")
+            token_cache.invalidate_jti(jti)
+        if user_id:
+            before = _epoch(revoked_before)
+            self._users[user_id] = max(before, self._users.get(user_id, 0))
+            self._expires[f"user:{user_id}"] = max(expires, self._expires.get(f"user:{user_id}", 0))
+            self._filter.add(f"user:{user_id}")
+            token_cache.invalidate_user(user_id)
+        if session_id:
+            self._sessions[session_id] = expires
+            self._expires[f"sid:{session_id}"] = expires
+            self._filter.add(f"sid:{session_id}")
+
+        if self._filter.count >= self._filter.capacity:
+            self._rebuild()
+
+    async def sync(self):
+        """load revocations committed since the last sync, by any worker"""
+        conn = await self.database.checkout()
+        try:
+            #one snapshot for the horizon and the rows, the left join returns
+            #the horizon even when there are no rows
+            rows = await conn.fetch("""
+                WITH snapshot AS (
+                    SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS horizon
+                )
+                SELECT snapshot.horizon, r.id, r.jti, r.user_id, r.session_id, r.revoked_before, r.expires_at,
+                    EXTRACT(EPOCH FROM (clock_timestamp() AT TIME ZONE 'UTC') - r.created_at) AS lag
+                FROM snapshot
+                LEFT JOIN token_revocations r
+                    ON r.xact_id >= $1::text::xid8 AND r.expires_at > $2
+                ORDER BY r.id
+            """, self._horizon, datetime.utcnow())
+        finally:
+            await self.database.release(conn)
+
+        loaded = 0
+        for row in rows:
+            if row["id"] is None or row["id"] in self._seen:
+                continue
+            user_id = str(row["user_id"]) if row["user_id"] else None
+            self.apply(row["jti"], user_id, row["revoked_before"], row["expires_at"], row["session_id"])
+            self._seen[row["id"]] = _epoch(row["expires_at"])
+            loaded += 1
+            #the first sync loads the backlog, its age isn't propagation lag
+            if self._synced:
+                self._lag_last = float(row["lag"])
+                self._lag_max = max(self._lag_max, self._lag_last)
+        if rows:
+            self._horizon = rows[0]["horizon"]
+        self._loaded += loaded
+        self._synced = True
+
+        self._prune()
+
+    def _prune(self):
+        now = time.time()
+        self._seen = {row_id: expires for row_id, expires in self._seen.items() if expires > now}
+        expired = [key for key, expires in self._expires.items() if expires <= now]
+        if not expired:
+            return
+        for key in expired:
+            del self._expires[key]
+            kind, _, value = key.partition(":")
+            if kind == "jti":
+                self._jtis.pop(value, None)
+            elif kind == "sid":
+                self._sessions.pop(value, None)
+            else:
+                self._users.pop(value, None)
+        self._rebuild()
+
+    def _rebuild(self):
+        #bloom filters can't delete, so start a fresh one from the live entries
+        bloom = BloomFilter(max(self.capacity, len(self._expires) * 2), self.fp_rate)
+        for key in self._expires:
+            bloom.add(key)
+        self._filter = bloom
+        self._rebuilds += 1
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"revocation sync failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict:
+        return {
+            "revoked_jtis": len(self._jtis),
+            "revoked_users": len(self._users),
+            "revoked_sessions": len(self._sessions),
+            "loaded": self._loaded,
+            "horizon": self._horizon,
+            "propagation_lag_seconds_last": round(self._lag_last, 3),
+            "propagation_lag_seconds_max": round(self._lag_max, 3),
+            "filter_bits": self._filter.size,
+            "filter_items": self._filter.count,
+            "filter_rebuilds": self._rebuilds,
+            "false_positives": self._false_positives,
+        }
+
+
+revocation_list = RevocationList(
+    async_db,
+    capacity=settings.REVOCATION_FILTER_CAPACITY,
+    fp_rate=settings.REVOCATION_FILTER_FP_RATE,
+    poll_interval=settings.REVOCATION_POLL_INTERVAL,
+)
@@ -0,0 +1,108 @@
+import asyncio
+import importlib
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+
+def process_age() -> float:
+    """seconds since this process was started, 0 where /proc can't tell"""
+    try:
+        with open("/proc/self/stat") as f:
+            #the command name may contain spaces, the fields after it don't
+            fields = f.read().rpartition(")")[2].split()
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class StartupTimer:
+    """
+    where a worker's startup time goes, from process start to its first request
+
+    imports runs from process start until the app module has loaded, in a
+    pre-forked worker it was paid once by the master and the worker's clock
+    starts at the fork, the warmup phases run concurrently so they overlap
+    and ready is the wall clock total
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter() - process_age()
+        self.phases: Dict[str, float] = {}
+        self.preloaded = False
+        self.ready = None
+        self.first_request = None
+
+    def mark(self, name:str):
+        """record a phase running from process start until now"""
+        self.phases[name] = time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name:str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def forked(self):
+        self.started = time.perf_counter()
+        self.preloaded = True
+        self.ready = None
+        self.first_request = None
+
+    def serving(self):
+        self.ready = time.perf_counter() - self.started
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        print(f"startup: ready after {self.ready * 1000:.0f}ms ({breakdown})")
+
+    def request_served(self, latency:float):
+        #only the first one, it pays for whatever the warmup left cold
+        self.first_request = {
+            "after_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "latency_ms": round(latency * 1000, 1),
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "preloaded": self.preloaded,
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "ready_ms": round(self.ready * 1000, 1) if self.ready is not None else None,
+            "first_request": self.first_request,
+        }
+
+
+def preload(modules:Iterable[str]):
+    """import modules ahead of time, missing optional ones are skipped"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"startup: could not preload {name}: {e}")
+
+
+async def warm_statements(database, queries) -> int:
+    """
+    prepare every registered statement on each idle pool connection
+
+    all min_size connections are held at once so each of them gets warmed,
+    returns the number of statements prepared
+    """
+    conns = [await database.pool.acquire() for _ in range(database.min_size)]
+    try:
+        counts = await asyncio.gather(*(queries.prepare(conn) for conn in conns))
+    finally:
+        for conn in conns:
+            await database.pool.release(conn)
+    return sum(counts)
+
+
+def warm_tokens(tokens):
+    """sign and verify one token, loads the JWT and crypto modules and key objects"""
+    access = tokens.create_access_token("00000000-0000-0000-0000-000000000000", "warmup@localhost", "warmup")
+    tokens.verify_token(access, "access")
+
+
+startup_timer = StartupTimer()
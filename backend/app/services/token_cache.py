@@ -0,0 +1,108 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+from app.config import settings
+
+
+class VerifiedTokenCache:
+    """
+    bounded LRU of already verified access token payloads
+
+    keyed by a sha256 digest of the token so raw tokens are never held, an
+    entry lives for at most max_ttl seconds and never past the token's exp,
+    entries can be dropped by jti or by user when a session is revoked
+    """
+
+    def __init__(self, max_entries:int=10000, max_ttl:float=60):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._by_jti = {}
+        self._by_user = {}
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token:str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token:str) -> Optional[Dict]:
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            payload, expires_at = entry
+            if now >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token:str, payload:Dict):
+        expires_at = min(time.time() + self.max_ttl, payload.get("exp", 0))
+        if expires_at <= time.time():
+            return
+
+        key = self._key(token)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, expires_at)
+            self._by_jti[payload.get("jti")] = key
+            self._by_user.setdefault(payload.get("user_id"), set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_jti(self, jti:str):
+        with self._lock:
+            key = self._by_jti.get(jti)
+            if key is not None:
+                self._remove(key)
+
+    def invalidate_user(self, user_id:str):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_jti.clear()
+            self._by_user.clear()
+
+    def _remove(self, key:bytes):
+        payload, _ = self._entries.pop(key)
+        self._by_jti.pop(payload.get("jti"), None)
+        keys = self._by_user.get(payload.get("user_id"))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[payload.get("user_id")]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+token_cache = VerifiedTokenCache(
+    max_entries=settings.ACCESS_TOKEN_CACHE_SIZE,
+    max_ttl=settings.ACCESS_TOKEN_CACHE_TTL
+)
@@ -1,59 +1,167 @@
-import jwt
+import hmac
+import hashlib
 import secrets
-import bcrypt
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from app.config import settings
+from app.services.keyring import KeyRing
 
 class TokenManager:
     """
     Handels Token creation and validation
     """
 
+    REFRESH_TOKEN_SEPARATOR = "."
+    ASYMMETRIC_ALGORITHMS = ("EdDSA", "ES256")
+
     def __init__(self):
         self.secret_key = settings.JWT_SECRET_KEY
+        self.refresh_token_key = settings.REFRESH_TOKEN_HMAC_KEY.encode()
         self.algorithm = settings.JWT_ALGORITHM
-        self.acccess_token_expires = timedelta(days=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        self.acccess_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         self.refersh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
 
-    def create_access_token(self, user_id:str, email:str, username:str) -> str:
+        #asymmetric keys are parsed once here and reused for every sign/verify
+        self.keyring = None
+        if self.algorithm in self.ASYMMETRIC_ALGORITHMS:
+            self.keyring = KeyRing(
+                self.algorithm,
+                settings.JWT_KEYS_DIR,
+                rotation_days=settings.JWT_KEY_ROTATION_DAYS,
+                publish_ahead=settings.JWT_KEY_PUBLISH_AHEAD,
+                retained=settings.JWT_KEYS_RETAINED,
+                check_interval=settings.JWT_KEY_CHECK_INTERVAL
+            )
+
+    def create_access_token(self, user_id:str, email:str, username:str, session_id:Optional[str]=None) -> str:
         payload = {
             "user_id": user_id,
             "email" : email,
             "username" : username,
             "type": "access",
             "exp": datetime.utcnow() + self.acccess_token_expires,
-            "iat": datetime.utcnow(),
+            #milliseconds, so revocations can tell tokens issued in the same second apart
+            "iat": round(time.time(), 3),
             "jti": secrets.token_urlsafe(32)
         }
+        if session_id:
+            #the refresh token family it was minted from, so replaying that family revokes only its tokens
+            payload["sid"] = session_id
+
+        #imported on first use, keeps CLI tools that never sign a token fast to start
+        import jwt
+        if self.keyring:
+            key = self.keyring.active()
+            return jwt.encode(payload, key.private_key, key.algorithm, headers={"kid": key.kid})
 
         return jwt.encode(payload, self.secret_key, self.algorithm)
 
-    def create_refresh_token(self) -> tuple[str, str]:
-        token = secrets.token_urlsafe(64)
-        token_hash = bcrypt.hashpw(token.encode(), bcrypt.gensalt()).decode()
-        return token, token_hash
+    def create_refresh_token(self) -> tuple[str, str, str]:
+        """
+        issue a selector.verifier refresh token
+
+        the selector is stored in clear and indexed so the session can be found
+        with one lookup, only a keyed hash of the verifier is stored
+        """
+        selector = secrets.token_urlsafe(12)
+        verifier = secrets.token_urlsafe(32)
+        token = f"{selector}{self.REFRESH_TOKEN_SEPARATOR}{verifier}"
+        return token, selector, self.hash_refresh_verifier(verifier)
+
+    def rotate_refresh_token(self, selector:str) -> tuple[str, str]:
+        """
+        the next refresh token of a session, same selector and a fresh
+        verifier, returns (token, verifier hash)
+        """
+        verifier = secrets.token_urlsafe(32)
+        return f"{selector}{self.REFRESH_TOKEN_SEPARATOR}{verifier}", self.hash_refresh_verifier(verifier)
+
+    def split_refresh_token(self, token:str) -> tuple[str, str]:
+        """
+        return (selector, verifier) for a refresh token
+
+        legacy tokens (issued before selectors existed) have no separator, they
+        get a selector derived from the whole token so that once migrated they
+        are found through the same index
+        """
+        selector, sep, verifier = token.partition(self.REFRESH_TOKEN_SEPARATOR)
+        if sep and selector and verifier:
+            return selector, verifier
+        return self.legacy_selector(token), token
+
+    def session_id(self, selector:str) -> str:
+        """stable id of a session for access tokens, the selector itself stays out of them"""
+        digest = hmac.new(self.refresh_token_key, b"sid:" + selector.encode(), hashlib.sha256)
+        return digest.hexdigest()[:32]
+
+    def is_legacy_refresh_token(self, token:str) -> bool:
+        return self.REFRESH_TOKEN_SEPARATOR not in token
+
+    def legacy_selector(self, token:str) -> str:
+        digest = hmac.new(self.refresh_token_key, b"legacy:" + token.encode(), hashlib.sha256)
+        return digest.hexdigest()[:32]
+
+    def hash_refresh_verifier(self, verifier:str) -> str:
+        return hmac.new(self.refresh_token_key, verifier.encode(), hashlib.sha256).hexdigest()
 
     def verify_token(self, token:str, token_type:str="access") -> Optional[Dict]:
+        import jwt
         try:
-            payload = jwt.decode(
-                token,
-                self.secret_key,
-                algorithm=[self.algorithm]
-            )
+            payload = self._decode(token)
+            if payload is None:
+                return None
 
             if payload.get("type") != token_type:
                 return None
-            
+
+            return payload
         except jwt.ExpiredSignatureError:
             return None
         except jwt.InvalidTokenError:
             return None
 
+    def token_owner(self, token:str) -> Optional[str]:
+        """user_id of a correctly signed access token, expired or not"""
+        import jwt
+        try:
+            payload = self._decode(token, verify_exp=False)
+        except jwt.InvalidTokenError:
+            return None
+        if not payload or payload.get("type") != "access":
+            return None
+        return payload.get("user_id")
+
+    def _decode(self, token:str, verify_exp:bool=True) -> Optional[Dict]:
+        import jwt
+        options = {"verify_exp": verify_exp}
+        if not self.keyring:
+            return jwt.decode(token, self.secret_key, algorithms=[self.algorithm], options=options)
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            #tokens signed before the switch to asymmetric keys
+            if not settings.JWT_ACCEPT_HS256:
+                return None
+            return jwt.decode(token, self.secret_key, algorithms=["HS256"], options=options)
+
+        key = self.keyring.get(kid)
+        if key is None:
+            return None
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm], options=options)
+
+    def jwks(self) -> Dict:
+        return self.keyring.jwks() if self.keyring else {"keys": []}
+
+    def verify_refresh_token(self, verifier:str, token_hash:str) -> bool:
+        return hmac.compare_digest(self.hash_refresh_verifier(verifier), token_hash)
+
     @staticmethod
-    def verify_refresh_token(token:str, token_hash:str) -> bool:
+    def verify_legacy_refresh_token(token:str, token_hash:str) -> bool:
+        #bcrypt hashed tokens from before the selector/verifier format
+        import bcrypt
         try:
-            bcrypt.checkpw(token.encode(), token_hash.encode())
+            return bcrypt.checkpw(token.encode(), token_hash.encode())
         except Exception:
             return False
 
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+from app.config import settings
+from app.async_database import async_db
+from app.services.query_registry import query_registry
+
+
+query_registry.register("user_cache_notify", """
+    SELECT pg_notify($1, $2)
+""")
+
+
+class UserCache:
+    """
+    bounded LRU of the users rows login reads, keyed by id and reachable by
+    login name (email or username), plus short-lived negative entries for
+    names that matched no user so enumeration floods stop at the cache
+
+    callers write through: after changing a cached user they update the
+    entry themselves and broadcast the keys other workers must drop, over
+    postgres LISTEN/NOTIFY when channel is set, anything else that writes
+    users (is_active, password changes, bulk loads) invalidates the same way,
+    while the listener is down the cache is bypassed since it may have
+    missed invalidations, and it is cleared once the listener is back
+
+    keys are "user:<id>", "login:<name>" and "missing" (every negative entry)
+    """
+
+    def __init__(
+        self,
+        database,
+        max_entries:int=10000,
+        ttl:float=30,
+        negative_ttl:float=5,
+        channel:Optional[str]=None,
+        retry_interval:float=1
+    ):
+        self.database = database
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.channel = channel
+        self.retry_interval = retry_interval
+        #tags our own notifications so the listener can skip them,
+        #pre-forked workers each need their own
+        self._new_origin()
+        os.register_at_fork(after_in_child=self._new_origin)
+
+        self._entries = OrderedDict()
+        self._logins = {}
+        self._missing = OrderedDict()
+        self._lock = Lock()
+        self._listening = channel is None
+        self._task = None
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.broadcasts = 0
+        self.reconnects = 0
+
+    def _new_origin(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self._listening
+
+    def lookup(self, login:str) -> tuple[bool, Optional[Dict]]:
+        """(cached, user) for a normalized login name, user is None for a cached miss"""
+        if not self.enabled:
+            return False, None
+
+        now = time.monotonic()
+        with self._lock:
+            missing_until = self._missing.get(login)
+            if missing_until is not None:
+                if now < missing_until:
+                    self.negative_hits += 1
+                    return True, None
+                del self._missing[login]
+
+            user_id = self._logins.get(login)
+            entry = self._entries.get(user_id) if user_id is not None else None
+            if entry is None or now >= entry[1]:
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, user):
+        if not self.enabled:
+            return
+
+        row = dict(user)
+        user_id = str(row["id"])
+        with self._lock:
+            if user_id in self._entries:
+                self._remove(user_id)
+            self._entries[user_id] = (row, time.monotonic() + self.ttl)
+            for login in (row["email"], row["username"]):
+                self._logins[login] = user_id
+                self._missing.pop(login, None)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def put_missing(self, login:str):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._missing[login] = time.monotonic() + self.negative_ttl
+            self._missing.move_to_end(login)
+            while len(self._missing) > self.max_entries:
+                self._missing.popitem(last=False)
+
+    def update(self, user_id, **fields):
+        """write-through for a change this worker just made, keeps the entry's expiry"""
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is not None:
+                self._entries[str(user_id)] = ({**entry[0], **fields}, entry[1])
+
+    def invalidate(self, *keys:str):
+        with self._lock:
+            for key in keys:
+                kind, _, value = key.partition(":")
+                if kind == "user":
+                    if value in self._entries:
+                        self._remove(value)
+                elif kind == "login":
+                    self._missing.pop(value, None)
+                    user_id = self._logins.get(value)
+                    if user_id is not None:
+                        self._remove(user_id)
+                elif kind == "missing":
+                    self._missing.clear()
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._logins.clear()
+            self._missing.clear()
+
+    def _remove(self, user_id:str):
+        row, _ = self._entries.pop(user_id)
+        for login in (row["email"], row["username"]):
+            if self._logins.get(login) == user_id:
+                del self._logins[login]
+
+    def _payload(self, keys) -> str:
+        return "\n".join((self.origin, *keys))
+
+    async def broadcast(self, conn, *keys:str):
+        """tell the other workers to drop keys, the caller has already updated its own copy"""
+        if self.channel is None or not keys:
+            return
+        await query_registry.execute(conn, "user_cache_notify", self.channel, self._payload(keys))
+        self.broadcasts += 1
+
+    def broadcast_sync(self, conn, *keys:str):
+        """broadcast over a psycopg2 connection, delivered when the caller commits"""
+        if self.channel is None or not keys:
+            return
+        query_registry.run(conn, "user_cache_notify", self.channel, self._payload(keys))
+        self.broadcasts += 1
+
+    def _on_notify(self, conn, pid, channel, payload:str):
+        origin, *keys = payload.split("\n")
+        if origin != self.origin:
+            self.invalidate(*keys)
+
+    async def start(self):
+        if self.channel is not None and not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await self.database.dedicated()
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda c: lost.set())
+                await conn.add_listener(self.channel, self._on_notify)
+
+                #anything may have changed while nobody was listening
+                self.clear()
+                self._listening = True
+                self.reconnects += 1
+                await lost.wait()
+                print("user cache: listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"user cache listener failed: {e}")
+            finally:
+                self._listening = False
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.retry_interval)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "negative_entries": len(self._missing),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.negative_hits) / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+            "broadcasts": self.broadcasts,
+            "channel": self.channel,
+            "listening": self._listening,
+            "reconnects": self.reconnects,
+        }
+
+
+user_cache = UserCache(
+    async_db,
+    max_entries=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+    negative_ttl=settings.USER_CACHE_NEGATIVE_TTL,
+    channel=settings.USER_CACHE_CHANNEL if settings.USER_CACHE_INVALIDATION == "postgres" else None,
+)
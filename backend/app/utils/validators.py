@@ -1,23 +1,76 @@
 import re
+from typing import Iterable, List, Optional
+
+#compiled once at import, matched with fullmatch so no anchors are needed
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+SPECIAL_CHARACTERS = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+MIN_PASSWORD_LENGTH = 12
+
+#every ASCII character translated to its class letter (U/L/D/S) or dropped,
+#so one str.translate pass in C classifies a whole password
+_CLASS_TABLE = str.maketrans({
+    chr(i): (
+        "U" if chr(i).isupper() else
+        "L" if chr(i).islower() else
+        "D" if chr(i).isdigit() else
+        "S" if chr(i) in SPECIAL_CHARACTERS else
+        None
+    )
+    for i in range(128)
+})
+_ALL_CLASSES = frozenset("ULDS")
+
+WEAK_LENGTH = "Password must be at least 12 characters"
+WEAK_CLASSES = "Password must contain uppercase, lowercase, digit, and special character"
+
 
 def is_valid_email(email: str)->bool:
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return EMAIL_PATTERN.fullmatch(email) is not None
 
 def is_valid_username(username: str)->bool:
     return 3 <= len(username) <= 50 and username.isalnum()
 
+def _character_classes(password: str)-> set:
+    classes = set(password.translate(_CLASS_TABLE))
+    if not classes <= _ALL_CLASSES:
+        #non-ASCII characters pass through untranslated, classify them the slow way
+        for ch in classes - _ALL_CLASSES:
+            if ch.isupper():
+                classes.add("U")
+            elif ch.islower():
+                classes.add("L")
+            elif ch.isdigit():
+                classes.add("D")
+    return classes
+
 def is_strong_password(password: str)-> tuple[bool, str]:
-    if len(password) < 12:
-        return False, "Password must be at least 12 characters"
-    
-    has_upper = any(c.isupper() for c in password)
-    has_lower = any(c.islower() for c in password)
-    has_digit = any(c.isdigit() for c in password)
-
-    has_special = any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password)
-
-    if not (has_upper and has_lower and has_digit and has_special):
-        return False , "Password must contain uppercase, lowercase, digit, and special character"
-    
-    return True, "strong password"
\ No newline at end of file
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return False, WEAK_LENGTH
+
+    if not _ALL_CLASSES <= _character_classes(password):
+        return False , WEAK_CLASSES
+
+    return True, "strong password"
+
+
+#batch variants for bulk callers, one call per column instead of per row
+
+def validate_emails(emails: Iterable[str])-> List[bool]:
+    match = EMAIL_PATTERN.fullmatch
+    return [match(email) is not None for email in emails]
+
+def validate_usernames(usernames: Iterable[str])-> List[bool]:
+    return [3 <= len(username) <= 50 and username.isalnum() for username in usernames]
+
+def check_passwords(passwords: Iterable[str])-> List[Optional[str]]:
+    """None for a strong password, the reason otherwise"""
+    errors = []
+    for password in passwords:
+        if len(password) < MIN_PASSWORD_LENGTH:
+            errors.append(WEAK_LENGTH)
+        elif not _ALL_CLASSES <= _character_classes(password):
+            errors.append(WEAK_CLASSES)
+        else:
+            errors.append(None)
+    return errors
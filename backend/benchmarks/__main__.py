@@ -0,0 +1,182 @@
+"""
+benchmark harness for the auth hot paths, no postgres or redis needed
+
+    python -m benchmarks --users 500 --sessions 2000 --concurrency 32 --out bench.json
+
+drives the real FastAPI app in-process against benchmarks.fake_db, then runs
+micro-benchmarks of the services, results are JSON so runs can be diffed
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=200, help="users seeded before the run")
+    parser.add_argument("--sessions", type=int, default=1000, help="sessions seeded before the run")
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="delay added to every fake round-trip")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="bcrypt cost used for the run")
+    parser.add_argument("--micro-iterations", type=int, default=5000)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+async def drive(name:str, requests:List, concurrency:int) -> Dict:
+    """run every (coroutine factory) in requests with at most concurrency in flight"""
+    from benchmarks.report import summarize
+
+    latencies = []
+    errors = 0
+    queue = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for make_request in queue:
+            started = time.perf_counter()
+            status, _ = await make_request()
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    print(f"{name:<10} {result['throughput_per_sec']:>9} req/s  p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  errors {errors}", file=sys.stderr)
+    return result
+
+
+async def run_http(args) -> Dict:
+    from datetime import timedelta
+    from app.main import app
+    from app.api.routes import auth
+    from app.services.audit_log import audit_log
+    from app.services.rate_limiter import rate_limiter
+    from app.services.token_manager import token_manager
+    from benchmarks.asgi import call
+    from benchmarks.fake_db import FakeDatabase, install
+
+    database = FakeDatabase(latency=args.db_latency_ms / 1000)
+    install(database)
+
+    #the limiter is measured on its own below, here it must not turn requests into 429s
+    rate_limiter.max_attempts = 10 ** 9
+    auth.password_manager.scheme = "bcrypt"
+    auth.password_manager.bcrypt_rounds = args.bcrypt_rounds
+
+    password = "Bench-Password-1!"
+    password_hash = auth.password_manager.hash_password(password)
+    users = [database.add_user(f"user{i}@example.com", f"user{i}", password_hash) for i in range(args.users)]
+
+    refresh_tokens = []
+    expires_at = datetime.utcnow() + timedelta(days=7)
+    for i in range(args.sessions):
+        user = users[i % len(users)]
+        token, selector, token_hash = token_manager.create_refresh_token()
+        database.add_session(user["id"], selector, token_hash, expires_at)
+        refresh_tokens.append(token)
+
+    access_tokens = [
+        token_manager.create_access_token(str(user["id"]), user["email"], user["username"])
+        for user in users
+    ]
+
+    def post(path, body, headers=None):
+        return lambda: call(app, "POST", path, body, headers)
+
+    def get(path, headers):
+        return lambda: call(app, "GET", path, headers=headers)
+
+    def refresh(index):
+        #refresh tokens rotate, keep the latest one so later requests (and logout) can use it
+        async def run():
+            status, body = await call(app, "POST", "/auth/refresh", {"refresh_token": refresh_tokens[index]})
+            if status == 200 and "refresh_token" in body:
+                refresh_tokens[index] = body["refresh_token"]
+            return status, body
+        return run
+
+    def logout(index):
+        return lambda: call(app, "POST", "/auth/logout", {"refresh_token": refresh_tokens[index]})
+
+    n = args.requests
+    run_id = int(time.time())
+    scenarios = {
+        "register": [
+            post("/auth/register", {"email": f"new{run_id}-{i}@example.com", "username": f"new{run_id}x{i}", "password": password})
+            for i in range(n)
+        ],
+        "login": [
+            post("/auth/login", {"email_or_username": users[i % len(users)]["username"], "password": password})
+            for i in range(n)
+        ],
+        "refresh": [refresh(i % len(refresh_tokens)) for i in range(n)],
+        "me": [
+            get("/auth/me", {"authorization": f"Bearer {access_tokens[i % len(access_tokens)]}"})
+            for i in range(n)
+        ],
+        #each logout consumes a session, so it runs last and on distinct tokens
+        "logout": [logout(i) for i in range(min(n, len(refresh_tokens)))],
+    }
+
+    await audit_log.start()
+    results = {}
+    try:
+        for name, requests in scenarios.items():
+            round_trips = database.round_trips
+            results[name] = await drive(name, requests, args.concurrency)
+            results[name]["db_round_trips_per_request"] = round((database.round_trips - round_trips) / max(len(requests), 1), 2)
+    finally:
+        await audit_log.stop()
+    results["database"] = database.side_effects()
+    return results
+
+
+def main():
+    args = parse_args()
+    #the app reads its settings at import time
+    os.environ.setdefault("MAINTENANCE_ENABLED", "false")
+    os.environ.setdefault("PASSWORD_HASH_TARGET_MS", "0")
+    #no LISTEN connection in-process, a single worker needs no broadcasts
+    os.environ.setdefault("USER_CACHE_INVALIDATION", "none")
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+    }
+
+    #the services log with print, keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        if not args.skip_http:
+            report["http"] = asyncio.run(run_http(args))
+
+        if not args.skip_micro:
+            from benchmarks.micro import run_micro
+            hash_iterations = max(10, args.micro_iterations // 100)
+            report["micro"] = run_micro(args.micro_iterations, hash_iterations, args.bcrypt_rounds)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+        print(f"report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+
+
+async def call(
+    app,
+    method:str,
+    path:str,
+    body:Optional[Dict]=None,
+    headers:Optional[Dict[str, str]]=None,
+    client:str="127.0.0.1"
+) -> Tuple[int, Dict]:
+    """send one request straight into the ASGI app, no sockets or http client involved"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    raw_headers = [(b"host", b"bench")]
+    if body is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.append((b"content-length", str(len(payload)).encode()))
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": raw_headers,
+        "client": (client, 50000),
+        "server": ("bench", 80),
+    }
+
+    body_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        #only asked for again by middleware waiting on a disconnect
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = 500
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+
+    data = b"".join(chunks)
+    try:
+        return status, json.loads(data) if data else {}
+    except ValueError:
+        return status, {"raw": data.decode(errors="replace")}
@@ -0,0 +1,286 @@
+import asyncio
+import re
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.services.query_registry import query_registry
+from app.services.lockout_stores import MemoryLockoutStore
+
+
+class FakeDatabase:
+    """
+    in-memory stand-in for the asyncpg pool, enough of it for the auth routes
+
+    registered queries are answered by name (see QueryRegistry), the handful
+    of statements issued outside the registry (revocations, audit COPY) are
+    matched by table and kept as rows, so side effects like the revocation and
+    audit event of a refresh token reuse show up the way they would in postgres,
+    latency adds a fixed delay per round-trip so the numbers are closer to a
+    real database on the same host
+    """
+
+    def __init__(self, latency:float=0.0):
+        self.latency = latency
+        self.users: Dict[uuid.UUID, Dict] = {}
+        self.users_by_login: Dict[str, Dict] = {}
+        self.sessions: Dict[str, Dict] = {}
+        self.revocations: List[Dict] = []
+        self.audit_logs = 0
+        self.audit_actions = Counter()
+        self.notifications: List[tuple] = []
+        self.lockouts = MemoryLockoutStore()
+        self.round_trips = 0
+        self._by_sql = {query_registry.sql(name): name for name in query_registry.names()}
+
+        self._in_use = 0
+        self._checkouts = 0
+
+    #seeding
+
+    def add_user(self, email:str, username:str, password_hash:str) -> Dict:
+        user = {
+            "id": uuid.uuid4(),
+            "email": email,
+            "username": username,
+            "password_hash": password_hash,
+            "is_verified": True,
+            "is_active": True,
+        }
+        self.users[user["id"]] = user
+        self.users_by_login[email] = user
+        self.users_by_login[username] = user
+        return user
+
+    def add_session(self, user_id, selector:str, token_hash:str, expires_at:datetime):
+        self.sessions[selector] = {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "refresh_token_selector": selector,
+            "refresh_token_hash": token_hash,
+            "expires_at": expires_at,
+            "last_used_at": None,
+        }
+
+    def add_legacy_session(self, user_id, token_hash:str, expires_at:datetime):
+        #a bcrypt hashed session from before selectors, kept under a placeholder key until re-keyed
+        session_id = uuid.uuid4()
+        self.sessions[f"legacy:{session_id}"] = {
+            "id": session_id,
+            "user_id": user_id,
+            "refresh_token_selector": None,
+            "refresh_token_hash": token_hash,
+            "expires_at": expires_at,
+            "last_used_at": None,
+        }
+
+    #pool interface used by app.async_database callers
+
+    async def checkout(self):
+        self._in_use += 1
+        self._checkouts += 1
+        return FakeConnection(self)
+
+    async def release(self, conn):
+        self._in_use -= 1
+
+    def pool_stats(self) -> Dict:
+        return {"in_use": self._in_use, "checkouts": self._checkouts, "saturation": 0.0}
+
+    def side_effects(self) -> Dict:
+        """what the run left behind besides sessions, for the report"""
+        return {
+            "sessions": len(self.sessions),
+            "revocations": {
+                kind: sum(1 for r in self.revocations if r.get(kind))
+                for kind in ("jti", "user_id", "session_id")
+            },
+            "audit_logs": self.audit_logs,
+            "audit_actions": dict(self.audit_actions),
+        }
+
+    async def round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+    #statements, by registry name
+
+    def run(self, name:str, args:tuple):
+        handler = getattr(self, f"_q_{name}", None)
+        if handler is None:
+            raise NotImplementedError(f"fake database has no handler for query {name!r}")
+        return handler(*args)
+
+    def _q_user_exists(self, email, username):
+        user = self.users_by_login.get(email) or self.users_by_login.get(username)
+        return [{"id": user["id"]}] if user else []
+
+    def _q_insert_user(self, email, username, password_hash):
+        if email in self.users_by_login or username in self.users_by_login:
+            raise ValueError("duplicate key value violates unique constraint")
+        return [{"id": self.add_user(email, username, password_hash)["id"]}]
+
+    def _q_user_by_login(self, login):
+        user = self.users_by_login.get(login)
+        return [dict(user)] if user else []
+
+    def _q_login_success(self, user_id, selector, token_hash, device_info, expires_at, new_hash):
+        if new_hash:
+            self.users[user_id]["password_hash"] = new_hash
+        self.add_session(user_id, selector, token_hash, expires_at)
+        return "INSERT 0 1"
+
+    #login_lockouts, kept in the memory store that mirrors record_login_failure
+
+    def _q_lockout_check(self, keys):
+        return [{"key": key, "remaining": remaining} for key, remaining in self.lockouts.check(None, keys).items()]
+
+    def _q_lockout_fail(self, keys, thresholds, base, max_duration, reset_after):
+        locked_for = self.lockouts.fail(None, list(zip(keys, thresholds)), base, max_duration, reset_after)
+        return [{"coalesce": locked_for}]
+
+    def _q_lockout_reset(self, key):
+        self.lockouts.reset(None, key)
+        return "DELETE 1"
+
+    def _q_user_cache_notify(self, channel, payload):
+        self.notifications.append((channel, payload))
+        return "SELECT 1"
+
+    def _session_row(self, session) -> Dict:
+        user = self.users[session["user_id"]]
+        return {
+            "id": session["id"],
+            "user_id": session["user_id"],
+            "refresh_token_hash": session["refresh_token_hash"],
+            "last_used_at": session["last_used_at"],
+            "email": user["email"],
+            "username": user["username"],
+            "is_active": user["is_active"],
+        }
+
+    def _q_session_by_selector(self, selector, now):
+        session = self.sessions.get(selector)
+        if session is None or session["expires_at"] <= now:
+            return []
+        return [self._session_row(session)]
+
+    def _q_rotate_session(self, selector, token_hash, next_hash, now, grace):
+        session = self.sessions.get(selector)
+        if session is None or session["expires_at"] <= now:
+            return []
+        row = self._session_row(session)
+        current = session["refresh_token_hash"] == token_hash
+        recent = (
+            session.get("previous_token_hash") == token_hash
+            and (now - session["rotated_at"]).total_seconds() < grace
+        )
+        if not current and not recent:
+            del self.sessions[selector]
+        elif current and row["is_active"]:
+            session.update(
+                refresh_token_hash=next_hash, previous_token_hash=token_hash, rotated_at=now, last_used_at=now
+            )
+        return [{"id": row["id"], "user_id": row["user_id"], "current": current, "recent": recent,
+                 "email": row["email"], "username": row["username"], "is_active": row["is_active"]}]
+
+    def _q_legacy_sessions(self, user_id, now):
+        return [
+            self._session_row(session) for session in self.sessions.values()
+            if str(session["user_id"]) == str(user_id) and session["refresh_token_selector"] is None and session["expires_at"] > now
+        ]
+
+    def _q_rekey_legacy_session(self, selector, token_hash, session_id):
+        for key, session in list(self.sessions.items()):
+            if session["id"] == session_id:
+                del self.sessions[key]
+                session.update(refresh_token_selector=selector, refresh_token_hash=token_hash)
+                self.sessions[selector] = session
+                return "UPDATE 1"
+        return "UPDATE 0"
+
+    def _q_touch_session(self, now, session_id):
+        for session in self.sessions.values():
+            if session["id"] == session_id:
+                session["last_used_at"] = now
+                return "UPDATE 1"
+        return "UPDATE 0"
+
+    def _q_delete_session(self, session_id):
+        for selector, session in list(self.sessions.items()):
+            if session["id"] == session_id:
+                del self.sessions[selector]
+                return "DELETE 1"
+        return "DELETE 0"
+
+    def _q_delete_user_sessions(self, user_id):
+        selectors = [s for s, session in self.sessions.items() if session["user_id"] == user_id]
+        for selector in selectors:
+            del self.sessions[selector]
+        return f"DELETE {len(selectors)}"
+
+
+class FakeConnection:
+    """the subset of asyncpg.Connection the services call"""
+
+    def __init__(self, database:FakeDatabase):
+        self.database = database
+        self._transactions = 0
+
+    async def _run(self, sql:str, args:tuple):
+        await self.database.round_trip()
+        name = self.database._by_sql.get(sql)
+        if name is not None:
+            return self.database.run(name, args)
+
+        if "token_revocations" in sql and sql.lstrip().startswith("INSERT"):
+            #the same row revoke_jti / revoke_user / revoke_session insert
+            columns = re.search(r"token_revocations\s*\(([^)]*)\)", sql).group(1)
+            self.database.revocations.append(dict(zip((c.strip() for c in columns.split(",")), args)))
+            return "INSERT 0 1"
+        raise NotImplementedError(f"fake database can't run: {' '.join(sql.split())[:80]}")
+
+    async def fetch(self, sql:str, *args):
+        return await self._run(sql, args)
+
+    async def fetchrow(self, sql:str, *args) -> Optional[Dict]:
+        rows = await self._run(sql, args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, sql:str, *args):
+        row = await self.fetchrow(sql, *args)
+        return next(iter(row.values())) if row else None
+
+    async def execute(self, sql:str, *args) -> str:
+        return await self._run(sql, args)
+
+    async def copy_records_to_table(self, table:str, records, columns=None):
+        await self.database.round_trip()
+        if table == "audit_logs":
+            self.database.audit_logs += len(records)
+            action = list(columns).index("action") if columns else None
+            if action is not None:
+                self.database.audit_actions.update(record[action] for record in records)
+
+    @asynccontextmanager
+    async def transaction(self):
+        self._transactions += 1
+        try:
+            yield self
+        finally:
+            self._transactions -= 1
+
+    def is_in_transaction(self) -> bool:
+        return self._transactions > 0
+
+
+def install(database:FakeDatabase):
+    """point the shared async pool at the fake, every service picks it up through async_db"""
+    from app.async_database import async_db
+    async_db.checkout = database.checkout
+    async_db.release = database.release
+    async_db.pool_stats = database.pool_stats
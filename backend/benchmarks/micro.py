@@ -0,0 +1,70 @@
+import time
+from typing import Callable, Dict
+from app.config import settings
+from app.services.token_manager import TokenManager
+from app.services.password_manager import PasswordManager
+from app.services.rate_limiter import RateLimiter
+from app.services.rate_limit_stores import MemoryStore
+from app.services.csrf_protection import CSRFProtection
+from app.utils import validators
+from benchmarks.report import summarize
+
+
+def measure(func:Callable[[int], object], iterations:int) -> Dict:
+    """call func(i) iterations times, timing each call"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - call_started)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["ops_per_sec"] = result.pop("throughput_per_sec")
+    result["iterations"] = result.pop("requests")
+    del result["errors"]
+    return result
+
+
+def run_micro(iterations:int, hash_iterations:int, bcrypt_rounds:int) -> Dict:
+    results = {}
+
+    tokens = TokenManager()
+    access = tokens.create_access_token("00000000-0000-0000-0000-000000000001", "bench@example.com", "bench")
+    refresh, _, refresh_hash = tokens.create_refresh_token()
+    _, verifier = tokens.split_refresh_token(refresh)
+    results["token_manager.create_access_token"] = measure(
+        lambda i: tokens.create_access_token("00000000-0000-0000-0000-000000000001", "bench@example.com", "bench"),
+        iterations
+    )
+    results["token_manager.verify_token"] = measure(lambda i: tokens.verify_token(access, "access"), iterations)
+    results["token_manager.create_refresh_token"] = measure(lambda i: tokens.create_refresh_token(), iterations)
+    results["token_manager.verify_refresh_token"] = measure(
+        lambda i: tokens.verify_refresh_token(verifier, refresh_hash), iterations
+    )
+
+    passwords = PasswordManager("bcrypt", bcrypt_rounds=bcrypt_rounds)
+    stored = passwords.hash_password("Bench-Password-1!")
+    results[f"password_manager.hash_password[bcrypt={bcrypt_rounds}]"] = measure(
+        lambda i: passwords.hash_password("Bench-Password-1!"), hash_iterations
+    )
+    results[f"password_manager.verify_password[bcrypt={bcrypt_rounds}]"] = measure(
+        lambda i: passwords.verify_password("Bench-Password-1!", stored), hash_iterations
+    )
+
+    limiter = RateLimiter(settings.RATE_LIMIT_MAX_ATTEMPTS, settings.RATE_LIMIT_WINDOW_SECONDS, MemoryStore())
+    results["rate_limiter.is_allowed[distinct keys]"] = measure(lambda i: limiter.is_allowed(f"login_{i}"), iterations)
+    results["rate_limiter.is_allowed[one key]"] = measure(lambda i: limiter.is_allowed("login_hot"), iterations)
+
+    csrf = CSRFProtection(settings.CSRF_SECRET_KEY)
+    csrf_token = csrf.generate_token("bench-session")
+    results["csrf.generate_token"] = measure(lambda i: csrf.generate_token("bench-session"), iterations)
+    results["csrf.validate_token"] = measure(lambda i: csrf.validate_token(csrf_token, "bench-session"), iterations)
+
+    email, password = "user123@example.com", "Bench-Password-1!"
+    results["validators.is_valid_email"] = measure(lambda i: validators.is_valid_email(email), iterations)
+    results["validators.is_strong_password"] = measure(lambda i: validators.is_strong_password(password), iterations)
+    emails, passwords = [email] * 1000, [password] * 1000
+    results["validators.validate_emails[1000]"] = measure(lambda i: validators.validate_emails(emails), max(1, iterations // 100))
+    results["validators.check_passwords[1000]"] = measure(lambda i: validators.check_passwords(passwords), max(1, iterations // 100))
+
+    return results
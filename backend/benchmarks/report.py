@@ -0,0 +1,26 @@
+from typing import Dict, List
+
+
+def percentile(sorted_values:List[float], pct:float) -> float:
+    #nearest rank
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies:List[float], elapsed:float, errors:int=0) -> Dict:
+    """throughput and latency percentiles, latencies in seconds, reported in ms"""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_per_sec": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if count else 0.0,
+    }
@@ -12,23 +12,102 @@ CREATE TABLE IF NOT EXISTS users (
     password_hash VARCHAR(255) NOT NULL,
     is_verified BOOLEAN DEFAULT FALSE,
     is_active BOOLEAN DEFAULT TRUE,
+    -- no longer used, lockout state lives in login_lockouts, kept so the
+    -- previous release still runs on this schema, dropped in a later cleanup
     failed_login_attempts INTEGER DEFAULT 0,
     locked_until TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- failed login counters per "account:<id>" / "ip:<address>" key, unlogged (no WAL,
+-- emptied after a crash) and with room on each page for HOT updates,
+-- rows are dead once expires_at has passed
+CREATE UNLOGGED TABLE IF NOT EXISTS login_lockouts (
+    key VARCHAR(80) PRIMARY KEY,
+    failures INTEGER NOT NULL DEFAULT 0,
+    lockouts INTEGER NOT NULL DEFAULT 0,
+    locked_until TIMESTAMP NULL,
+    expires_at TIMESTAMP NOT NULL
+) WITH (fillfactor = 70);
+
+-- upgrade path: accounts the previous release has locked right now stay locked,
+-- their lock is copied over once, the users columns aren't read after this
+INSERT INTO login_lockouts (key, lockouts, locked_until, expires_at)
+SELECT 'account:' || id, 1, locked_until, locked_until + INTERVAL '1 hour'
+FROM users
+WHERE locked_until > (NOW() AT TIME ZONE 'UTC')
+ON CONFLICT (key) DO NOTHING;
+
+-- atomic increment-and-check for one key, returns the seconds it is now locked for:
+-- reaching p_threshold locks it for p_base seconds doubled per earlier lockout
+-- (at most p_max) and starts a new streak, state older than p_reset is forgotten
+CREATE OR REPLACE FUNCTION record_login_failure(
+    p_key VARCHAR,
+    p_threshold INTEGER,
+    p_base DOUBLE PRECISION,
+    p_max DOUBLE PRECISION,
+    p_reset DOUBLE PRECISION
+)
+RETURNS DOUBLE PRECISION AS $$
+DECLARE
+    now_utc TIMESTAMP := NOW() AT TIME ZONE 'UTC';
+    state login_lockouts%ROWTYPE;
+BEGIN
+    INSERT INTO login_lockouts (key, expires_at) VALUES (p_key, now_utc)
+    ON CONFLICT (key) DO NOTHING;
+    SELECT * INTO state FROM login_lockouts WHERE key = p_key FOR UPDATE;
+
+    IF state.expires_at <= now_utc THEN
+        state.failures := 0;
+        state.lockouts := 0;
+        state.locked_until := NULL;
+    END IF;
+
+    state.failures := state.failures + 1;
+    IF state.failures >= p_threshold THEN
+        state.locked_until := now_utc + make_interval(secs => LEAST(p_base * 2 ^ LEAST(state.lockouts, 32), p_max));
+        state.failures := 0;
+        state.lockouts := state.lockouts + 1;
+    END IF;
+    state.expires_at := GREATEST(state.locked_until, now_utc + make_interval(secs => p_reset));
+
+    UPDATE login_lockouts
+    SET failures = state.failures, lockouts = state.lockouts,
+        locked_until = state.locked_until, expires_at = state.expires_at
+    WHERE key = p_key;
+
+    RETURN GREATEST(EXTRACT(EPOCH FROM state.locked_until - now_utc), 0);
+END;
+$$ LANGUAGE plpgsql;
+
 -- sessions table (refresh tokens)
 CREATE TABLE IF NOT EXISTS sessions (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    -- lookup half of a selector.verifier refresh token, NULL for legacy bcrypt rows
+    refresh_token_selector VARCHAR(64) NULL,
+    -- HMAC-SHA256 of the verifier (bcrypt hash for legacy rows)
     refresh_token_hash VARCHAR(255) NOT NULL,
     device_info JSONB,
     expires_at TIMESTAMP NOT NULL,
     created_at TIMESTAMP DEFAULT NOW(),
-    last_used_at TIMESTAMP DEFAULT NOW()
+    last_used_at TIMESTAMP DEFAULT NOW(),
+    -- the verifier hash rotated out last, still accepted briefly after rotated_at
+    previous_token_hash VARCHAR(255) NULL,
+    rotated_at TIMESTAMP NULL
 );
 
+-- upgrade path for databases created before selector/verifier refresh tokens,
+-- existing rows keep their bcrypt hash and are re-keyed on first use
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS refresh_token_selector VARCHAR(64) NULL;
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS previous_token_hash VARCHAR(255) NULL;
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS rotated_at TIMESTAMP NULL;
+
+-- refresh token rotation rewrites the row on every refresh without touching an
+-- indexed column, free space on each page lets those be HOT updates
+ALTER TABLE sessions SET (fillfactor = 80);
+
 -- email verification tokens
 CREATE TABLE IF NOT EXISTS verification_tokens (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -40,25 +119,173 @@ CREATE TABLE IF NOT EXISTS verification_tokens (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
--- audit logs
-CREATE TABLE IF NOT EXISTS audit_logs (
+-- revoked access tokens, by jti or every token of a user issued before revoked_before,
+-- rows are only needed until the tokens they cover have expired
+CREATE TABLE IF NOT EXISTS token_revocations (
     id BIGSERIAL PRIMARY KEY,
+    jti VARCHAR(64) NULL,
+    user_id UUID NULL REFERENCES users(id) ON DELETE CASCADE,
+    -- sid claim of the access tokens minted from one refresh token family
+    session_id VARCHAR(64) NULL,
+    revoked_before TIMESTAMP NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    -- the inserting transaction, workers poll by it since ids don't commit in order
+    xact_id XID8 NOT NULL DEFAULT pg_current_xact_id()
+);
+
+ALTER TABLE token_revocations ADD COLUMN IF NOT EXISTS session_id VARCHAR(64) NULL;
+ALTER TABLE token_revocations ADD COLUMN IF NOT EXISTS xact_id XID8 NOT NULL DEFAULT pg_current_xact_id();
+
+-- audit logs, range partitioned by day on created_at so retention is a
+-- DROP of whole partitions and time range queries only scan the days they need
+
+-- upgrade path: an existing unpartitioned audit_logs is renamed and attached
+-- below as audit_logs_legacy, covering everything before the cutover day
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'audit_logs' AND relkind = 'r') THEN
+        ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+        ALTER SEQUENCE IF EXISTS audit_logs_id_seq RENAME TO audit_logs_legacy_id_seq;
+        ALTER INDEX IF EXISTS idx_audit_logs_user_id RENAME TO idx_audit_logs_legacy_user_id;
+        ALTER INDEX IF EXISTS idx_audit_logs_created_at RENAME TO idx_audit_logs_legacy_created_at;
+
+        UPDATE audit_logs_legacy SET created_at = NOW() WHERE created_at IS NULL;
+        ALTER TABLE audit_logs_legacy ALTER COLUMN created_at SET NOT NULL;
+        ALTER TABLE audit_logs_legacy DROP CONSTRAINT audit_logs_pkey;
+        ALTER TABLE audit_logs_legacy ADD CONSTRAINT audit_logs_legacy_pkey PRIMARY KEY (id, created_at);
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id BIGSERIAL,
     user_id UUID REFERENCES users(id),
     action VARCHAR(50) NOT NULL,
     ip_address VARCHAR(45),
     user_agent TEXT,
     status VARCHAR(20),
     metadata JSONB,
-    created_at TIMESTAMP DEFAULT NOW()
-);
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- catches rows outside every daily partition so inserts never fail
+CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT;
+
+DO $$
+DECLARE
+    cutover DATE;
+BEGIN
+    IF to_regclass('audit_logs_legacy') IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = 'audit_logs_legacy'::regclass) THEN
+
+        SELECT GREATEST((NOW() AT TIME ZONE 'UTC')::date + 1, COALESCE(MAX(created_at)::date + 1, '-infinity'))
+        INTO cutover FROM audit_logs_legacy;
+
+        EXECUTE format(
+            'ALTER TABLE audit_logs ATTACH PARTITION audit_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+            cutover
+        );
+        PERFORM setval('audit_logs_id_seq', (SELECT COALESCE(MAX(id), 0) + 1 FROM audit_logs_legacy), false);
+    END IF;
+END $$;
+
+-- create the daily partitions for today and the next days_ahead days,
+-- days already covered (e.g. by audit_logs_legacy) are skipped, rows that
+-- landed in audit_logs_default for a day are moved into its new partition
+CREATE OR REPLACE FUNCTION create_audit_log_partitions(days_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    day DATE;
+    partition_name TEXT;
+    moved BIGINT;
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..days_ahead LOOP
+        day := (NOW() AT TIME ZONE 'UTC')::date + i;
+        partition_name := 'audit_logs_p' || to_char(day, 'YYYYMMDD');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+
+        BEGIN
+            IF EXISTS (SELECT 1 FROM audit_logs_default WHERE created_at >= day AND created_at < day + 1) THEN
+                -- a partition can't be created over rows the default holds,
+                -- build it detached, move them in, then attach it
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                    partition_name
+                );
+                EXECUTE format(
+                    'WITH moving AS (DELETE FROM audit_logs_default WHERE created_at >= %L AND created_at < %L RETURNING *)
+                     INSERT INTO %I SELECT * FROM moving',
+                    day, day + 1, partition_name
+                );
+                GET DIAGNOSTICS moved = ROW_COUNT;
+                EXECUTE format(
+                    'ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, day, day + 1
+                );
+                RAISE NOTICE 'moved % rows from audit_logs_default into %', moved, partition_name;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, day, day + 1
+                );
+            END IF;
+            created := created + 1;
+        EXCEPTION
+            WHEN invalid_object_definition THEN
+                -- overlaps an existing partition
+                NULL;
+            WHEN check_violation THEN
+                -- a row for this day reached the default after the check, the next run moves it
+                RAISE NOTICE 'skipped %, audit_logs_default gained rows for it: %', partition_name, SQLERRM;
+        END;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- retention: drop whole daily partitions older than retention_days
+-- (audit_logs_legacy is left for a manual DROP once it is past retention)
+CREATE OR REPLACE FUNCTION drop_audit_log_partitions(retention_days INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    cutoff TEXT := 'audit_logs_p' || to_char((NOW() AT TIME ZONE 'UTC')::date - retention_days, 'YYYYMMDD');
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs'::regclass
+            AND c.relname ~ '^audit_logs_p[0-9]{8}$'
+            AND c.relname < cutoff
+    LOOP
+        EXECUTE format('DROP TABLE %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_audit_log_partitions(7);
 
 -- indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON audit_logs(created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_refresh_token_selector ON sessions(refresh_token_selector);
+-- legacy bcrypt rows are looked up by their user, see legacy_sessions
+DROP INDEX IF EXISTS idx_sessions_legacy_expires_at;
+CREATE INDEX IF NOT EXISTS idx_sessions_legacy_user_id ON sessions(user_id, created_at DESC)
+    WHERE refresh_token_selector IS NULL;
+CREATE INDEX IF NOT EXISTS idx_verification_tokens_expires_at ON verification_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_token_revocations_expires_at ON token_revocations(expires_at);
+CREATE INDEX IF NOT EXISTS idx_token_revocations_xact_id ON token_revocations(xact_id);
+-- created on every partition, serves paging one user's history by time
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id_created_at ON audit_logs(user_id, created_at DESC, id DESC);
 
 -- function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -70,6 +297,7 @@ END;
 $$ language 'plpgsql';
 
 -- trigger to auto-update updated_at
+DROP TRIGGER IF EXISTS update_users_updated_at ON users;
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
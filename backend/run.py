@@ -8,13 +8,19 @@ if __name__ == "__main__":
     ║   Environment: {settings.ENVOIRONMENT.ljust(24)} ║
     ║   Host: {settings.API_HOST.ljust(31)} ║
     ║   Port: {str(settings.API_PORT).ljust(31)} ║
+    ║   Workers: {str(settings.SERVER_WORKERS).ljust(28)} ║
     ╚════════════════════════════════════════╝
     """)
-    
-    uvicorn.run(
-        "app.main:app",
-        host=settings.API_HOST,
-        port=settings.API_PORT,
-        reload=True if settings.ENVI == "development" else False,
-        log_level="info"
-    )
\ No newline at end of file
+
+    if settings.SERVER_WORKERS > 1:
+        #one master imports and warms the app, workers are forked from it
+        from app.prefork import PreforkServer
+        PreforkServer(settings.API_HOST, settings.API_PORT, settings.SERVER_WORKERS).run()
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.API_HOST,
+            port=settings.API_PORT,
+            reload=True if settings.ENVOIRONMENT == "development" else False,
+            log_level="info"
+        )
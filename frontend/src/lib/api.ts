@@ -18,8 +18,25 @@ export interface TokenResponse {
   expires_in: number;
 }
 
+// double-submit CSRF token, set by the API once it authenticates with cookies
+function csrfHeaders(): Record<string, string> {
+  if (typeof document === 'undefined') {
+    return {};
+  }
+  const match = document.cookie.match(/(?:^|;\s*)csrf_token=([^;]*)/);
+  return match ? { 'X-CSRF-Token': decodeURIComponent(match[1]) } : {};
+}
+
+// the last access token, even expired, lets the API find sessions from before refresh token selectors
+function accessHeaders(): Record<string, string> {
+  const token = localStorage.getItem('access_token');
+  return token ? { 'Authorization': `Bearer ${token}` } : {};
+}
+
 class ApiClient {
   private baseUrl: string;
+  // one refresh at a time, concurrent 401s wait for it instead of replaying the same token
+  private refreshing: Promise<void> | null = null;
 
   constructor() {
     this.baseUrl = API_BASE_URL;
@@ -31,6 +48,7 @@ class ApiClient {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...csrfHeaders(),
       },
       body: JSON.stringify(data),
     });
@@ -49,6 +67,7 @@ class ApiClient {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...csrfHeaders(),
       },
       body: JSON.stringify(data),
     });
@@ -94,7 +113,16 @@ class ApiClient {
   }
 
   // Refresh access token
-  async refreshToken() {
+  refreshToken(): Promise<void> {
+    if (!this.refreshing) {
+      this.refreshing = this.doRefreshToken().finally(() => {
+        this.refreshing = null;
+      });
+    }
+    return this.refreshing;
+  }
+
+  private async doRefreshToken() {
     const refreshToken = localStorage.getItem('refresh_token');
     
     if (!refreshToken) {
@@ -105,6 +133,8 @@ class ApiClient {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...csrfHeaders(),
+        ...accessHeaders(),
       },
       body: JSON.stringify({ refresh_token: refreshToken }),
     });
@@ -115,8 +145,12 @@ class ApiClient {
       throw new Error('Session expired');
     }
 
-    const { access_token } = await response.json();
+    const { access_token, refresh_token } = await response.json();
     localStorage.setItem('access_token', access_token);
+    // refresh tokens rotate, the old one is now spent
+    if (refresh_token) {
+      localStorage.setItem('refresh_token', refresh_token);
+    }
   }
 
   // Logout
@@ -129,6 +163,8 @@ class ApiClient {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            ...csrfHeaders(),
+            ...accessHeaders(),
           },
           body: JSON.stringify({ refresh_token: refreshToken }),
         });
@@ -154,6 +190,7 @@ class ApiClient {
       ...options,
       headers: {
         ...options.headers,
+        ...(options.method && options.method !== 'GET' ? csrfHeaders() : {}),
         'Authorization': `Bearer ${token}`,
       },
     });